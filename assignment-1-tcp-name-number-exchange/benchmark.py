@@ -0,0 +1,81 @@
+import argparse
+import logging
+import multiprocessing
+import socket
+import time
+from client import ConnectionPool, PersistentConnection, encode_request, read_response
+from framing import FrameReader
+from server import AsyncServer, Server
+
+# NOTE:
+# Requests/sec of one client against a local server, for one connection per request,
+# one persistent connection with one request in flight, and pipelined requests:
+#   python benchmark.py --mode async --requests 20000 --depth 256
+
+def _serve(mode: str, port: int) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    if mode == 'async':
+        AsyncServer(name='server', server_number=42).run(port=port)
+    else:
+        Server(name='server', backlog=128, server_number=42).run(port=port)
+
+def _wait_for(port: int) -> None:
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on port {port} did not start.")
+
+def one_shot(port: int, requests: int) -> None:
+    request = encode_request('client', 7)
+    for _ in range(requests):
+        with socket.create_connection(('127.0.0.1', port)) as sock:
+            sock.sendall(request)
+            read_response(FrameReader(sock, size=256))
+
+def persistent(port: int, requests: int) -> None:
+    conn = PersistentConnection('127.0.0.1', port)
+    try:
+        for _ in range(requests):
+            conn.exchange('client', 7)
+    finally:
+        conn.close()
+
+def pipelined(port: int, requests: int, depth: int) -> None:
+    pool = ConnectionPool('127.0.0.1', port, size=1)
+    try:
+        responses = pool.pipeline((('client', 7) for _ in range(requests)), depth)
+        assert len(responses) == requests and responses[-1] == ('server', 42)
+    finally:
+        pool.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Requests/sec of the name/number protocol on loopback.")
+    parser.add_argument('--mode', choices=['thread', 'async'], default='async', help="server mode")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--depth', type=int, default=256, help="pipelined requests in flight")
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(target=_serve, args=(args.mode, args.port), daemon=True)
+    server.start()
+    try:
+        _wait_for(args.port)
+        cases = {
+            'one-shot': lambda: one_shot(args.port, args.requests),
+            'persistent': lambda: persistent(args.port, args.requests),
+            f'pipelined (depth {args.depth})': lambda: pipelined(args.port, args.requests, args.depth),
+        }
+        for name, run in cases.items():
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<22} {args.requests / elapsed:>10,.0f} requests/s")
+    finally:
+        server.terminate()
+        server.join()
+
+if __name__ == "__main__":
+    main()
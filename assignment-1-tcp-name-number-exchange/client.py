@@ -1,12 +1,17 @@
+import contextlib
+import queue
 import socket
-import struct
 import logging
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+from framing import HELLO, HELLO_FRAME, FrameReader, encode_hello, encode_message
 
 # NOTE: 
 # ENCODING/DECODING
 # ! => Means network (big-endian) byte order
 # H => unsigned short (2 bytes, 16-bit)
 # I => unsigned int (4 bytes, 32-bit)
+# See server.py for the HELLO negotiation of persistent connections.
 
 class Client:
     def __init__(self, name: str, 
@@ -29,11 +34,8 @@ class Client:
         self.sock.connect((self.server_host, self.server_port))
         logging.info("Connected to %s:%d", self.server_host, self.server_port)
 
-        # Send: name length + name + integer
-        name_bytes = self.name.encode("utf-8")
-        self.sock.sendall(struct.pack("!H", len(name_bytes)))
-        self.sock.sendall(name_bytes)
-        self.sock.sendall(struct.pack("!I", client_number))
+        # Send: name length + name + integer, in one write
+        self.sock.sendall(encode_message(self.name, client_number))
         logging.debug("ClientINFO -> name=%s, number=%d", self.name, client_number)
 
         # Stop locally if invalid number
@@ -44,13 +46,11 @@ class Client:
             raise ValueError("Invalid number. Exiting.")
 
         # Receive: name length + name + integer
-        raw_len = self.sock.recv(2)
-        if not raw_len:
+        message = FrameReader(self.sock).read_message()
+        if message is None:
             logging.warning("No data received, server may have closed connection.")
             return
-        name_len = struct.unpack("!H", raw_len)[0]
-        server_name = self.sock.recv(name_len).decode("utf-8")
-        server_number = struct.unpack("!I", self.sock.recv(4))[0]
+        server_name, server_number = str(message[0], "utf-8"), message[1]
         # Display
         total_sum = client_number + server_number
         logging.debug("ServerINFO <- name=%s, number=%d", server_name, server_number)
@@ -59,6 +59,180 @@ class Client:
         self.sock.close()
         logging.info("Connection closed.")
 
+def encode_request(name: str, number: int) -> bytes:
+    if not (1 <= number <= 100):
+        # NOTE: unlike Client.run, never send it: an invalid number shuts the server down
+        raise ValueError(f"Invalid number ({number}), expected an integer between 1 and 100.")
+    return encode_message(name, number)
+
+def read_response(reader: FrameReader) -> tuple[str, int]:
+    message = reader.read_message()
+    if message is None:
+        raise ConnectionError("Server closed the connection.")
+    return str(message[0], "utf-8"), message[1]
+
+T = TypeVar('T')
+
+class PersistentConnection:
+    """One connection carrying many exchanges, after the HELLO negotiation.
+
+    Raises ConnectionError if the server does not answer the HELLO within
+    `negotiation_timeout` seconds (an old one-shot server waits for a 65535 byte name).
+    """
+    def __init__(self, server_host: str, server_port: int, negotiation_timeout: float = 1.0) -> None:
+        self.sock = socket.create_connection((server_host, server_port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader(self.sock)
+        self.responses = 0 # read over the connection's lifetime
+        try:
+            self.sock.settimeout(negotiation_timeout)
+            self.sock.sendall(encode_hello())
+            reply = self.reader.read_exact(HELLO_FRAME.size)
+            if reply is None or HELLO_FRAME.unpack(reply)[0] != HELLO:
+                raise ConnectionError("Server does not support persistent connections.")
+            self.version = HELLO_FRAME.unpack(reply)[1]
+            self.sock.settimeout(None)
+        except (OSError, ConnectionError) as e:
+            self.close()
+            raise ConnectionError(f"Negotiation with {server_host}:{server_port} failed: {e}") from e
+
+    def exchange(self, name: str, number: int) -> tuple[str, int]:
+        """Send one request and wait for the server's (name, number)."""
+        self.sock.sendall(encode_request(name, number))
+        response = read_response(self.reader)
+        self.responses += 1
+        return response
+
+    def pipeline(self, requests: Iterable[tuple[str, int]], depth: int = 256) -> list[tuple[str, int]]:
+        """Send up to `depth` requests before reading their responses, in order.
+
+        Bounding the requests in flight keeps both sides' socket buffers from filling up,
+        where each would wait for the other to read.
+        """
+        responses: list[tuple[str, int]] = []
+        batch: list[bytes] = []
+        for name, number in requests:
+            batch.append(encode_request(name, number))
+            if len(batch) == depth:
+                self._send_batch(batch, responses)
+        if batch:
+            self._send_batch(batch, responses)
+        return responses
+
+    def _send_batch(self, batch: list[bytes], responses: list[tuple[str, int]]) -> None:
+        self.sock.sendall(b''.join(batch))
+        for _ in batch:
+            responses.append(read_response(self.reader))
+            self.responses += 1
+        batch.clear()
+
+    def close(self) -> None:
+        self.sock.close()
+
+class ConnectionPool:
+    """Reuses up to `size` persistent connections to one server, safe to share between threads.
+
+    If the server turns out not to support persistent connections, every exchange falls
+    back to a one-shot connection. A reused connection that fails before any byte of a
+    response arrives (the server closed it while it sat idle) is retried once on a new one.
+    """
+    def __init__(self, server_host: str, server_port: int, size: int = 4, negotiation_timeout: float = 1.0) -> None:
+        self.server_host = server_host
+        self.server_port = server_port
+        self.negotiation_timeout = negotiation_timeout
+        self.persistent: bool | None = None # unknown until the first connection
+        self._mode_lock = threading.Lock() # one thread at a time decides `persistent`
+        self._idle: queue.LifoQueue[PersistentConnection] = queue.LifoQueue()
+        self._slots = queue.Queue(size) # one token per connection that may be open
+        for _ in range(size):
+            self._slots.put(None)
+
+    @contextlib.contextmanager
+    def connection(self, fresh: bool = False) -> Iterator[PersistentConnection | None]:
+        """A connection for exclusive use, or None when the server only speaks one-shot.
+
+        `fresh` opens a new connection rather than reusing an idle one.
+        """
+        self._slots.get()
+        conn: PersistentConnection | None = None
+        try:
+            if self.persistent is not False:
+                try:
+                    if fresh:
+                        raise queue.Empty
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+            yield conn
+        except BaseException:
+            if conn is not None:
+                conn.close() # its stream may be mid-exchange
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.put(None)
+
+    def _open(self) -> PersistentConnection | None:
+        """A new connection, None once the server turned out to speak only one-shot."""
+        if self.persistent is None:
+            with self._mode_lock:
+                if self.persistent is None: # the first connection decides for every thread
+                    try:
+                        conn = PersistentConnection(self.server_host, self.server_port, self.negotiation_timeout)
+                    except ConnectionError as e:
+                        logging.warning("%s, falling back to one-shot connections.", e)
+                        self.persistent = False
+                        return None
+                    self.persistent = True
+                    return conn
+        if not self.persistent:
+            return None
+        return PersistentConnection(self.server_host, self.server_port, self.negotiation_timeout)
+
+    def _retrying(self, use: Callable[[PersistentConnection | None], T]) -> T:
+        """`use` a connection, and a new one if a reused connection failed before any response byte."""
+        conn: PersistentConnection | None = None
+        served = 0
+        try:
+            with self.connection() as conn:
+                served = conn.responses if conn is not None else 0
+                return use(conn)
+        except ConnectionError:
+            if conn is None or not served or conn.responses != served or conn.reader.buffered:
+                raise # a new connection, or the server had started answering
+            logging.info("Idle connection to %s:%d was closed, retrying on a new one.", self.server_host, self.server_port)
+        with self.connection(fresh=True) as conn:
+            return use(conn)
+
+    def exchange(self, name: str, number: int) -> tuple[str, int]:
+        def use(conn: PersistentConnection | None) -> tuple[str, int]:
+            if conn is not None:
+                return conn.exchange(name, number)
+            return self._one_shot(encode_request(name, number))
+        return self._retrying(use)
+
+    def pipeline(self, requests: Iterable[tuple[str, int]], depth: int = 256) -> list[tuple[str, int]]:
+        requests = list(requests) # a retry sends them again
+        def use(conn: PersistentConnection | None) -> list[tuple[str, int]]:
+            if conn is not None:
+                return conn.pipeline(requests, depth)
+            return [self._one_shot(encode_request(name, number)) for name, number in requests]
+        return self._retrying(use)
+
+    def _one_shot(self, request: bytes) -> tuple[str, int]:
+        with socket.create_connection((self.server_host, self.server_port)) as sock:
+            sock.sendall(request)
+            return read_response(FrameReader(sock, size=256))
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
 def main() -> None:
     client = Client(name='client', 
                     server_host='127.0.0.1', 
@@ -0,0 +1,145 @@
+import socket
+import struct
+
+# NOTE:
+# Framing shared by client.py and server.py. A message (request or response) is
+#   "!H" name length + UTF-8 name + "!I" number
+# and goes out as one write. A persistent connection opens with HELLO in place of the
+# name length and "!H" a protocol version (see server.py).
+# FrameReader reads with recv_into into one reusable buffer and parses frames in place,
+# so a frame split over any number of TCP segments, or many frames in one segment, is
+# read correctly with no copy until the name is decoded.
+
+HELLO = 0xFFFF
+PROTOCOL_VERSION = 1
+U16 = struct.Struct("!H")
+U32 = struct.Struct("!I")
+HELLO_FRAME = struct.Struct("!HH")
+
+def encode_message(name: str | bytes, number: int) -> bytes:
+    name_bytes = name.encode("utf-8") if isinstance(name, str) else name
+    if len(name_bytes) >= HELLO:
+        raise ValueError(f"Name too long ({len(name_bytes)} bytes).")
+    return U16.pack(len(name_bytes)) + name_bytes + U32.pack(number)
+
+def encode_hello(version: int = PROTOCOL_VERSION) -> bytes:
+    return HELLO_FRAME.pack(HELLO, version)
+
+class FrameReader:
+    """Reads frames from a blocking socket through one reusable buffer.
+
+    Views returned by the read methods point into the buffer and are only valid until
+    the next read. Bytes after the current frame stay buffered, so pipelined frames
+    cost no extra recv.
+    """
+    def __init__(self, sock: socket.socket, size: int = 64 * 1024) -> None:
+        self.sock = sock
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0 # first unread byte
+        self._end = 0 # end of the received bytes
+
+    @property
+    def buffered(self) -> int:
+        return self._end - self._start
+
+    def _fill(self, needed: int) -> bool:
+        """Buffer at least `needed` unread bytes; False if the peer closed first."""
+        if self._end - self._start >= needed:
+            return True
+        if self._start + needed > len(self._buffer):
+            unread = self._end - self._start
+            if needed > len(self._buffer):
+                buffer = bytearray(max(needed, 2 * len(self._buffer)))
+                buffer[:unread] = self._view[self._start:self._end]
+                self._buffer, self._view = buffer, memoryview(buffer)
+            else:
+                self._buffer[:unread] = self._view[self._start:self._end] # compact to the front
+            self._start, self._end = 0, unread
+        while self._end - self._start < needed:
+            received = self.sock.recv_into(self._view[self._end:])
+            if received == 0:
+                return False
+            self._end += received
+        return True
+
+    def _take(self, size: int) -> memoryview:
+        start = self._start
+        self._start += size
+        if self._start == self._end:
+            self._start = self._end = 0
+        return self._view[start:start + size]
+
+    def read_exact(self, size: int) -> memoryview | None:
+        """The next `size` bytes, None if the peer closed before sending any of them."""
+        if not self._fill(size):
+            if self._end == self._start:
+                return None
+            raise ConnectionError(f"Peer closed the connection mid-frame ({self.buffered} of {size} bytes).")
+        return self._take(size)
+
+    def read_u16(self) -> int | None:
+        data = self.read_exact(2)
+        return None if data is None else U16.unpack(data)[0]
+
+    def read_body(self, name_len: int) -> tuple[memoryview, int]:
+        """The name and number following a name length."""
+        data = self.read_exact(name_len + 4)
+        if data is None:
+            raise ConnectionError("Peer closed the connection mid-frame.")
+        return data[:name_len], U32.unpack_from(data, name_len)[0]
+
+    def read_message(self) -> tuple[memoryview, int] | None:
+        """The next (name, number) message, None if the peer closed between messages."""
+        name_len = self.read_u16()
+        if name_len is None:
+            return None
+        if name_len == HELLO:
+            raise ConnectionError("Unexpected HELLO in the middle of a connection.")
+        return self.read_body(name_len)
+
+    def has_message(self) -> bool:
+        """Whether a whole message is already buffered, so reading it will not block."""
+        if self._end - self._start < 2:
+            return False
+        return self._end - self._start >= 2 + U16.unpack_from(self._buffer, self._start)[0] + 4
+
+if __name__ == "__main__":
+    import threading
+    import unittest
+
+    class TestFrameReader(unittest.TestCase):
+        def test_byte_by_byte_and_coalesced(self):
+            left, right = socket.socketpair()
+            messages = [("alice", 7), ("", 1), ("ß" * 30_000, 100), ("bob", 2)]
+            stream = b''.join(encode_message(name, number) for name, number in messages)
+
+            def write() -> None:
+                for i in range(60): # one byte at a time
+                    left.send(stream[i:i + 1])
+                left.sendall(stream[60:]) # the rest in whatever segments TCP makes
+                left.close()
+            writer = threading.Thread(target=write)
+            writer.start()
+            reader = FrameReader(right, size=16) # forces compaction and growth
+            received = []
+            while (message := reader.read_message()) is not None:
+                received.append((str(message[0], "utf-8"), message[1]))
+            writer.join()
+            right.close()
+            self.assertEqual(received, messages)
+
+        def test_has_message_and_truncation(self):
+            left, right = socket.socketpair()
+            left.sendall(encode_message("a", 1) * 2 + encode_message("b", 2)[:3])
+            left.close()
+            reader = FrameReader(right)
+            self.assertEqual(bytes(reader.read_message()[0]), b"a")
+            self.assertTrue(reader.has_message())
+            reader.read_message()
+            self.assertFalse(reader.has_message())
+            with self.assertRaises(ConnectionError):
+                reader.read_message()
+            right.close()
+
+    unittest.main()
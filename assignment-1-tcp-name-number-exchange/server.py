@@ -1,13 +1,24 @@
+import asyncio
 import socket
-import struct
 import threading
 import logging
+from framing import HELLO, HELLO_FRAME, PROTOCOL_VERSION, U16, U32, FrameReader, encode_message
 
 # NOTE: 
 # ENCODING/DECODING
 # ! => Means network (big-endian) byte order
 # H => unsigned short (2 bytes, 16-bit)
 # I => unsigned int (4 bytes, 32-bit)
+#
+# PERSISTENT CONNECTIONS
+# A client that opens with HELLO in place of the name length, followed by "!H" its protocol
+# version, gets back HELLO and "!H" the version both sides speak. After that the connection
+# carries any number of requests, each framed exactly like the one-shot request, and the
+# server answers them in order, so a client can pipeline many requests before reading.
+# A one-shot client never sends HELLO (a 65535 byte name) and is served as before.
+# Both server modes close a persistent connection on a HELLO after the first one or a
+# name that is not UTF-8, after answering the requests before it.
+# framing.py holds the encoding and the buffered reader both sides use.
 
 def get_local_ip() -> str:
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -18,29 +29,49 @@ def get_local_ip() -> str:
     finally:
         s.close()
         
+def read_server_number(server_number: int | None = None) -> int:
+    if server_number is None:
+        server_number = int(input("Enter an integer between 1 and 100: "))
+    if not (1 <= server_number <= 100):
+        logging.error("Invalid number. Exiting.")
+        raise ValueError("[SERVER] Invalid number. Exiting.")
+    return server_number
+
+def raise_open_file_limit() -> int:
+    """Lift the soft limit on open files to the hard limit (every client is one fd)."""
+    try:
+        import resource # Unix only
+    except ImportError:
+        return -1
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
 class Server:
-    def __init__(self, name: str, backlog: int = 5) -> None:
+    def __init__(self, name: str, backlog: int = 5, server_number: int | None = None) -> None:
         self.sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # restart while old connections linger, as asyncio does
         self.backlog = backlog
         self.name = name
         self.running = True
-        self.server_number = int(input("Enter an integer between 1 and 100: "))
-        if not (1 <= self.server_number <= 100):
-            logging.error("Invalid number. Exiting.")
-            raise ValueError("[SERVER] Invalid number. Exiting.")
+        self.server_number = read_server_number(server_number)
         logging.info("Initialized with name=%s, number=%d, backlog=%d",
                      self.name, self.server_number, self.backlog)
     def client_handler(self, client: socket.socket, addr: tuple[str, int]):
         logging.info("Handling new client from %s", addr)
+        reader = FrameReader(client)
         try:
             # Receive: name length + name + integer
-            raw_len = client.recv(2)
-            if not raw_len:
+            name_len = reader.read_u16()
+            if name_len is None:
                 logging.warning("No data from %s, closing connection.", addr)
                 return
-            name_len = struct.unpack("!H", raw_len)[0]
-            client_name = client.recv(name_len).decode("utf-8") 
-            client_number = struct.unpack("!I", client.recv(4))[0]
+            if name_len == HELLO:
+                self.persistent_handler(client, addr, reader)
+                return
+            raw_name, client_number = reader.read_body(name_len)
+            client_name = str(raw_name, "utf-8")
             logging.info("Connected with %s", addr)
             logging.debug("ClientINFO <- name=%s, number=%d", client_name, client_number)
              
@@ -55,18 +86,55 @@ class Server:
             logging.debug("ServerINFO -> name=%s, number=%d", self.name, self.server_number)
             logging.info("Sum with client %s: %d", addr, total_sum)
             
-            # Send: name length + name + integer
-            name_bytes = self.name.encode("utf-8")
-            client.sendall(struct.pack("!H", len(name_bytes)))
-            client.sendall(name_bytes)
-            client.sendall(struct.pack("!I", self.server_number))
+            # Send: name length + name + integer, in one write
+            client.sendall(encode_message(self.name, self.server_number))
             
             logging.info("Sent response to %s -> name=%s, number=%d",
                          addr, self.name, self.server_number)
 
+        except UnicodeDecodeError:
+            logging.warning("Name from %s is not UTF-8, closing connection.", addr)
+        except ConnectionError as e:
+            logging.warning("Connection with %s failed: %s", addr, e)
         finally:
             client.close()
             logging.info("Closed connection with %s", addr)
+
+    def persistent_handler(self, client: socket.socket, addr: tuple[str, int], reader: FrameReader) -> None:
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # pipelined replies must not wait for ACKs
+        version = reader.read_u16()
+        if version is None:
+            logging.warning("Incomplete HELLO from %s, closing connection.", addr)
+            return
+        version = min(version, PROTOCOL_VERSION)
+        client.sendall(HELLO_FRAME.pack(HELLO, version))
+        logging.info("Persistent connection with %s, version %d", addr, version)
+
+        response = encode_message(self.name, self.server_number)
+        pending = 0 # replies owed for the requests read so far
+        exchanges = 0
+        try:
+            while self.running:
+                message = reader.read_message() # raises ConnectionError on another HELLO
+                if message is None:
+                    break # the client closed between requests
+                str(message[0], "utf-8") # raises UnicodeDecodeError, handled as for a one-shot request
+                if not (1 <= message[1] <= 100):
+                    logging.error("Invalid number received from %s. Closing server.", addr)
+                    self.running = False
+                    self.sock.close()
+                    break
+                pending += 1
+                if not reader.has_message():
+                    # answer a pipelined batch in one write, before blocking on the next read
+                    client.sendall(response * pending)
+                    exchanges += pending
+                    pending = 0
+        finally:
+            if pending: # the requests before a rejected frame are still answered
+                client.sendall(response * pending)
+                exchanges += pending
+            logging.info("Served %d exchanges to %s", exchanges, addr)
         
     def run(self, host: str = '127.0.0.1', port: int = 8080):
         self.sock.bind((host, port))
@@ -105,14 +173,308 @@ class Server:
         
         self.sock.close()
         logging.info("Socket closed, server shutdown complete.")
-        
+
+class AsyncServer:
+    """The same protocol as Server, with every client a coroutine on one asyncio event loop.
+
+    Accepting costs O(1) and an idle client costs a few KB instead of a thread, so one
+    thread serves tens of thousands of concurrent clients. stop() (or an invalid number
+    from a client) closes the listening socket, then waits up to `shutdown_timeout`
+    seconds for the clients in progress before cancelling them.
+    """
+    def __init__(self, name: str, backlog: int = 4096, server_number: int | None = None,
+                 shutdown_timeout: float = 5.0) -> None:
+        self.backlog = backlog
+        self.name = name
+        self.server_number = read_server_number(server_number)
+        self.shutdown_timeout = shutdown_timeout
+        self.response = encode_message(self.name, self.server_number)
+        self.clients: set[asyncio.Task] = set()
+        self.idle: set[asyncio.Task] = set() # persistent clients waiting between requests
+        self.served = 0
+        self._stopping: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        logging.info("Initialized with name=%s, number=%d, backlog=%d",
+                     self.name, self.server_number, self.backlog)
+
+    async def client_handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self.clients.add(task)
+        addr = writer.get_extra_info('peername')
+        logging.debug("Handling new client from %s", addr)
+        try:
+            # Receive: name length + name + integer
+            name_len = U16.unpack(await reader.readexactly(2))[0]
+            if name_len == HELLO:
+                await self.persistent_handler(reader, writer, addr)
+                return
+            client_name = (await reader.readexactly(name_len)).decode("utf-8")
+            client_number = U32.unpack(await reader.readexactly(4))[0]
+            logging.debug("ClientINFO <- name=%s, number=%d", client_name, client_number)
+
+            if not (1 <= client_number <= 100):
+                logging.error("Invalid number received from %s. Closing server.", addr)
+                self.stop()
+                return
+
+            logging.debug("Sum with client %s: %d", addr, client_number + self.server_number)
+            # Send: name length + name + integer, in one write
+            writer.write(self.response)
+            await writer.drain()
+            self.served += 1
+        except asyncio.IncompleteReadError:
+            logging.warning("Incomplete request from %s, closing connection.", addr)
+        except UnicodeDecodeError:
+            logging.warning("Name from %s is not UTF-8, closing connection.", addr)
+        except ConnectionError as e:
+            logging.warning("Connection with %s failed: %s", addr, e)
+        finally:
+            writer.close()
+            self.clients.discard(task)
+            logging.debug("Closed connection with %s", addr)
+
+    async def persistent_handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 addr: tuple[str, int]) -> None:
+        task = asyncio.current_task()
+        version = min(U16.unpack(await reader.readexactly(2))[0], PROTOCOL_VERSION)
+        writer.write(HELLO_FRAME.pack(HELLO, version))
+        logging.debug("Persistent connection with %s, version %d", addr, version)
+        while not self._stopping.is_set():
+            self.idle.add(task)
+            try:
+                raw_len = await reader.readexactly(2)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise
+                return # the client closed between requests
+            finally:
+                self.idle.discard(task)
+            name_len = U16.unpack(raw_len)[0]
+            if name_len == HELLO:
+                raise ConnectionError("Unexpected HELLO in the middle of a connection.")
+            body = await reader.readexactly(name_len + 4)
+            str(body[:name_len], "utf-8") # raises UnicodeDecodeError, handled as for a one-shot request
+            client_number = U32.unpack_from(body, name_len)[0]
+            if not (1 <= client_number <= 100):
+                logging.error("Invalid number received from %s. Closing server.", addr)
+                self.stop()
+                return
+            writer.write(self.response)
+            self.served += 1
+            await writer.drain()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self.client_handler, host, port, backlog=self.backlog)
+        logging.info("Listening on %s:%d.", host, port)
+        if host == '0.0.0.0':
+            logging.info("Listening on %s:%d.", get_local_ip(), port)
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close() # stop accepting, the clients in progress keep their sockets
+            for task in self.idle:
+                task.cancel() # a persistent client between requests has nothing in progress
+            if self.clients:
+                logging.info("Waiting for %d active clients to finish...", len(self.clients))
+                _, pending = await asyncio.wait(set(self.clients), timeout=self.shutdown_timeout)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            await server.wait_closed()
+            logging.info("Socket closed, server shutdown complete (%d clients served).", self.served)
+
+    def stop(self) -> None:
+        """Begin a graceful shutdown; safe to call from any thread."""
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def run(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        raise_open_file_limit()
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            logging.info("Interrupted, server stopped.")
+
 def main() -> None:
-    server = Server(name='server', backlog=5)
-    server.run(host='0.0.0.0', port=8080)
+    import argparse
+    parser = argparse.ArgumentParser(description="Name/number exchange server.")
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help="a thread per client, or every client on one asyncio event loop")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    if args.mode == 'async':
+        AsyncServer(name='server').run(host=args.host, port=args.port)
+    else:
+        server = Server(name='server', backlog=5)
+        server.run(host=args.host, port=args.port)
 
 if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-    )
-    main()
\ No newline at end of file
+    import sys
+    if sys.argv[1:2] != ['test']: # `python server.py test` runs the tests below
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format="%(asctime)s [%(levelname)s] %(message)s",
+        )
+        main()
+        sys.exit()
+
+    import contextlib
+    import multiprocessing
+    import unittest
+    from benchmark import _serve, _wait_for
+    from client import ConnectionPool, PersistentConnection
+    from framing import encode_hello
+
+    MODES = ('thread', 'async')
+
+    def free_port() -> int:
+        with socket.create_server(('127.0.0.1', 0)) as sock:
+            return sock.getsockname()[1]
+
+    @contextlib.contextmanager
+    def serving(mode: str, port: int):
+        """A server named 'server' with number 42 in its own process, killed on exit."""
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        process = multiprocessing.get_context(start_method).Process(target=_serve, args=(mode, port), daemon=True)
+        process.start()
+        try:
+            _wait_for(port)
+            yield process
+        finally:
+            process.terminate()
+            process.join()
+
+    def read_until_closed(sock: socket.socket) -> bytes:
+        sock.settimeout(5)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    class TestPersistentConnections(unittest.TestCase):
+        def test_negotiation_and_pipeline(self):
+            for mode in MODES:
+                with self.subTest(mode=mode), serving(mode, port := free_port()):
+                    conn = PersistentConnection('127.0.0.1', port)
+                    self.assertEqual(conn.version, PROTOCOL_VERSION)
+                    self.assertEqual(conn.exchange('client', 7), ('server', 42))
+                    self.assertEqual(conn.pipeline((('client', i % 100 + 1) for i in range(2_000)), depth=64), [('server', 42)] * 2_000)
+                    conn.close()
+                    pool = ConnectionPool('127.0.0.1', port, size=2)
+                    results: list[tuple[str, int]] = []
+                    threads = [
+                        threading.Thread(target=lambda: results.extend(pool.exchange('client', 7) for _ in range(50)))
+                        for _ in range(4)
+                    ]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    pool.close()
+                    self.assertEqual(results, [('server', 42)] * 200)
+                    self.assertTrue(pool.persistent)
+
+        def test_bad_frames_close_the_connection(self):
+            request, response = encode_message('client', 7), encode_message('server', 42)
+            for mode in MODES:
+                with serving(mode, port := free_port()):
+                    for bad_frame in (encode_hello(), encode_message(b'\xff\xfe', 7)):
+                        with self.subTest(mode=mode, frame=bad_frame), socket.create_connection(('127.0.0.1', port)) as sock:
+                            sock.sendall(encode_hello() + request * 2 + bad_frame + request)
+                            # the requests before the bad frame are answered, the one after is not
+                            self.assertEqual(read_until_closed(sock), HELLO_FRAME.pack(HELLO, PROTOCOL_VERSION) + response * 2)
+                    with socket.create_connection(('127.0.0.1', port)) as sock: # still serving
+                        sock.sendall(request)
+                        self.assertEqual(read_until_closed(sock), response)
+
+        def test_stale_pooled_connection_is_retried(self):
+            for mode in MODES:
+                with self.subTest(mode=mode):
+                    port = free_port()
+                    pool = ConnectionPool('127.0.0.1', port, size=1)
+                    with serving(mode, port):
+                        self.assertEqual(pool.exchange('client', 7), ('server', 42))
+                    with serving(mode, port): # a restarted server, the pooled connection was closed
+                        self.assertEqual(pool.exchange('client', 7), ('server', 42))
+                        self.assertEqual(pool.pipeline([('client', 7)] * 10), [('server', 42)] * 10)
+                    with serving(mode, port):
+                        self.assertEqual(pool.pipeline([('client', 7)] * 10), [('server', 42)] * 10)
+                    pool.close()
+
+        def test_fallback_to_one_shot(self):
+            # a server from before HELLO: it takes HELLO for a 65535 byte name and never answers
+            legacy = socket.create_server(('127.0.0.1', 0))
+            def answer(client: socket.socket) -> None:
+                with client:
+                    reader = FrameReader(client)
+                    name_len = reader.read_u16()
+                    if name_len == HELLO:
+                        read_until_closed(client) # waits for the rest of the "name"
+                        return
+                    reader.read_body(name_len)
+                    client.sendall(encode_message('legacy', 1))
+            def accept() -> None:
+                while True:
+                    try:
+                        client, _ = legacy.accept()
+                    except OSError:
+                        return
+                    threading.Thread(target=answer, args=(client,), daemon=True).start()
+            threading.Thread(target=accept, daemon=True).start()
+            pool = ConnectionPool('127.0.0.1', legacy.getsockname()[1], size=4, negotiation_timeout=0.2)
+            results: list[tuple[str, int]] = []
+            threads = [threading.Thread(target=lambda: results.append(pool.exchange('client', 7))) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results, [('legacy', 1)] * 8)
+            self.assertIs(pool.persistent, False)
+            self.assertEqual(pool.pipeline([('client', 7)] * 3), [('legacy', 1)] * 3)
+            legacy.close()
+
+    class TestAsyncServerShutdown(unittest.TestCase):
+        def test_stop_answers_clients_in_progress(self):
+            raise_open_file_limit()
+            port = free_port()
+            server = AsyncServer(name='server', server_number=42, shutdown_timeout=2.0)
+            thread = threading.Thread(target=server.run, kwargs={'port': port})
+            thread.start()
+            _wait_for(port)
+            request, response = encode_message('client', 7), encode_message('server', 42)
+            in_progress = [socket.create_connection(('127.0.0.1', port)) for _ in range(400)]
+            for sock in in_progress:
+                sock.sendall(request[:3]) # the name length and part of the name
+            idle = [PersistentConnection('127.0.0.1', port) for _ in range(100)]
+            for conn in idle:
+                conn.exchange('client', 7)
+            stuck = socket.create_connection(('127.0.0.1', port))
+            stuck.sendall(request[:3]) # never completes, cancelled after shutdown_timeout
+            for _ in range(500):
+                if len(server.clients) == 501:
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(len(server.clients), 501)
+
+            server.stop()
+            for sock in in_progress:
+                sock.sendall(request[3:])
+            for sock in in_progress:
+                self.assertEqual(read_until_closed(sock), response)
+                sock.close()
+            for conn in idle: # closed between requests
+                self.assertEqual(read_until_closed(conn.sock), b'')
+                conn.close()
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(read_until_closed(stuck), b'')
+            stuck.close()
+            self.assertEqual(server.served, 400 + 100)
+            with self.assertRaises(ConnectionRefusedError):
+                socket.create_connection(('127.0.0.1', port))
+
+    logging.basicConfig(level=logging.CRITICAL)
+    unittest.main(argv=sys.argv[:1] + sys.argv[2:])
\ No newline at end of file
@@ -0,0 +1,145 @@
+from typing import Callable, NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import itertools
+import os
+import statistics
+import sys
+import time
+import numpy as np
+from discrete_event import ArqStats
+from stop_and_wait import stop_and_wait_simulation
+from go_back_n import go_back_n_simulation
+from selective_repeat import selective_repeat_simulation
+
+# NOTE:
+# Monte Carlo sweep of the ARQ protocols over window size x loss probability x RTT,
+# with `--seeds` independent runs per configuration spread over a process pool:
+#   python arq_sweep.py --windows 1 4 16 64 --loss 0 0.01 0.05 0.1 0.2 --rtt 0.01 0.1 --seeds 20 --output sweep.csv
+# Each run is silent (verbose=False); the table holds the mean and standard deviation
+# over seeds. Stop-and-Wait has no window, it is run once per (loss, RTT) as window 1.
+
+PROTOCOLS: dict[str, Callable[..., ArqStats]] = {
+    'stop_and_wait': lambda frames, window_size, loss_prob, **kwargs: stop_and_wait_simulation(frames, loss_prob, **kwargs),
+    'go_back_n': go_back_n_simulation,
+    'selective_repeat': selective_repeat_simulation,
+}
+
+class SweepPoint(NamedTuple):
+    protocol: str
+    window_size: int
+    loss_prob: float
+    rtt: float
+
+class SweepResult(NamedTuple):
+    point: SweepPoint
+    efficiency_mean: float
+    efficiency_std: float
+    goodput_mean: float # bits/s
+    goodput_std: float
+    retransmission_ratio: float # retransmissions per delivered frame, mean over seeds
+    runs: int
+
+def run_point(point: SweepPoint, seeds: range, frames: int, bandwidth: float, frame_size: int) -> list[ArqStats]:
+    simulate = PROTOCOLS[point.protocol]
+    return [
+        simulate(
+            frames, point.window_size, point.loss_prob, delay=point.rtt / 2, bandwidth=bandwidth,
+            frame_size=frame_size, seed=seed, verbose=False
+        )
+        for seed in seeds
+    ]
+
+def sweep_points(protocols: list[str], windows: list[int], loss_probs: list[float], rtts: list[float]) -> list[SweepPoint]:
+    return [
+        SweepPoint(protocol, window_size, loss_prob, rtt)
+        for protocol in protocols
+        for window_size in ([1] if protocol == 'stop_and_wait' else windows)
+        for loss_prob, rtt in itertools.product(loss_probs, rtts)
+    ]
+
+def sweep(points: list[SweepPoint], seeds: int = 10, frames: int = 1_000, bandwidth: float = 1e6,
+          frame_size: int = 1000, workers: int | None = None) -> list[SweepResult]:
+    """Run every point with seeds 0..`seeds`-1 on `workers` processes (default: one per CPU)."""
+    seeds_range = range(seeds)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # one task per point keeps the pickling overhead small next to `seeds` runs
+        runs = executor.map(
+            run_point, points, itertools.repeat(seeds_range), itertools.repeat(frames),
+            itertools.repeat(bandwidth), itertools.repeat(frame_size), chunksize=max(1, len(points) // (4 * (workers or os.cpu_count() or 1)))
+        )
+        results: list[SweepResult] = []
+        for point, stats in zip(points, runs):
+            efficiency = [run.efficiency for run in stats]
+            goodput = [run.goodput for run in stats]
+            results.append(SweepResult(
+                point=point,
+                efficiency_mean=statistics.fmean(efficiency),
+                efficiency_std=statistics.pstdev(efficiency),
+                goodput_mean=statistics.fmean(goodput),
+                goodput_std=statistics.pstdev(goodput),
+                retransmission_ratio=statistics.fmean(run.retransmission_ratio for run in stats),
+                runs=len(stats),
+            ))
+    return results
+
+def to_arrays(results: list[SweepResult], protocol: str, windows: list[int], loss_probs: list[float],
+              rtts: list[float]) -> dict[str, np.ndarray]:
+    """Per protocol tables shaped (windows, loss probabilities, RTTs), NaN where not run."""
+    arrays = {field: np.full((len(windows), len(loss_probs), len(rtts)), np.nan) for field in SweepResult._fields[1:]}
+    for result in results:
+        point = result.point
+        if point.protocol != protocol or point.window_size not in windows:
+            continue
+        index = (windows.index(point.window_size), loss_probs.index(point.loss_prob), rtts.index(point.rtt))
+        for field in arrays:
+            arrays[field][index] = getattr(result, field)
+    return arrays
+
+def write_csv(results: list[SweepResult], file) -> None:
+    writer = csv.writer(file)
+    writer.writerow([*SweepPoint._fields, *SweepResult._fields[1:]])
+    for result in results:
+        writer.writerow([*result.point, *result[1:]])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep ARQ protocols over window size, loss probability and RTT.")
+    parser.add_argument('--protocols', nargs='+', choices=list(PROTOCOLS), default=list(PROTOCOLS))
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.01, 0.05, 0.1, 0.2])
+    parser.add_argument('--rtt', type=float, nargs='+', default=[0.01, 0.1], help="round trip propagation delay in seconds")
+    parser.add_argument('--seeds', type=int, default=10, help="runs per configuration")
+    parser.add_argument('--frames', type=int, default=1_000, help="frames per run")
+    parser.add_argument('--bandwidth', type=float, default=1e6, help="bits per second")
+    parser.add_argument('--frame-size', type=int, default=1000, help="bytes")
+    parser.add_argument('--workers', type=int, default=None, help="processes, default one per CPU")
+    parser.add_argument('--output', default=None, help="write the table as CSV to this path ('-' for stdout)")
+    args = parser.parse_args()
+    if not all(0 <= loss_prob < 1 for loss_prob in args.loss):
+        parser.error(f"loss probabilities must be in [0, 1), a run at 1 never finishes: {args.loss}.")
+    if min(args.windows) < 1 or min(args.rtt) < 0 or args.seeds < 1 or args.frames < 0 or args.bandwidth <= 0 or args.frame_size < 1:
+        parser.error("windows, seeds, bandwidth and frame size must be positive, RTTs and frames not negative.")
+
+    points = sweep_points(args.protocols, args.windows, args.loss, args.rtt)
+    start = time.perf_counter()
+    results = sweep(points, args.seeds, args.frames, args.bandwidth, args.frame_size, args.workers)
+    elapsed = time.perf_counter() - start
+    if args.output == '-':
+        write_csv(results, sys.stdout)
+        return
+    if args.output:
+        with open(args.output, 'w', newline='') as file:
+            write_csv(results, file)
+    print(f"{'protocol':<17} {'window':>6} {'loss':>6} {'rtt':>6} {'efficiency':>16} {'goodput':>12} {'retx/frame':>10}")
+    for result in results:
+        point = result.point
+        print(
+            f"{point.protocol:<17} {point.window_size:>6} {point.loss_prob:>6.3f} {point.rtt:>6.3f} "
+            f"{result.efficiency_mean:>8.1%} ±{result.efficiency_std:>6.1%} {result.goodput_mean / 1e3:>8.1f}kb/s "
+            f"{result.retransmission_ratio:>10.2f}"
+        )
+    print(f"{len(points) * args.seeds} runs of {args.frames} frames in {elapsed:.1f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
-import matplotlib.pyplot as plt
-
-def tcp_congestion_control_simulation(total_rounds_count: int, initial_ssthresh: int, loss_events: list[int]):
-    print("--- TCP Congestion Control Simulation ---")
+def tcp_congestion_control_simulation(total_rounds_count: int, initial_ssthresh: int, loss_events: list[int],
+                                      verbose: bool = True) -> list[int]:
+    """Returns cwnd at the start of every round; plot it with congestion_plot.plot_cwnd."""
+    log = print if verbose else None
+    if log:
+        log("--- TCP Congestion Control Simulation ---")
     
     cwnd = 1  # Congestion window starts at 1 MSS
     ssthresh = initial_ssthresh
@@ -11,46 +13,31 @@ def tcp_congestion_control_simulation(total_rounds_count: int, initial_ssthresh:
     for round_num in range(total_rounds_count):
         cwnd_history.append(cwnd)
         
-        print(f"Round {round_num+1}: cwnd = {cwnd}, ssthresh = {ssthresh}")
+        if log:
+            log(f"Round {round_num+1}: cwnd = {cwnd}, ssthresh = {ssthresh}")
         
         # Check for a loss event (timeout)
         if round_num + 1 in loss_events:
-            print(f"!! Packet Loss Detected at round {round_num + 1} !!")
+            if log:
+                log(f"!! Packet Loss Detected at round {round_num + 1} !!")
             # Multiplicative Decrease 
             ssthresh = max(cwnd // 2, 2)
             cwnd = 1 # Reset cwnd to 1 MSS
-            print("-> Entering Slow Start phase.")
+            if log:
+                log("-> Entering Slow Start phase.")
             continue
 
         # Increase cwnd based on the current phase [cite: 48]
         if cwnd < ssthresh:
             # Slow Start Phase: exponential growth
             cwnd *= 2
-            if round_num > 0 and cwnd_history[-1] >= ssthresh:
-                 print("-> Entering Congestion Avoidance phase.")
+            if log and round_num > 0 and cwnd_history[-1] >= ssthresh:
+                 log("-> Entering Congestion Avoidance phase.")
         else:
             # Congestion Avoidance Phase: linear growth
             cwnd += 1
 
-    # Plotting the results [cite: 50]
-    plt.figure(figsize=(12, 6))
-    plt.plot(range(1, total_rounds_count + 1), cwnd_history, marker='o', linestyle='-', label='cwnd')
-    plt.axhline(y=initial_ssthresh, color='r', linestyle='--', label=f'Initial ssthresh = {initial_ssthresh}')
-    
-    for loss_round in loss_events:
-        plt.axvline(x=loss_round, color='g', linestyle=':', label=f'Packet Loss at round {loss_round}')
-
-    plt.title('TCP Congestion Window (cwnd) Simulation')
-    plt.xlabel('Transmission Rounds')
-    plt.ylabel('Congestion Window Size (in MSS)')
-    plt.grid(True)
-    plt.legend()
-    plt.xticks(range(1, total_rounds_count + 1))
-    
-    # Save the plot
-    plt.savefig('congestion_control_cwnd_plot.png')
-    print("\nPlot saved as congestion_control_cwnd_plot.png")
-    plt.show()
+    return cwnd_history
 
 
 if __name__ == "__main__":
@@ -61,4 +48,8 @@ if __name__ == "__main__":
     INITIAL_SSTHRESH = 16
     LOSS_EVENTS_AT_ROUNDS = [8, 17] # Simulate packet loss (timeout) at these specific rounds
     
-    tcp_congestion_control_simulation(TOTAL_ROUNDS_COUNT, INITIAL_SSTHRESH, LOSS_EVENTS_AT_ROUNDS)
\ No newline at end of file
+    cwnd_history = tcp_congestion_control_simulation(TOTAL_ROUNDS_COUNT, INITIAL_SSTHRESH, LOSS_EVENTS_AT_ROUNDS)
+
+    from congestion_plot import plot_cwnd
+    plot_cwnd(cwnd_history, 'congestion_control_cwnd_plot.png', INITIAL_SSTHRESH, LOSS_EVENTS_AT_ROUNDS)
+    print("\nPlot saved as congestion_control_cwnd_plot.png")
\ No newline at end of file
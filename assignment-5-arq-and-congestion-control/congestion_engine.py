@@ -0,0 +1,242 @@
+from typing import NamedTuple, Sequence
+import numpy as np
+
+# NOTE:
+# Round based (one round = one RTT) congestion control for many flows at once. Every flow
+# is one slot of the NumPy state arrays, and a round updates all of them together:
+#   - each flow sends floor(cwnd) packets, each lost independently with `loss_prob`;
+#   - flows that share a bottleneck link (`link`, `capacity`, `buffer`) also lose the packets
+#     that overflow it, spread over the flows in proportion to what they sent (drop-tail);
+#   - a window with losses and at least 3 packets delivered (3 duplicate ACKs) is recovered by
+#     fast retransmit, otherwise the flow times out back to cwnd = 1.
+# Tahoe always times out. Reno halves once per loss but falls back to a timeout when one
+# window loses 2 or more packets. NewReno halves once and stays in fast recovery for one more
+# round per extra lost packet (one retransmission per partial ACK). CUBIC (RFC 9438) uses
+# beta 0.7, fast convergence, the TCP-friendly region and NewReno style recovery.
+
+ALGORITHMS = ('tahoe', 'reno', 'newreno', 'cubic')
+TAHOE, RENO, NEWRENO, CUBIC = range(len(ALGORITHMS))
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+DUPACK_THRESHOLD = 3
+
+class CongestionHistory(NamedTuple):
+    cwnd: np.ndarray # (recorded rounds, flows) float32, cwnd at the start of each recorded round
+    rounds: np.ndarray # (recorded rounds,) round number of each row of `cwnd`
+    throughput: np.ndarray # (rounds,) packets delivered in each round, all flows
+    fairness: np.ndarray # (rounds,) Jain's index of the packets delivered by each flow in the round
+    delivered: np.ndarray # (flows,) packets delivered over the run
+    losses: np.ndarray # (flows,) packets lost over the run
+    timeouts: np.ndarray # (flows,)
+    fast_retransmits: np.ndarray # (flows,)
+
+def jain_index(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Jain's fairness index, 1 when all values are equal and 1/n when one takes everything."""
+    values = np.asarray(values, dtype=np.float64)
+    total = values.sum(axis=axis)
+    squares = np.square(values).sum(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(squares > 0, total * total / (values.shape[axis] * squares), 1.0)
+
+def simulate_flows(flows: int, rounds: int, algorithm: str | Sequence[str] = 'reno', loss_prob: float = 0.0,
+                   capacity: float | Sequence[float] | None = None, buffer: float | Sequence[float] = 0.0,
+                   link: Sequence[int] | None = None, initial_cwnd: float = 1.0, initial_ssthresh: float = 64.0,
+                   rtt: float = 0.1, loss_rounds: Sequence[int] = (), record_every: int = 1,
+                   seed: int | None = None) -> CongestionHistory:
+    """Simulate `flows` flows for `rounds` rounds and return their history.
+
+    `algorithm` is one name for every flow or one name per flow (e.g. CUBIC against Reno).
+    Without `capacity` the flows are independent. With it, flow i sends through link
+    `link[i]` (default: all through link 0), which carries `capacity[link]` packets per
+    round and queues up to `buffer[link]` more. A sequence `capacity` or `buffer` has one
+    entry per link and sets the number of links. Every flow loses one packet in each round
+    of `loss_rounds` (numbered from 0). `record_every` keeps every n-th round of cwnd, for
+    runs where (rounds, flows) float32 would not fit in memory.
+    """
+    if flows < 1 or rounds < 0 or record_every < 1:
+        raise ValueError(f"invalid run: {flows} flows, {rounds} rounds, record every {record_every}.")
+    if not 0 <= loss_prob <= 1:
+        raise ValueError(f"loss probability must be in [0, 1]: {loss_prob}.")
+    names = [algorithm] * flows if isinstance(algorithm, str) else list(algorithm)
+    if len(names) != flows or not set(names) <= set(ALGORITHMS):
+        raise ValueError(f"expected {flows} algorithms out of {ALGORITHMS}: {algorithm!r}.")
+    kind = np.array([ALGORITHMS.index(name) for name in names], dtype=np.int8)
+    is_tahoe, is_reno, is_cubic = kind == TAHOE, kind == RENO, kind == CUBIC
+    beta = np.where(is_cubic, CUBIC_BETA, 0.5)
+    cubic_flows = np.flatnonzero(is_cubic)
+
+    shared = capacity is not None
+    if not shared and link is not None:
+        raise ValueError("flows are only assigned to links that have a capacity.")
+    if shared:
+        link_of = np.zeros(flows, dtype=np.intp) if link is None else np.asarray(link, dtype=np.intp)
+        if link_of.shape != (flows,) or link_of.min() < 0:
+            raise ValueError(f"expected one link number per flow: {link!r}.")
+        capacities, buffers = np.asarray(capacity, dtype=np.float64), np.asarray(buffer, dtype=np.float64)
+        sizes = {len(values) for values in (capacities, buffers) if values.ndim == 1}
+        if capacities.ndim > 1 or buffers.ndim > 1 or len(sizes) > 1:
+            raise ValueError(f"expected one capacity and one buffer per link: {capacity!r}, {buffer!r}.")
+        links = sizes.pop() if sizes else int(link_of.max()) + 1
+        if link_of.max() >= links:
+            raise ValueError(f"flows use links up to {link_of.max()}, but only {links} have a capacity.")
+        limit = np.broadcast_to(capacities + buffers, (links,))
+    rng = np.random.default_rng(seed)
+    forced = np.zeros(rounds, dtype=bool)
+    forced[[r for r in loss_rounds if 0 <= r < rounds]] = True
+
+    cwnd = np.full(flows, float(initial_cwnd))
+    ssthresh = np.full(flows, float(initial_ssthresh))
+    recovery = np.zeros(flows, dtype=np.int64) # fast recovery rounds left
+    w_max = np.zeros(flows) # CUBIC: window before the last reduction
+    epoch_start = np.full(flows, -1) # CUBIC: round the current growth epoch began, -1 for none
+    k = np.zeros(flows) # CUBIC: seconds from the epoch start to reach w_max again
+
+    recorded = range(0, rounds, record_every)
+    cwnd_history = np.empty((len(recorded), flows), dtype=np.float32)
+    throughput = np.empty(rounds, dtype=np.int64)
+    fairness = np.empty(rounds)
+    delivered_total = np.zeros(flows, dtype=np.int64)
+    losses_total = np.zeros(flows, dtype=np.int64)
+    timeouts = np.zeros(flows, dtype=np.int64)
+    fast_retransmits = np.zeros(flows, dtype=np.int64)
+
+    for round_num in range(rounds):
+        if round_num % record_every == 0:
+            cwnd_history[round_num // record_every] = cwnd
+        sent = cwnd.astype(np.int64)
+        np.maximum(sent, 1, out=sent)
+        losses = np.zeros(flows, dtype=np.int64)
+        if loss_prob:
+            # one draw for the number of lost packets, then which ones: the same distribution
+            # as a coin per packet, without a binomial draw per flow
+            packets = np.cumsum(sent)
+            lost = rng.binomial(packets[-1], loss_prob)
+            if lost:
+                positions = rng.choice(packets[-1], lost, replace=False)
+                losses = np.bincount(np.searchsorted(packets, positions, side='right'), minlength=flows)
+        if forced[round_num]:
+            np.maximum(losses, 1, out=losses)
+        if shared:
+            load = np.bincount(link_of, weights=sent - losses, minlength=links)
+            if (load > limit).any():
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    overflow = np.where(load > limit, 1.0 - limit / load, 0.0)
+                hit = np.flatnonzero(overflow[link_of])
+                losses[hit] += rng.binomial(sent[hit] - losses[hit], overflow[link_of[hit]])
+        delivered = sent - losses
+        total = delivered.sum()
+        squares = np.dot(delivered, delivered)
+        throughput[round_num] = total
+        fairness[round_num] = total * total / (flows * squares) if squares else 1.0
+        delivered_total += delivered
+        losses_total += losses
+
+        # a flow in fast recovery neither grows nor reacts to losses of the same congestion event
+        recovering = np.flatnonzero(recovery)
+        recovery[recovering] -= 1
+        lossy = np.flatnonzero(losses)
+        if recovering.size:
+            lossy = np.setdiff1d(lossy, recovering, assume_unique=True)
+        grow = np.ones(flows, dtype=bool)
+        grow[recovering] = False
+        if lossy.size:
+            grow[lossy] = False
+            lost, old = losses[lossy], cwnd[lossy]
+            timeout = is_tahoe[lossy] | (delivered[lossy] < DUPACK_THRESHOLD) | (is_reno[lossy] & (lost > 1))
+            timeouts[lossy] += timeout
+            fast_retransmits[lossy] += ~timeout
+            cubic = is_cubic[lossy]
+            w_max[lossy] = np.where(cubic, np.where(old < w_max[lossy], old * (1 + CUBIC_BETA) / 2, old), w_max[lossy]) # fast convergence
+            epoch_start[lossy[cubic]] = -1
+            reduced = np.maximum(old * beta[lossy], 2.0)
+            ssthresh[lossy] = reduced
+            cwnd[lossy] = np.where(timeout, 1.0, reduced)
+            newreno = ~timeout & ~is_reno[lossy] & ~is_tahoe[lossy]
+            recovery[lossy[newreno]] = lost[newreno] - 1
+
+        slow_start = cwnd < ssthresh
+        grown = np.where(slow_start, np.minimum(cwnd * 2, ssthresh), cwnd + 1)
+        if cubic_flows.size:
+            avoiding = cubic_flows[grow[cubic_flows] & ~slow_start[cubic_flows]]
+            starting = avoiding[epoch_start[avoiding] < 0]
+            if starting.size:
+                epoch_start[starting] = round_num
+                k[starting] = np.cbrt(np.maximum(w_max[starting] - cwnd[starting], 0.0) / CUBIC_C)
+                w_max[starting] = np.maximum(w_max[starting], cwnd[starting])
+            t = (round_num + 1 - epoch_start[avoiding]) * rtt
+            x = t - k[avoiding]
+            target = CUBIC_C * x * x * x + w_max[avoiding]
+            friendly = w_max[avoiding] * CUBIC_BETA + 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * t / rtt
+            now = cwnd[avoiding]
+            grown[avoiding] = np.clip(np.maximum(target, friendly), now, 1.5 * now)
+        np.copyto(cwnd, grown, where=grow)
+
+    return CongestionHistory(
+        cwnd=cwnd_history, rounds=np.arange(0, rounds, record_every), throughput=throughput, fairness=fairness,
+        delivered=delivered_total, losses=losses_total, timeouts=timeouts, fast_retransmits=fast_retransmits
+    )
+
+if __name__ == "__main__":
+    import unittest
+
+    class TestCongestionEngine(unittest.TestCase):
+        def test_tahoe_timeouts(self):
+            # congestion_control.py's example: ssthresh 16, losses in rounds 8 and 17 (from 1),
+            # except that slow start stops at ssthresh instead of doubling past it
+            history = simulate_flows(1, 25, 'tahoe', initial_ssthresh=16, loss_rounds=[7, 16])
+            self.assertEqual(
+                history.cwnd[:, 0].tolist(),
+                [1, 2, 4, 8, 16, 17, 18, 19, 1, 2, 4, 8, 9.5, 10.5, 11.5, 12.5, 13.5, 1, 2, 4, 6.75, 7.75, 8.75, 9.75, 10.75]
+            )
+            self.assertEqual(history.timeouts.tolist(), [2])
+
+        def test_reno_and_newreno_recovery(self):
+            reno = simulate_flows(1, 12, 'reno', initial_ssthresh=8, loss_rounds=[6])
+            self.assertEqual(reno.cwnd[:, 0].tolist(), [1, 2, 4, 8, 9, 10, 11, 5.5, 6.5, 7.5, 8.5, 9.5])
+            self.assertEqual((reno.timeouts[0], reno.fast_retransmits[0]), (0, 1))
+            # 3 of 11 lost: Reno times out, NewReno recovers over 3 rounds
+            self.assertEqual(simulate_flows(1, 12, 'reno', initial_ssthresh=8, loss_prob=1.0).timeouts[0], 12)
+            newreno = simulate_flows(1, 20, 'newreno', loss_prob=0.05, seed=3)
+            self.assertEqual(newreno.losses.sum(), simulate_flows(1, 20, 'newreno', loss_prob=0.05, seed=3).losses.sum())
+            self.assertTrue((newreno.cwnd >= 1).all())
+
+        def test_cubic_regrows_to_w_max(self):
+            history = simulate_flows(1, 200, 'cubic', initial_ssthresh=100, loss_rounds=[20])
+            cwnd = history.cwnd[:, 0]
+            w_max = cwnd[20]
+            self.assertAlmostEqual(cwnd[21], w_max * CUBIC_BETA, places=4)
+            k_rounds = np.cbrt(w_max * (1 - CUBIC_BETA) / CUBIC_C) / 0.1
+            plateau = 22 + int(k_rounds)
+            self.assertLess(abs(cwnd[plateau] - w_max), 2)
+            self.assertGreater(cwnd[-1], w_max)
+
+        def test_shared_bottleneck_is_fair_and_full(self):
+            history = simulate_flows(100, 2_000, 'newreno', capacity=1_000, buffer=200, seed=1)
+            self.assertGreater(history.throughput[500:].mean(), 900)
+            self.assertLessEqual(history.throughput[500:].mean(), 1_200)
+            self.assertGreater(jain_index(history.delivered), 0.95)
+            # two links: each has its own capacity
+            two = simulate_flows(20, 500, 'reno', capacity=[100, 400], link=[0] * 10 + [1] * 10, seed=1)
+            self.assertLess(two.delivered[:10].sum(), two.delivered[10:].sum())
+            # an unused link carries nothing
+            unused = simulate_flows(20, 500, 'reno', capacity=[100, 400], buffer=[10, 10], seed=1)
+            self.assertLessEqual(unused.throughput[100:].mean(), 110)
+
+        def test_invalid_links(self):
+            for kwargs in (
+                {'link': [0, 0]}, # no capacity
+                {'capacity': [10, 20], 'link': [0, 2]},
+                {'capacity': [10, 20], 'buffer': [5, 5, 5]},
+                {'capacity': 10, 'buffer': [5], 'link': [0, 1]},
+            ):
+                with self.subTest(**kwargs), self.assertRaises(ValueError):
+                    simulate_flows(2, 10, **kwargs)
+
+        def test_record_every_and_mixed_algorithms(self):
+            history = simulate_flows(4, 10, ['reno', 'cubic', 'tahoe', 'newreno'], record_every=3)
+            self.assertEqual(history.cwnd.shape, (4, 4))
+            self.assertEqual(history.rounds.tolist(), [0, 3, 6, 9])
+            with self.assertRaises(ValueError):
+                simulate_flows(2, 10, ['reno'])
+
+    unittest.main()
@@ -0,0 +1,100 @@
+from typing import Sequence, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+    from congestion_engine import CongestionHistory
+
+# NOTE:
+# Optional renderer for the congestion simulations. matplotlib is imported only when a plot
+# is drawn, and figures are built without pyplot, so nothing opens a window and the Agg
+# canvas writes the file; the simulations themselves never import this module.
+# Long histories are reduced to `max_points` points that keep each bucket's min and max,
+# so the sawtooth of a run with millions of rounds still shows its peaks and drops.
+
+def downsample(values: Sequence[float] | np.ndarray, max_points: int = 4_000,
+               x: Sequence[float] | np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce `values` (at positions `x`, default 0..n-1) to at most `max_points` points:
+    the minimum and the maximum of each bucket, in the order they occur."""
+    values = np.asarray(values)
+    x = np.arange(len(values)) if x is None else np.asarray(x)
+    if len(values) <= max_points:
+        return x, values
+    if max_points < 2:
+        raise ValueError(f"need at least 2 points to keep an envelope: {max_points}.")
+    size = -(-len(values) // (max_points // 2))
+    buckets = -(-len(values) // size) # only the last bucket is partial, never empty
+    padded = np.pad(values.astype(np.float64), (0, buckets * size - len(values)), constant_values=np.nan)
+    padded = padded.reshape(buckets, size)
+    lo, hi = np.nanargmin(padded, axis=1), np.nanargmax(padded, axis=1)
+    first, second = np.minimum(lo, hi), np.maximum(lo, hi)
+    index = (np.arange(buckets)[:, None] * size + np.stack([first, second], axis=1)).ravel()
+    return x[index], values[index]
+
+def _figure(**kwargs) -> 'Figure':
+    from matplotlib.figure import Figure # imported here so that the simulations never pay for it
+    return Figure(**kwargs)
+
+def plot_cwnd(cwnd_history: Sequence[float] | np.ndarray, path: str, initial_ssthresh: float | None = None,
+              loss_events: Sequence[int] = (), max_points: int = 4_000) -> None:
+    """Save a single flow's cwnd per round (from round 1) to `path`, marking the loss rounds."""
+    rounds, cwnd = downsample(cwnd_history, max_points, np.arange(1, len(cwnd_history) + 1))
+    fig = _figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    short = len(cwnd_history) <= 50
+    ax.plot(rounds, cwnd, marker='o' if short else None, linestyle='-', label='cwnd')
+    if initial_ssthresh is not None:
+        ax.axhline(y=initial_ssthresh, color='r', linestyle='--', label=f'Initial ssthresh = {initial_ssthresh}')
+    for loss_round in loss_events:
+        ax.axvline(x=loss_round, color='g', linestyle=':', label=f'Packet Loss at round {loss_round}' if short else None)
+    ax.set_title('TCP Congestion Window (cwnd) Simulation')
+    ax.set_xlabel('Transmission Rounds')
+    ax.set_ylabel('Congestion Window Size (in MSS)')
+    ax.grid(True)
+    ax.legend()
+    if short:
+        ax.set_xticks(range(1, len(cwnd_history) + 1))
+    fig.savefig(path)
+
+def plot_flows(history: 'CongestionHistory', path: str, flows: Sequence[int] = (0,), max_points: int = 4_000) -> None:
+    """Save the cwnd of `flows`, the total throughput and the fairness of a `simulate_flows` run to `path`."""
+    fig = _figure(figsize=(12, 9))
+    cwnd_ax, throughput_ax, fairness_ax = fig.subplots(3, 1, sharex=True)
+    for flow in flows:
+        cwnd_ax.plot(*downsample(history.cwnd[:, flow], max_points, history.rounds), label=f'flow {flow}', linewidth=0.8)
+    cwnd_ax.set_ylabel('cwnd (MSS)')
+    cwnd_ax.legend(loc='upper right')
+    throughput_ax.plot(*downsample(history.throughput, max_points), linewidth=0.8)
+    throughput_ax.set_ylabel('Packets per round')
+    fairness_ax.plot(*downsample(history.fairness, max_points), linewidth=0.8)
+    fairness_ax.set_ylabel("Jain's fairness index")
+    fairness_ax.set_ylim(0, 1.05)
+    fairness_ax.set_xlabel('Rounds')
+    for ax in (cwnd_ax, throughput_ax, fairness_ax):
+        ax.grid(True)
+    fig.suptitle(f'{history.cwnd.shape[1]} flows')
+    fig.savefig(path)
+
+if __name__ == "__main__":
+    import unittest
+
+    class TestDownsample(unittest.TestCase):
+        def test_lengths_around_max_points(self):
+            for n in (3_999, 4_000, 4_001, 4_002, 5_000, 7_999, 8_000, 8_001, 1_000_003):
+                values = np.sin(np.arange(n) / 7.0)
+                x, kept = downsample(values, 4_000)
+                self.assertLessEqual(len(kept), 4_000)
+                self.assertTrue(np.all(np.diff(x) >= 0)) # a one-point bucket repeats its point
+                self.assertEqual(kept.tolist(), values[x].tolist())
+                self.assertEqual((kept.min(), kept.max()), (values.min(), values.max()))
+
+        def test_keeps_spikes(self):
+            values = np.zeros(100_001)
+            values[[12_345, 100_000]] = [5.0, -3.0]
+            x, kept = downsample(values, 10, np.arange(len(values)) + 1)
+            self.assertIn(5.0, kept.tolist())
+            self.assertEqual((x[-1], kept[-1]), (100_001, -3.0))
+            with self.assertRaises(ValueError):
+                downsample(values, 1)
+
+    unittest.main()
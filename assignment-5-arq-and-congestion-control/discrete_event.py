@@ -0,0 +1,261 @@
+from typing import Callable, NamedTuple, Any
+import heapq
+import random
+
+# NOTE:
+# Discrete-event core for the ARQ simulations: events wait in a heap ordered by virtual
+# time (ties in scheduling order) and `Simulator.run` jumps the clock from one to the
+# next, so a run costs CPU time per event and no wall-clock time per simulated second.
+# All randomness comes from `Simulator.rng`, so one seed reproduces one run exactly.
+#
+#   sender --frames--> Link(delay, bandwidth, loss_prob) --> receiver
+#   sender <---ACKs--- Link(delay, bandwidth, loss_prob) <-- receiver
+
+class Timer:
+    __slots__ = ('time', 'callback', 'args', 'cancelled')
+
+    def __init__(self, time: float, callback: Callable[..., None], args: tuple) -> None:
+        self.time = time
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True # left in the heap, skipped when it comes up
+
+class Simulator:
+    def __init__(self, seed: int | None = None) -> None:
+        self.now = 0.0
+        self.rng = random.Random(seed)
+        self.events_run = 0
+        self._events: list[tuple[float, int, Timer]] = []
+        self._sequence = 0
+
+    def schedule(self, delay: float, callback: Callable[..., None], *args: Any) -> Timer:
+        """Run `callback(*args)` `delay` virtual seconds from now."""
+        if delay < 0:
+            raise ValueError(f"cannot schedule an event in the past: {delay}s.")
+        timer = Timer(self.now + delay, callback, args)
+        heapq.heappush(self._events, (timer.time, self._sequence, timer))
+        self._sequence += 1
+        return timer
+
+    def run(self, until: float | None = None) -> float:
+        """Run events in time order until none are left (or the next is after `until`); returns the clock."""
+        events = self._events
+        while events:
+            at, _, timer = events[0]
+            if until is not None and at > until:
+                self.now = until
+                break
+            heapq.heappop(events)
+            if timer.cancelled:
+                continue
+            self.now = at
+            self.events_run += 1
+            timer.callback(*timer.args)
+        return self.now
+
+class Link:
+    """One direction of a point-to-point link.
+
+    A frame is serialized at `bandwidth` bits/s after the frames already on the wire,
+    then arrives `delay` seconds later, unless it is lost (independently, with
+    probability `loss_prob`). A lost frame still occupies the wire.
+    """
+    def __init__(self, sim: Simulator, delay: float = 0.05, bandwidth: float = 1e6, loss_prob: float = 0.0) -> None:
+        if delay < 0 or bandwidth <= 0 or not 0 <= loss_prob <= 1:
+            raise ValueError(f"invalid link: delay {delay}s, bandwidth {bandwidth}b/s, loss {loss_prob}.")
+        self.sim = sim
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.loss_prob = loss_prob
+        self.sent = 0
+        self.lost = 0
+        self._busy_until = 0.0
+
+    def transmission_time(self, size: int) -> float:
+        return size * 8 / self.bandwidth
+
+    @property
+    def idle_at(self) -> float:
+        """When the frames sent so far are all serialized, the last one included."""
+        return max(self._busy_until, self.sim.now)
+
+    def send(self, size: int, deliver: Callable[..., None], *args: Any) -> bool:
+        """Put a `size` byte frame on the wire; `deliver(*args)` runs on arrival. Returns False if it will be lost."""
+        sim = self.sim
+        self._busy_until = max(self._busy_until, sim.now) + size * 8 / self.bandwidth
+        self.sent += 1
+        if sim.rng.random() < self.loss_prob:
+            self.lost += 1
+            return False
+        sim.schedule(self._busy_until + self.delay - sim.now, deliver, *args)
+        return True
+
+class ArqStats(NamedTuple):
+    frames: int # delivered in order to the receiver
+    transmissions: int # frames put on the wire, first sends and retransmissions
+    frames_lost: int
+    acks_sent: int
+    acks_lost: int
+    timeouts: int
+    duration: float # virtual seconds until the sender saw the last ACK
+    frame_size: int
+    bandwidth: float
+
+    @property
+    def retransmissions(self) -> int:
+        return self.transmissions - self.frames
+
+    @property
+    def retransmission_ratio(self) -> float:
+        return self.retransmissions / self.frames if self.frames else 0.0
+
+    @property
+    def goodput(self) -> float:
+        """Delivered payload bits/s."""
+        return self.frames * self.frame_size * 8 / self.duration if self.duration else 0.0
+
+    @property
+    def efficiency(self) -> float:
+        """Share of the link bandwidth that carried delivered frames."""
+        return self.goodput / self.bandwidth
+
+def arq_links(sim: Simulator, delay: float, bandwidth: float, loss_prob: float,
+              ack_loss_prob: float | None = None) -> tuple[Link, Link]:
+    """The frame and the ACK link of an ARQ run (`ack_loss_prob` defaults to `loss_prob`).
+
+    A loss probability of 1 is rejected: nothing would ever be acknowledged and the
+    sender would retransmit forever.
+    """
+    if ack_loss_prob is None:
+        ack_loss_prob = loss_prob
+    if not (0 <= loss_prob < 1 and 0 <= ack_loss_prob < 1):
+        raise ValueError(f"loss probabilities must be in [0, 1): frames {loss_prob}, ACKs {ack_loss_prob}.")
+    return Link(sim, delay, bandwidth, loss_prob), Link(sim, delay, bandwidth, ack_loss_prob)
+
+def default_timeout(forward: Link, backward: Link, frame_size: int, ack_size: int, window_size: int = 1) -> float:
+    """Twice the round trip time of the last frame of a full window and its ACK.
+
+    For a timer that starts when its frame is queued, the timeout has to cover the
+    `window_size` frames serialized ahead of it; a shorter one retransmits frames that
+    are still waiting for the wire and the backlog never drains. A timer that starts
+    once its frame is serialized (`Link.idle_at`) needs `window_size` 1.
+    """
+    return 2 * (
+        forward.delay + window_size * forward.transmission_time(frame_size) + backward.delay + backward.transmission_time(ack_size)
+    )
+
+if __name__ == "__main__":
+    import unittest
+
+    class TestDiscreteEvent(unittest.TestCase):
+        def test_event_order_and_cancel(self):
+            sim = Simulator()
+            fired: list[tuple[float, str]] = []
+            record = lambda name: fired.append((sim.now, name))
+            sim.schedule(2.0, record, "c")
+            sim.schedule(1.0, record, "a")
+            sim.schedule(1.0, record, "b") # same time: scheduling order
+            sim.schedule(1.5, record, "cancelled").cancel()
+            sim.schedule(0.5, lambda: sim.schedule(0.25, record, "nested"))
+            self.assertEqual(sim.run(), 2.0)
+            self.assertEqual(fired, [(0.75, "nested"), (1.0, "a"), (1.0, "b"), (2.0, "c")])
+            sim.schedule(5.0, record, "late")
+            self.assertEqual(sim.run(until=3.0), 3.0)
+            self.assertEqual(len(fired), 4)
+            with self.assertRaises(ValueError):
+                sim.schedule(-1.0, record, "past")
+
+        def test_link_serializes_frames(self):
+            sim = Simulator(seed=0)
+            link = Link(sim, delay=0.01, bandwidth=8_000) # 1 ms per byte
+            arrivals: list[float] = []
+            for _ in range(3):
+                link.send(10, lambda: arrivals.append(sim.now))
+            sim.run()
+            self.assertEqual([round(at, 9) for at in arrivals], [0.02, 0.03, 0.04])
+            self.assertEqual(link.idle_at, sim.now)
+            link.send(10, print)
+            self.assertAlmostEqual(link.idle_at - sim.now, 0.01)
+
+        def test_link_loss_is_seeded(self):
+            def lost(seed: int) -> list[bool]:
+                link = Link(Simulator(seed), loss_prob=0.3)
+                return [link.send(100, print) for _ in range(1_000)]
+            self.assertEqual(lost(7), lost(7))
+            self.assertAlmostEqual(lost(7).count(False) / 1_000, 0.3, delta=0.05)
+
+    class TestArqProtocols(unittest.TestCase):
+        def setUp(self):
+            from go_back_n import go_back_n_simulation
+            from stop_and_wait import stop_and_wait_simulation
+            from selective_repeat import selective_repeat_simulation
+            self.protocols = {
+                'stop_and_wait': lambda *args, **kwargs: stop_and_wait_simulation(*args, verbose=False, **kwargs),
+                'go_back_n': lambda *args, **kwargs: go_back_n_simulation(args[0], 8, *args[1:], verbose=False, **kwargs),
+                'selective_repeat': lambda *args, **kwargs: selective_repeat_simulation(args[0], 8, *args[1:], verbose=False, **kwargs),
+            }
+
+        def test_every_frame_is_delivered(self):
+            for name, simulate in self.protocols.items():
+                for loss_prob in (0.0, 0.2, 0.5):
+                    with self.subTest(protocol=name, loss_prob=loss_prob):
+                        stats = simulate(300, loss_prob, seed=3)
+                        self.assertEqual(stats.frames, 300)
+                        self.assertGreater(stats.duration, 0)
+                        if loss_prob:
+                            self.assertGreater(stats.retransmissions, 0)
+                self.assertEqual(simulate(0, 0.1, seed=3).frames, 0)
+
+        def test_seed_reproduces_run(self):
+            for name, simulate in self.protocols.items():
+                with self.subTest(protocol=name):
+                    self.assertEqual(simulate(500, 0.1, ack_loss_prob=0.05, seed=11), simulate(500, 0.1, ack_loss_prob=0.05, seed=11))
+
+        def test_short_rtt_full_window(self):
+            # the timeout covers a whole window being serialized, so retransmissions do not pile up
+            stats = self.protocols['go_back_n'](2000, 0.1, delay=0.005, seed=1)
+            self.assertEqual(stats.frames, 2000)
+
+        def test_selective_repeat_scales_with_window(self):
+            # its timers start once a frame is serialized, so a larger window never waits longer
+            from selective_repeat import selective_repeat_simulation
+            efficiency = [
+                selective_repeat_simulation(2000, window_size, 0.1, delay=0.005, seed=1, verbose=False).efficiency
+                for window_size in (1, 4, 16, 64)
+            ]
+            self.assertEqual(efficiency, sorted(efficiency))
+            stats = selective_repeat_simulation(1000, 16, 0.1, delay=0.005, timeout=0.05, seed=1, verbose=False)
+            self.assertEqual(stats.frames, 1000)
+
+        def test_certain_loss_is_rejected(self):
+            for name, simulate in self.protocols.items():
+                with self.subTest(protocol=name):
+                    with self.assertRaises(ValueError):
+                        simulate(10, 1.0)
+                    with self.assertRaises(ValueError):
+                        simulate(10, 0.1, ack_loss_prob=1.0)
+
+    class TestArqSweep(unittest.TestCase):
+        def test_sweep(self):
+            from arq_sweep import sweep, sweep_points
+            points = sweep_points(['go_back_n', 'selective_repeat'], [4, 16], [0.0, 0.1, 0.3], [0.01])
+            results = sweep(points, seeds=3, frames=200, workers=2)
+            self.assertEqual(results, sweep(points, seeds=3, frames=200, workers=1))
+            by_point = {result.point: result for result in results}
+            for point, result in by_point.items():
+                self.assertEqual(result.runs, 3)
+                if point.protocol == 'selective_repeat':
+                    go_back_n = by_point[point._replace(protocol='go_back_n')]
+                    self.assertLessEqual(result.retransmission_ratio, go_back_n.retransmission_ratio)
+                    if point.loss_prob:
+                        self.assertLess(result.retransmission_ratio, go_back_n.retransmission_ratio)
+
+        def test_no_frames(self):
+            from arq_sweep import sweep, sweep_points
+            for result in sweep(sweep_points(['stop_and_wait', 'go_back_n'], [4], [0.1], [0.01]), seeds=2, frames=0, workers=1):
+                self.assertEqual((result.retransmission_ratio, result.goodput_mean), (0.0, 0.0))
+
+    unittest.main()
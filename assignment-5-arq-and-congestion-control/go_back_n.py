@@ -1,44 +1,88 @@
-import random
-import time
+from discrete_event import Simulator, Timer, ArqStats, arq_links, default_timeout
+
+def go_back_n_simulation(total_frames_count: int, window_size: int, loss_prob: float,
+                         ack_loss_prob: float | None = None, delay: float = 0.05, bandwidth: float = 1e6,
+                         frame_size: int = 1000, ack_size: int = 40, timeout: float | None = None,
+                         seed: int | None = None, verbose: bool = True) -> ArqStats:
+    """Go-Back-N on the discrete-event core, in virtual time.
+
+    The receiver only accepts the next frame in order and answers every arriving frame
+    with a cumulative ACK (the next sequence number it expects). The sender keeps one
+    timer for the oldest unacknowledged frame; on a timeout it resends the whole window.
+    ACKs are lost with `ack_loss_prob` (default `loss_prob`), independently of frames.
+    Both must be below 1, or the run could never finish.
+    """
+    if window_size < 1:
+        raise ValueError(f"window size must be positive: {window_size}.")
+    sim = Simulator(seed)
+    forward, backward = arq_links(sim, delay, bandwidth, loss_prob, ack_loss_prob)
+    if timeout is None:
+        timeout = default_timeout(forward, backward, frame_size, ack_size, window_size)
+    log = print if verbose else None
+    if log:
+        log(f"--- Go-Back-N ARQ Simulation (Window Size: {window_size}) ---")
 
-def go_back_n_simulation(total_frames_count: int, window_size: int, loss_prob: float):
-    print(f"--- Go-Back-N ARQ Simulation (Window Size: {window_size}) ---")
     base = 0
     next_seq_num = 0
-    
-    while base < total_frames_count:
-        # Send all frames within the current window
+    expected = 0 # receiver: next frame it accepts
+    timer: Timer | None = None
+    timeouts = 0
+    finished_at = 0.0
+
+    def send_frame(seq_num: int) -> None:
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Sending Frame {seq_num}")
+        if not forward.send(frame_size, receive_frame, seq_num) and log:
+            log(f"[{sim.now * 1e3:10.3f}ms] !! Frame {seq_num} was lost.")
+
+    def fill_window() -> None:
+        nonlocal next_seq_num, timer
         while next_seq_num < base + window_size and next_seq_num < total_frames_count:
-            print(f"Sending Frame {next_seq_num}")
-            time.sleep(0.5) # Simulate transmission time
+            send_frame(next_seq_num)
             next_seq_num += 1
+        if timer is None and base < next_seq_num:
+            timer = sim.schedule(timeout, on_timeout)
+
+    def receive_frame(seq_num: int) -> None:
+        nonlocal expected
+        if seq_num == expected:
+            expected += 1
+        elif log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Frame {seq_num} discarded, expecting {expected}.")
+        if not backward.send(ack_size, receive_ack, expected) and log:
+            log(f"[{sim.now * 1e3:10.3f}ms] !! ACK {expected} was lost.")
+
+    def receive_ack(ack: int) -> None:
+        nonlocal base, next_seq_num, timer, finished_at
+        if ack <= base:
+            return # duplicate
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] -> Cumulative ACK {ack} received. Window slides.")
+        base = ack
+        next_seq_num = max(next_seq_num, base) # the ACK may be for frames sent before a timeout
+        timer.cancel()
+        timer = None
+        if base == total_frames_count:
+            finished_at = sim.now
+        fill_window()
+
+    def on_timeout() -> None:
+        nonlocal next_seq_num, timer, timeouts
+        timeouts += 1
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Timeout! Retransmitting from Frame {base}.")
+        timer = None
+        next_seq_num = base # Go back N
+        fill_window()
 
-        # Simulate receiving acknowledgments
-        # In Go-Back-N, the receiver sends a cumulative ACK for the last correctly received in-order frame.
-        ack_to_receive = base 
-        
-        # Simulate potential loss of frames within the window
-        lost_frame = -1
-        for i in range(base, next_seq_num):
-            if random.random() < loss_prob:
-                lost_frame = i
-                print(f"!! Frame {lost_frame} was lost.")
-                break # First loss in the window breaks transmission
-        
-        if lost_frame != -1:
-            # No frames are acknowledged beyond the lost one.
-            # The base remains the same, sender will time out and retransmit.
-            print(f"Timeout! Retransmitting from Frame {lost_frame}.")
-            next_seq_num = lost_frame # Go back N
-        else:
-            # All frames in the window were received successfully
-            ack_to_receive = next_seq_num
-            print(f"-> Cumulative ACK {ack_to_receive} received. Window slides.")
-            base = next_seq_num
-            
-        print("-" * 20)
-
-    print("\n--- Simulation Complete ---")
+    fill_window()
+    sim.run()
+    if log:
+        log("\n--- Simulation Complete ---")
+    return ArqStats(
+        frames=expected, transmissions=forward.sent, frames_lost=forward.lost, acks_sent=backward.sent,
+        acks_lost=backward.lost, timeouts=timeouts, duration=finished_at, frame_size=frame_size, bandwidth=bandwidth
+    )
 
 
 if __name__ == "__main__":
@@ -46,4 +90,5 @@ if __name__ == "__main__":
     WINDOW_SIZE = 4
     LOSS_PROBABILITY = 0.2 # 20% chance of loss
 
-    go_back_n_simulation(TOTAL_FRAMES_COUNT, WINDOW_SIZE, LOSS_PROBABILITY)
\ No newline at end of file
+    stats = go_back_n_simulation(TOTAL_FRAMES_COUNT, WINDOW_SIZE, LOSS_PROBABILITY)
+    print(f"{stats.transmissions} transmissions, {stats.timeouts} timeouts, {stats.duration:.3f}s simulated, efficiency {stats.efficiency:.1%}")
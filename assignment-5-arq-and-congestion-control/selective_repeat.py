@@ -0,0 +1,101 @@
+from discrete_event import Simulator, Timer, ArqStats, arq_links, default_timeout
+
+def selective_repeat_simulation(total_frames_count: int, window_size: int, loss_prob: float,
+                                ack_loss_prob: float | None = None, delay: float = 0.05, bandwidth: float = 1e6,
+                                frame_size: int = 1000, ack_size: int = 40, timeout: float | None = None,
+                                seed: int | None = None, verbose: bool = True) -> ArqStats:
+    """Selective Repeat on the discrete-event core, in virtual time.
+
+    The receiver buffers frames that arrive out of order inside its window and
+    acknowledges every frame on its own. The sender keeps one timer per unacknowledged
+    frame, started when the frame is serialized rather than queued so that the timeout
+    does not depend on the window, and resends only the frame whose timer fired. Frames already delivered are
+    acknowledged again, in case their first ACK was lost. Sequence numbers are not
+    wrapped, so sender and receiver windows need no size limit relative to each other.
+    """
+    if window_size < 1:
+        raise ValueError(f"window size must be positive: {window_size}.")
+    sim = Simulator(seed)
+    forward, backward = arq_links(sim, delay, bandwidth, loss_prob, ack_loss_prob)
+    if timeout is None:
+        timeout = default_timeout(forward, backward, frame_size, ack_size)
+    log = print if verbose else None
+    if log:
+        log(f"--- Selective Repeat ARQ Simulation (Window Size: {window_size}) ---")
+
+    base = 0
+    next_seq_num = 0
+    timers: dict[int, Timer] = {} # sent and not acknowledged yet
+    acked: set[int] = set() # acknowledged, at or after `base`
+    rcv_base = 0 # receiver: frames before it were delivered in order
+    buffered: set[int] = set() # receiver: arrived out of order, inside its window
+    timeouts = 0
+    finished_at = 0.0
+
+    def send_frame(seq_num: int) -> None:
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Sending Frame {seq_num}")
+        if not forward.send(frame_size, receive_frame, seq_num) and log:
+            log(f"[{sim.now * 1e3:10.3f}ms] !! Frame {seq_num} was lost.")
+        timers[seq_num] = sim.schedule(forward.idle_at - sim.now + timeout, on_timeout, seq_num)
+
+    def fill_window() -> None:
+        nonlocal next_seq_num
+        while next_seq_num < base + window_size and next_seq_num < total_frames_count:
+            send_frame(next_seq_num)
+            next_seq_num += 1
+
+    def receive_frame(seq_num: int) -> None:
+        nonlocal rcv_base
+        if seq_num >= rcv_base + window_size:
+            return # cannot happen with equal windows, the sender never runs ahead of it
+        if seq_num >= rcv_base:
+            buffered.add(seq_num)
+            while rcv_base in buffered:
+                buffered.remove(rcv_base)
+                rcv_base += 1
+        elif log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Frame {seq_num} already delivered.")
+        if not backward.send(ack_size, receive_ack, seq_num) and log:
+            log(f"[{sim.now * 1e3:10.3f}ms] !! ACK {seq_num} was lost.")
+
+    def receive_ack(seq_num: int) -> None:
+        nonlocal base, finished_at
+        timer = timers.pop(seq_num, None)
+        if timer is None:
+            return # duplicate
+        timer.cancel()
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] -> ACK {seq_num} received.")
+        acked.add(seq_num)
+        if seq_num == base:
+            while base in acked:
+                acked.remove(base)
+                base += 1
+            if base == total_frames_count:
+                finished_at = sim.now
+            fill_window()
+
+    def on_timeout(seq_num: int) -> None:
+        nonlocal timeouts
+        timeouts += 1
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Timeout! Retransmitting Frame {seq_num}.")
+        send_frame(seq_num)
+
+    fill_window()
+    sim.run()
+    if log:
+        log("\n--- Simulation Complete ---")
+    return ArqStats(
+        frames=rcv_base, transmissions=forward.sent, frames_lost=forward.lost, acks_sent=backward.sent,
+        acks_lost=backward.lost, timeouts=timeouts, duration=finished_at, frame_size=frame_size, bandwidth=bandwidth
+    )
+
+if __name__ == "__main__":
+    TOTAL_FRAMES_COUNT = 10
+    WINDOW_SIZE = 4
+    LOSS_PROBABILITY = 0.2 # 20% chance of loss
+
+    stats = selective_repeat_simulation(TOTAL_FRAMES_COUNT, WINDOW_SIZE, LOSS_PROBABILITY)
+    print(f"{stats.transmissions} transmissions, {stats.timeouts} timeouts, {stats.duration:.3f}s simulated, efficiency {stats.efficiency:.1%}")
@@ -1,47 +1,82 @@
-import random
-import time
+from discrete_event import Simulator, Timer, ArqStats, arq_links, default_timeout
+
+def stop_and_wait_simulation(total_frames_count: int, loss_prob: float,
+                             ack_loss_prob: float | None = None, delay: float = 0.05, bandwidth: float = 1e6,
+                             frame_size: int = 1000, ack_size: int = 40, timeout: float | None = None,
+                             seed: int | None = None, verbose: bool = True) -> ArqStats:
+    """Stop-and-Wait (alternating bit) on the discrete-event core, in virtual time.
+
+    The sender keeps one frame in flight and resends it when no ACK came back within
+    `timeout`. Frames carry a 1-bit sequence number, so the receiver recognizes the
+    duplicate sent after a lost ACK, drops it and acknowledges it again.
+    ACKs are lost with `ack_loss_prob` (default `loss_prob`), independently of frames.
+    Both must be below 1, or the run could never finish.
+    """
+    sim = Simulator(seed)
+    forward, backward = arq_links(sim, delay, bandwidth, loss_prob, ack_loss_prob)
+    if timeout is None:
+        timeout = default_timeout(forward, backward, frame_size, ack_size)
+    log = print if verbose else None
+    if log:
+        log("--- Stop-and-Wait ARQ Simulation ---")
 
-def stop_and_wait_simulation(total_frames_count: int, loss_prob: float):
-    print("--- Stop-and-Wait ARQ Simulation ---")
     next_frame_to_send = 0
-    timeout = 2  # seconds
-
-    while next_frame_to_send < total_frames_count:
-        print(f"Sending Frame {next_frame_to_send}")
-
-        ack_received = False
-        start_time = time.time()
-
-        while not ack_received:
-            # Wait for ACK or timeout
-            if time.time() - start_time > timeout:
-                print(f"Timeout for Frame {next_frame_to_send}, retransmitting...")
-                print(f"Sending Frame {next_frame_to_send}")
-                start_time = time.time() # Reset timer on retransmission
-
-            # Simulate receiver's side
-            # Check if the frame is lost
-            if random.random() < loss_prob:
-                # Frame is lost, do nothing and wait for timeout
-                time.sleep(0.5) # Wait a bit to simulate processing
-                continue
-
-            # Frame is received, now check if ACK is lost
-            if random.random() < loss_prob:
-                print(f"ACK for Frame {next_frame_to_send} was lost.")
-                # ACK is lost, sender will time out
-                time.sleep(0.5)
-                continue
-
-            # Both frame and ACK are successfully transmitted
-            print(f"ACK {next_frame_to_send} received")
-            ack_received = True
-            next_frame_to_send += 1
-
-    print("\n--- Simulation Complete ---")
+    delivered = 0 # receiver: frames accepted
+    timer: Timer | None = None
+    timeouts = 0
+    finished_at = 0.0
+
+    def send_frame() -> None:
+        nonlocal timer
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Sending Frame {next_frame_to_send}")
+        if not forward.send(frame_size, receive_frame, next_frame_to_send % 2) and log:
+            log(f"[{sim.now * 1e3:10.3f}ms] !! Frame {next_frame_to_send} was lost.")
+        timer = sim.schedule(timeout, on_timeout)
+
+    def receive_frame(bit: int) -> None:
+        nonlocal delivered
+        if bit == delivered % 2:
+            delivered += 1
+        elif log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Duplicate frame discarded.")
+        ack_bit = (delivered - 1) % 2 # the last frame accepted
+        if not backward.send(ack_size, receive_ack, ack_bit) and log:
+            log(f"[{sim.now * 1e3:10.3f}ms] ACK for Frame {delivered - 1} was lost.")
+
+    def receive_ack(bit: int) -> None:
+        nonlocal next_frame_to_send, finished_at
+        if bit != next_frame_to_send % 2 or next_frame_to_send == total_frames_count:
+            return # ACK of a retransmitted duplicate that arrived late
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] ACK {next_frame_to_send} received")
+        timer.cancel()
+        next_frame_to_send += 1
+        if next_frame_to_send < total_frames_count:
+            send_frame()
+        else:
+            finished_at = sim.now
+
+    def on_timeout() -> None:
+        nonlocal timeouts
+        timeouts += 1
+        if log:
+            log(f"[{sim.now * 1e3:10.3f}ms] Timeout for Frame {next_frame_to_send}, retransmitting...")
+        send_frame()
+
+    if total_frames_count:
+        send_frame()
+    sim.run()
+    if log:
+        log("\n--- Simulation Complete ---")
+    return ArqStats(
+        frames=delivered, transmissions=forward.sent, frames_lost=forward.lost, acks_sent=backward.sent,
+        acks_lost=backward.lost, timeouts=timeouts, duration=finished_at, frame_size=frame_size, bandwidth=bandwidth
+    )
 
 if __name__ == "__main__":
     TOTAL_FRAMES_COUNT = 5
     LOSS_PROBABILITY = 0.3 # 30% chance of loss
 
-    stop_and_wait_simulation(TOTAL_FRAMES_COUNT, LOSS_PROBABILITY)
\ No newline at end of file
+    stats = stop_and_wait_simulation(TOTAL_FRAMES_COUNT, LOSS_PROBABILITY)
+    print(f"{stats.transmissions} transmissions, {stats.timeouts} timeouts, {stats.duration:.3f}s simulated, efficiency {stats.efficiency:.1%}")
@@ -0,0 +1,81 @@
+from multiprocessing.connection import Connection
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import os
+import sys
+from udp_transport import PROTOCOLS, ImpairedSocket, TransferStats, receive, send, udp_socket
+
+# NOTE:
+# Throughput of the UDP Go-Back-N / Selective Repeat transport on loopback, over
+# window size x loss probability, with the receiver in its own process:
+#   python udp_benchmark.py --windows 1 8 32 128 --loss 0 0.01 0.05 --size 8 --output udp.csv
+# Loss, delay and jitter are injected on both directions. Every run checks the received
+# data against a SHA-256 of what was sent.
+
+FIELDS = ('protocol', 'window_size', 'loss_prob', 'delay', 'megabytes_per_second', 'retransmission_ratio', 'timeouts', 'srtt_ms')
+
+def _receiver(conn: Connection, protocol: str, window_size: int, loss_prob: float, delay: float, jitter: float, seed: int) -> None:
+    sock = ImpairedSocket(udp_socket(), loss_prob, delay, jitter, seed)
+    conn.send(sock.sock.getsockname())
+    try:
+        data = receive(sock, protocol, window_size, linger=0.2)
+        conn.send(hashlib.sha256(data).hexdigest())
+    finally:
+        sock.close()
+
+def run_transfer(data: bytes, protocol: str, window_size: int, loss_prob: float = 0.0, delay: float = 0.0,
+                 jitter: float = 0.0, seed: int = 0) -> TransferStats:
+    """Send `data` to a receiver process on loopback and check it arrived intact."""
+    parent, child = multiprocessing.Pipe()
+    receiver = multiprocessing.Process(
+        target=_receiver, args=(child, protocol, window_size, loss_prob, delay, jitter, seed + 1), daemon=True
+    )
+    receiver.start()
+    sock = ImpairedSocket(udp_socket(), loss_prob, delay, jitter, seed)
+    try:
+        stats = send(sock, parent.recv(), data, protocol, window_size)
+        if parent.recv() != hashlib.sha256(data).hexdigest():
+            raise RuntimeError(f"{protocol} window {window_size} loss {loss_prob}: received data differs.")
+    finally:
+        sock.close()
+        receiver.join()
+    return stats
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Loopback throughput of the UDP sliding-window transport.")
+    parser.add_argument('--protocols', nargs='+', choices=PROTOCOLS, default=list(PROTOCOLS))
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.01, 0.05])
+    parser.add_argument('--delay', type=float, nargs='+', default=[0.0], help="added one way delay in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="added uniform one way jitter in seconds")
+    parser.add_argument('--size', type=float, default=8, help="megabytes per transfer")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="write the table as CSV to this path ('-' for stdout)")
+    args = parser.parse_args()
+
+    data = os.urandom(int(args.size * 1e6))
+    rows = []
+    for protocol, window_size, loss_prob, delay in itertools.product(args.protocols, args.windows, args.loss, args.delay):
+        stats = run_transfer(data, protocol, window_size, loss_prob, delay, args.jitter, args.seed)
+        rows.append((
+            protocol, window_size, loss_prob, delay, stats.throughput / 1e6, stats.retransmission_ratio,
+            stats.timeouts, (stats.srtt or 0.0) * 1e3,
+        ))
+        if args.output != '-':
+            print(
+                f"{protocol:<17} window {window_size:>4} loss {loss_prob:>5.3f} delay {delay * 1e3:>5.1f}ms: "
+                f"{stats.throughput / 1e6:>7.2f}MB/s, {stats.retransmission_ratio:>5.2f} retx/frame, "
+                f"{stats.timeouts:>5} timeouts, srtt {(stats.srtt or 0.0) * 1e3:.2f}ms",
+                flush=True
+            )
+    if args.output:
+        with open(args.output, 'w', newline='') if args.output != '-' else open(sys.stdout.fileno(), 'w', closefd=False) as file:
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
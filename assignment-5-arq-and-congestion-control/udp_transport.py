@@ -0,0 +1,378 @@
+from typing import NamedTuple
+import heapq
+import itertools
+import math
+import random
+import select
+import socket
+import struct
+import time
+
+# NOTE:
+# Go-Back-N and Selective Repeat over real UDP sockets. Every datagram starts with
+# HEADER: kind, sequence number, the receiver's cumulative ACK (next frame it expects) and
+# a timestamp. The receiver echoes the timestamp of the frame it acknowledges, so every ACK
+# is an RTT sample, retransmissions included (as with TCP timestamps, RFC 7323).
+# Sequence numbers count frames and are not wrapped, a transfer can have 2**32 frames.
+# Loss, delay and jitter are injected on the sending side by ImpairedSocket, so both the
+# data and the ACK direction can be impaired on localhost.
+
+DATA, ACK, FIN = 0, 1, 2
+HEADER = struct.Struct('!BIII')
+MAX_PAYLOAD = 1400 # bytes per frame, fits an Ethernet MTU with the UDP/IP headers
+PROTOCOLS = ('go_back_n', 'selective_repeat')
+
+def _timestamp() -> int:
+    return int(time.monotonic() * 1e6) & 0xFFFFFFFF # microseconds, wraps after 71 minutes
+
+def _elapsed(timestamp: int) -> float:
+    return ((_timestamp() - timestamp) & 0xFFFFFFFF) / 1e6
+
+Address = tuple[str, int]
+
+class ImpairedSocket:
+    """A UDP socket whose outgoing datagrams are lost with `loss_prob` and held back
+    `delay` seconds plus a uniform `jitter` (which reorders them)."""
+    def __init__(self, sock: socket.socket, loss_prob: float = 0.0, delay: float = 0.0, jitter: float = 0.0,
+                 seed: int | None = None) -> None:
+        if delay < 0 or jitter < 0 or not 0 <= loss_prob <= 1:
+            raise ValueError(f"invalid impairment: loss {loss_prob}, delay {delay}s, jitter {jitter}s.")
+        self.sock = sock
+        self.loss_prob = loss_prob
+        self.delay = delay
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.sent = 0
+        self.dropped = 0
+        self._held: list[tuple[float, int, bytes, Address]] = [] # (due, order, datagram, address) heap
+        self._order = itertools.count()
+
+    def sendto(self, data: bytes, address: Address) -> None:
+        self.sent += 1
+        if self.loss_prob and self.rng.random() < self.loss_prob:
+            self.dropped += 1
+            return
+        if not self.delay and not self.jitter:
+            self.sock.sendto(data, address)
+            return
+        due = time.monotonic() + self.delay + self.rng.uniform(0, self.jitter)
+        heapq.heappush(self._held, (due, next(self._order), data, address))
+        self.flush()
+
+    def flush(self) -> float | None:
+        """Send the held datagrams that are due; returns seconds until the next one, None if none is held."""
+        held = self._held
+        now = time.monotonic()
+        while held and held[0][0] <= now:
+            _, _, data, address = heapq.heappop(held)
+            self.sock.sendto(data, address)
+        return held[0][0] - now if held else None
+
+    def recvfrom(self, timeout: float | None) -> tuple[bytes, Address] | None:
+        """Wait up to `timeout` seconds (None: forever) for a datagram, sending held ones meanwhile."""
+        deadline = math.inf if timeout is None else time.monotonic() + timeout
+        while True:
+            next_due = self.flush()
+            wait = deadline - time.monotonic()
+            if next_due is not None:
+                wait = min(wait, next_due)
+            ready, _, _ = select.select([self.sock], [], [], None if wait == math.inf else max(wait, 0.0))
+            if ready:
+                return self.sock.recvfrom(65535)
+            if time.monotonic() >= deadline:
+                return None
+
+    def close(self) -> None:
+        self.sock.close()
+
+class RttEstimator:
+    """Retransmission timeout from RTT samples (RFC 6298) with exponential backoff.
+
+    The RFC's one second floor is far above a loopback RTT, `min_rto` defaults lower.
+    On a steady path RTTVAR decays towards 0 and an RTO of little more than SRTT fires
+    on any ACK the scheduler delays, so the RTO is at least SRTT plus the larger of
+    SRTT and `granularity` (the RFC's clock granularity G), twice the RTT once it
+    exceeds a few ms.
+    """
+    def __init__(self, initial_rto: float = 0.2, min_rto: float = 0.005, max_rto: float = 2.0,
+                 granularity: float = 0.005) -> None:
+        self.srtt: float | None = None
+        self.rttvar = 0.0
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+
+    def sample(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + max(self.granularity, self.srtt, 4 * self.rttvar), self.min_rto), self.max_rto)
+
+    def backoff(self) -> None:
+        self.rto = min(self.rto * 2, self.max_rto)
+
+class TransferStats(NamedTuple):
+    bytes: int
+    frames: int
+    transmissions: int # data frames handed to the socket, including the dropped ones
+    duration: float # seconds until the last data frame was acknowledged
+    timeouts: int
+    srtt: float | None
+
+    @property
+    def retransmissions(self) -> int:
+        return self.transmissions - self.frames
+
+    @property
+    def retransmission_ratio(self) -> float:
+        return self.retransmissions / self.frames if self.frames else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Delivered bytes/s."""
+        return self.bytes / self.duration if self.duration else 0.0
+
+def send(sock: ImpairedSocket, peer: Address, data: bytes, protocol: str = 'selective_repeat', window_size: int = 32,
+         payload_size: int = MAX_PAYLOAD, rtt: RttEstimator | None = None, max_retries: int = 10) -> TransferStats:
+    """Send `data` to a `receive` at `peer` and return once every frame is acknowledged.
+
+    Go-Back-N keeps one timer for the oldest unacknowledged frame and resends the whole
+    window when it fires. Selective Repeat keeps a timer per frame and resends only that
+    frame. Every ACK that acknowledges new data is an RTT sample. Datagrams that are not
+    from `peer` or are shorter than a header are ignored. Raises TimeoutError after
+    `max_retries` timeouts in a row without progress.
+    """
+    if protocol not in PROTOCOLS:
+        raise ValueError(f"unknown protocol {protocol!r}, expected one of {PROTOCOLS}.")
+    if window_size < 1 or payload_size < 1:
+        raise ValueError(f"window size and payload size must be positive: {window_size}, {payload_size}.")
+    selective = protocol == 'selective_repeat'
+    rtt = rtt or RttEstimator()
+    peer = (socket.gethostbyname(peer[0]), peer[1]) # as recvfrom reports it
+    view = memoryview(data)
+    total = math.ceil(len(data) / payload_size)
+
+    base = 0
+    next_seq = 0
+    acked: set[int] = set() # selective repeat: acknowledged, at or after `base`
+    deadlines: dict[int, float] = {} # selective repeat: current timer of each frame in flight
+    timers: list[tuple[float, int]] = [] # selective repeat: (deadline, seq) heap, stale entries skipped
+    deadline = math.inf # go back n: timer of the oldest frame in flight
+    transmissions = 0
+    timeouts = 0
+    retries = 0
+
+    def transmit(seq: int, now: float) -> None:
+        nonlocal transmissions
+        start = seq * payload_size
+        sock.sendto(HEADER.pack(DATA, seq, 0, _timestamp()) + view[start:start + payload_size], peer)
+        transmissions += 1
+        if selective:
+            deadlines[seq] = now + rtt.rto
+            heapq.heappush(timers, (deadlines[seq], seq))
+
+    start_time = time.monotonic()
+    while base < total:
+        now = time.monotonic()
+        while next_seq < base + window_size and next_seq < total:
+            transmit(next_seq, now)
+            next_seq += 1
+        if not selective and deadline == math.inf:
+            deadline = now + rtt.rto
+        while timers and deadlines.get(timers[0][1]) != timers[0][0]:
+            heapq.heappop(timers) # acknowledged or rescheduled
+        next_deadline = timers[0][0] if selective and timers else deadline
+
+        packet = sock.recvfrom(max(next_deadline - now, 0.0))
+        now = time.monotonic()
+        if packet is not None:
+            datagram, source = packet
+            if source != peer or len(datagram) < HEADER.size:
+                continue # stray datagram, the timers still run on their deadlines
+            kind, seq, ack, echo = HEADER.unpack_from(datagram)
+            if kind != ACK:
+                continue
+            progress = ack > base
+            if selective and base <= seq < next_seq and seq not in acked:
+                acked.add(seq)
+                deadlines.pop(seq, None)
+                rtt.sample(_elapsed(echo))
+            elif progress:
+                rtt.sample(_elapsed(echo))
+            if progress:
+                for done in range(base, min(ack, next_seq)):
+                    deadlines.pop(done, None)
+                    acked.discard(done)
+                base = ack
+            while base in acked:
+                acked.remove(base)
+                base += 1
+                progress = True
+            if progress:
+                retries = 0
+                deadline = math.inf if base == next_seq else now + rtt.rto
+            continue
+
+        # a timer fired
+        timeouts += 1
+        retries += 1
+        if retries > max_retries:
+            raise TimeoutError(f"no ACK from {peer} after {max_retries} retransmissions of frame {base}.")
+        rtt.backoff()
+        if selective:
+            while timers and timers[0][0] <= now:
+                due, seq = heapq.heappop(timers)
+                if deadlines.get(seq) == due:
+                    transmit(seq, now)
+        else:
+            for seq in range(base, next_seq): # Go back N
+                transmit(seq, now)
+            deadline = now + rtt.rto
+    duration = time.monotonic() - start_time
+
+    # the data is acknowledged, FIN only lets the receiver stop; give up on it quietly
+    for _ in range(max_retries):
+        sock.sendto(HEADER.pack(FIN, total, 0, _timestamp()), peer)
+        packet = sock.recvfrom(rtt.rto)
+        if packet is not None and packet[1] == peer and len(packet[0]) >= HEADER.size and packet[0][0] == FIN:
+            break
+    return TransferStats(
+        bytes=len(data), frames=total, transmissions=transmissions, duration=duration, timeouts=timeouts, srtt=rtt.srtt
+    )
+
+def receive(sock: ImpairedSocket, protocol: str = 'selective_repeat', window_size: int = 32,
+            idle_timeout: float = 30.0, linger: float = 0.5) -> bytes:
+    """Receive one transfer from `send` and return its data.
+
+    Go-Back-N accepts only the next frame in order. Selective Repeat buffers frames up to
+    `window_size` ahead and acknowledges each one. After the FIN the receiver keeps
+    answering retransmitted FINs until `linger` seconds pass quietly. The sender of the
+    first data frame or FIN is the peer; datagrams from elsewhere or shorter than a
+    header are ignored.
+    """
+    if protocol not in PROTOCOLS:
+        raise ValueError(f"unknown protocol {protocol!r}, expected one of {PROTOCOLS}.")
+    receiver_window = window_size if protocol == 'selective_repeat' else 1
+    chunks: list[bytes] = []
+    buffered: dict[int, bytes] = {}
+    expected = 0
+    finished = False
+    sender: Address | None = None
+    while True:
+        packet = sock.recvfrom(linger if finished else idle_timeout)
+        if packet is None:
+            if finished:
+                return b''.join(chunks)
+            raise TimeoutError(f"no frame for {idle_timeout}s, expecting frame {expected}.")
+        datagram, peer = packet
+        if len(datagram) < HEADER.size or (sender is not None and peer != sender):
+            continue
+        kind, seq, _, timestamp = HEADER.unpack_from(datagram)
+        if kind not in (DATA, FIN):
+            continue
+        sender = peer
+        if kind == DATA:
+            if seq == expected:
+                chunks.append(datagram[HEADER.size:])
+                expected += 1
+                while expected in buffered:
+                    chunks.append(buffered.pop(expected))
+                    expected += 1
+            elif expected < seq < expected + receiver_window:
+                buffered[seq] = datagram[HEADER.size:]
+            elif seq > expected and receiver_window > 1:
+                continue # beyond the window and not stored, a selective ACK would lie
+            sock.sendto(HEADER.pack(ACK, seq, expected, timestamp), peer)
+        elif kind == FIN and seq == expected:
+            finished = True
+            sock.sendto(HEADER.pack(FIN, seq, expected, timestamp), peer)
+
+def udp_socket(host: str = '127.0.0.1', port: int = 0, buffer_size: int = 4 * 1024 * 1024) -> socket.socket:
+    """A bound UDP socket with large buffers, so a full window is not dropped by the kernel."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+    sock.bind((host, port))
+    return sock
+
+if __name__ == "__main__":
+    import os
+    import threading
+    import unittest
+
+    def transfer(data: bytes, protocol: str, window_size: int, loss_prob: float = 0.0,
+                 jitter: float = 0.0) -> tuple[bytes, TransferStats]:
+        receiver = ImpairedSocket(udp_socket(), loss_prob, jitter=jitter, seed=1)
+        sender = ImpairedSocket(udp_socket(), loss_prob, jitter=jitter, seed=2)
+        result: list[bytes] = []
+        thread = threading.Thread(target=lambda: result.append(receive(receiver, protocol, window_size, linger=0.2)))
+        thread.start()
+        try:
+            stats = send(sender, receiver.sock.getsockname(), data, protocol, window_size)
+        finally:
+            thread.join()
+            receiver.close()
+            sender.close()
+        return result[0], stats
+
+    class TestUdpTransport(unittest.TestCase):
+        def test_lossless_transfer(self):
+            data = os.urandom(200_000)
+            for protocol in PROTOCOLS:
+                received, stats = transfer(data, protocol, 16)
+                self.assertEqual(received, data)
+                self.assertEqual(stats.frames, math.ceil(len(data) / MAX_PAYLOAD))
+                self.assertEqual(stats.retransmissions, 0)
+
+        def test_lossy_reordered_transfer(self):
+            data = os.urandom(100_000)
+            for protocol in PROTOCOLS:
+                received, stats = transfer(data, protocol, 8, loss_prob=0.1, jitter=0.002)
+                self.assertEqual(received, data)
+                self.assertGreater(stats.retransmissions, 0)
+
+        def test_empty_transfer(self):
+            received, stats = transfer(b'', 'go_back_n', 4)
+            self.assertEqual((received, stats.frames), (b'', 0))
+
+        def test_stray_datagrams(self):
+            data = os.urandom(50_000)
+            receiver = ImpairedSocket(udp_socket())
+            sender = ImpairedSocket(udp_socket())
+            stray = udp_socket()
+            result: list[bytes] = []
+            thread = threading.Thread(target=lambda: result.append(receive(receiver, 'selective_repeat', 8, linger=0.2)))
+            thread.start()
+            try:
+                stray.sendto(b'\x00\x01', receiver.sock.getsockname())
+                stray.sendto(b'\x01\x02', sender.sock.getsockname())
+                stray.sendto(HEADER.pack(ACK, 0, 1 << 20, _timestamp()), sender.sock.getsockname())
+                stats = send(sender, ('localhost', receiver.sock.getsockname()[1]), data, 'selective_repeat', 8)
+            finally:
+                thread.join()
+                for sock in (receiver, sender):
+                    sock.close()
+                stray.close()
+            self.assertEqual(result[0], data)
+            self.assertEqual(stats.retransmissions, 0)
+
+        def test_rto_tracks_samples(self):
+            rtt = RttEstimator(min_rto=0.0)
+            rtt.sample(0.1)
+            self.assertAlmostEqual(rtt.rto, 0.3)
+            for _ in range(50):
+                rtt.sample(0.1)
+            self.assertAlmostEqual(rtt.srtt, 0.1)
+            self.assertAlmostEqual(rtt.rto, 0.2, places=4) # RTTVAR has decayed, the floor is 2 * SRTT
+            rtt.backoff()
+            self.assertAlmostEqual(rtt.rto, 0.4, places=4)
+            rtt = RttEstimator(min_rto=0.0)
+            for _ in range(50):
+                rtt.sample(0.0001)
+            self.assertAlmostEqual(rtt.rto, 0.0001 + rtt.granularity, places=6)
+
+    unittest.main()
@@ -0,0 +1,277 @@
+from typing import Callable, Hashable
+from collections import deque
+import math
+import random
+import time
+from scheduler import Packet, PacketQueues
+
+# NOTE:
+# Active queue management policies wrap any scheduler's queues (`PacketQueues`):
+#   await fifo_scheduler(packets, send, aqm=partial(CoDelQueues, target=0.005))
+# RED drops arriving packets early, with a probability that grows with the average
+# queue length. CoDel drops at dequeue once packets have waited longer than `target`
+# for a whole `interval`, and then more often until the standing queue is gone.
+# Both read time from `clock` (seconds), so the simulation can run them on virtual time.
+
+class RedQueues:
+    """Random Early Detection (Floyd and Jacobson, 1993), with the "gentle" extension.
+
+    `avg` is an exponentially weighted moving average (weight `weight`) of the queue length,
+    taken at each arrival. Below `min_threshold` nothing is dropped; up to `max_threshold`
+    the drop probability rises linearly to `max_p` and is spread out by the count of
+    packets since the last drop; then it rises to 1 at twice `max_threshold` (gentle) or
+    jumps to 1. After the queue ran empty, `avg` decays as if `service_rate` packets/s
+    had been sent meanwhile. The wrapped queues still tail drop at their own limits.
+    """
+    def __init__(self, pkt_queues: PacketQueues, min_threshold: float = 5, max_threshold: float = 15, max_p: float = 0.1,
+                 weight: float = 0.002, gentle: bool = True, service_rate: float | None = None,
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random | None = None) -> None:
+        if not 0 <= min_threshold < max_threshold or not 0 < max_p <= 1 or not 0 < weight <= 1:
+            raise ValueError(f"invalid RED parameters: thresholds {min_threshold}-{max_threshold}, max_p {max_p}, weight {weight}.")
+        self.pkt_queues = pkt_queues
+        self.flow_key = pkt_queues.flow_key
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.max_p = max_p
+        self.weight = weight
+        self.gentle = gentle
+        self.service_rate = service_rate
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.avg = 0.0
+        self.early_drops = 0
+        self._count = -1 # packets accepted since the last early drop, -1 => below min_threshold
+        self._idle_since: float | None = None
+
+    def __len__(self) -> int:
+        return len(self.pkt_queues)
+
+    def push(self, pkt: Packet) -> bool:
+        queued = len(self.pkt_queues)
+        if queued:
+            self.avg += self.weight * (queued - self.avg)
+        elif self._idle_since is not None and self.service_rate:
+            self.avg *= (1 - self.weight) ** ((self.clock() - self._idle_since) * self.service_rate)
+            self._idle_since = None
+        else:
+            self.avg += self.weight * (0 - self.avg)
+        if self._drop_early():
+            self.early_drops += 1
+            return False
+        return self.pkt_queues.push(pkt)
+
+    def pop(self) -> Packet:
+        pkt = self.pkt_queues.pop()
+        if not self.pkt_queues:
+            self._idle_since = self.clock()
+        return pkt
+
+    def _drop_early(self) -> bool:
+        avg, min_threshold, max_threshold = self.avg, self.min_threshold, self.max_threshold
+        if avg < min_threshold:
+            self._count = -1
+            return False
+        if avg < max_threshold:
+            p = self.max_p * (avg - min_threshold) / (max_threshold - min_threshold)
+        elif self.gentle and avg < 2 * max_threshold:
+            p = self.max_p + (1 - self.max_p) * (avg - max_threshold) / max_threshold
+        else:
+            self._count = 0
+            return True
+        self._count += 1
+        # spread drops out: the probability grows with the packets accepted since the last one
+        p = p / (1 - self._count * p) if self._count * p < 1 else 1.0
+        if self.rng.random() < p:
+            self._count = 0
+            return True
+        return False
+
+
+class CoDelQueues:
+    """Controlled Delay (RFC 8289).
+
+    Sojourn times come from arrival times kept in one FIFO per `flow_key` of the wrapped
+    queues. Once every packet leaving during `interval` seconds waited at least `target`
+    seconds, CoDel enters the dropping state: it drops the packet at the head and then
+    one more every `interval / sqrt(drops)`, until a packet below `target` leaves. The last
+    packet queued is never dropped, so `pop` always returns one. Dropped packets are
+    passed to `on_drop`.
+    """
+    def __init__(self, pkt_queues: PacketQueues, target: float = 0.005, interval: float = 0.1,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if target <= 0 or interval <= 0:
+            raise ValueError(f"CoDel target and interval must be positive: {target}s, {interval}s.")
+        self.pkt_queues = pkt_queues
+        self.flow_key = pkt_queues.flow_key
+        self.target = target
+        self.interval = interval
+        self.clock = clock
+        self.on_drop: Callable[[Packet], None] | None = None
+        self.drops = 0
+        self.dropping = False
+        self._arrivals: dict[Hashable, deque[float]] = {}
+        self._first_above_time = 0.0
+        self._drop_next = 0.0
+        self._count = 0
+        self._last_count = 0
+
+    def __len__(self) -> int:
+        return len(self.pkt_queues)
+
+    def push(self, pkt: Packet) -> bool:
+        if not self.pkt_queues.push(pkt):
+            return False
+        key = self.flow_key(pkt)
+        arrivals = self._arrivals.get(key)
+        if arrivals is None:
+            arrivals = self._arrivals[key] = deque()
+        arrivals.append(self.clock())
+        return True
+
+    def pop(self) -> Packet:
+        now = self.clock()
+        pkt, ok_to_drop = self._dequeue(now)
+        if self.dropping:
+            if not ok_to_drop:
+                self.dropping = False # sojourn time went below target
+            while self.dropping and now >= self._drop_next:
+                self._drop(pkt)
+                self._count += 1
+                pkt, ok_to_drop = self._dequeue(now)
+                if ok_to_drop:
+                    self._drop_next = self._control_law(self._drop_next)
+                else:
+                    self.dropping = False
+        elif ok_to_drop:
+            self._drop(pkt)
+            pkt, _ = self._dequeue(now)
+            self.dropping = True
+            # a quick return to dropping resumes near the previous drop rate
+            delta = self._count - self._last_count
+            self._count = delta if delta > 1 and now - self._drop_next < 16 * self.interval else 1
+            self._drop_next = self._control_law(now)
+            self._last_count = self._count
+        return pkt
+
+    def _dequeue(self, now: float) -> tuple[Packet, bool]:
+        pkt = self.pkt_queues.pop()
+        key = self.flow_key(pkt)
+        arrivals = self._arrivals[key]
+        sojourn = now - arrivals.popleft()
+        if not arrivals:
+            del self._arrivals[key]
+        if sojourn < self.target or not self.pkt_queues: # the RFC's "queue holds at most one MTU"
+            self._first_above_time = 0.0
+            return pkt, False
+        if self._first_above_time == 0.0:
+            self._first_above_time = now + self.interval
+            return pkt, False
+        return pkt, now >= self._first_above_time
+
+    def _control_law(self, t: float) -> float:
+        return t + self.interval / math.sqrt(self._count)
+
+    def _drop(self, pkt: Packet) -> None:
+        self.drops += 1
+        if self.on_drop is not None:
+            self.on_drop(pkt)
+
+if __name__ == "__main__":
+    import asyncio
+    import unittest
+    from functools import partial
+    from scheduler import Priority, FifoQueue, Batching, SchedulerMetrics, fifo_scheduler, priority_scheduler, scheduler_fill_first
+
+    class Clock:
+        def __init__(self) -> None:
+            self.now = 0.0
+
+        def __call__(self) -> float:
+            return self.now
+
+    def make_packets(count: int) -> list[Packet]:
+        return [Packet(priority=Priority(i % 3), source_ip="10.0.0.1", dest_ip="10.1.0.1", payload=f"Packet {i}") for i in range(count)]
+
+    class TestAqm(unittest.TestCase):
+        def test_red_thresholds(self):
+            red = RedQueues(FifoQueue(maxsize=1000), min_threshold=5, max_threshold=10, max_p=0.5, weight=1.0, gentle=False, rng=random.Random(0))
+            packets = make_packets(40)
+            accepted = [red.push(pkt) for pkt in packets]
+            self.assertTrue(all(accepted[:6])) # avg is the instantaneous length with weight 1
+            self.assertIn(False, accepted[6:11])
+            self.assertEqual(len(red), 10) # at max_threshold every arrival is dropped
+            self.assertEqual(red.early_drops, accepted.count(False))
+
+        def test_red_average_decays_when_idle(self):
+            clock = Clock()
+            red = RedQueues(FifoQueue(), min_threshold=50, max_threshold=100, weight=0.5, service_rate=1000, clock=clock) # never drops early
+            red.avg = 20.0
+            red.push(make_packets(1)[0])
+            red.pop() # queue empty from now on
+            clock.now = 0.01 # 10 packet times
+            red.push(make_packets(1)[0])
+            self.assertAlmostEqual(red.avg, 20.0 * 0.5 * 0.5 ** 10)
+            with self.assertRaises(ValueError):
+                RedQueues(FifoQueue(), min_threshold=10, max_threshold=5)
+
+        def test_codel_drops_standing_queue(self):
+            clock = Clock()
+            codel = CoDelQueues(FifoQueue(maxsize=10_000), target=0.005, interval=0.1, clock=clock)
+            # 2000 packets arrive at once and leave one per ms: a standing queue of up to 2s
+            for pkt in make_packets(2000):
+                self.assertTrue(codel.push(pkt))
+            drop_times: list[float] = []
+            codel.on_drop = lambda pkt: drop_times.append(clock.now)
+            sent: list[Packet] = []
+            while codel:
+                clock.now += 0.001
+                sent.append(codel.pop())
+            self.assertEqual(codel.drops + len(sent), 2000)
+            self.assertEqual(len(drop_times), codel.drops)
+            # above target from 5ms on, first drop one interval later, then every interval / sqrt(drops)
+            self.assertAlmostEqual(drop_times[0], 0.105, delta=0.0015)
+            self.assertAlmostEqual(drop_times[1] - drop_times[0], 0.1, delta=0.0015)
+            self.assertAlmostEqual(drop_times[-1] - drop_times[-2], 0.1 / math.sqrt(len(drop_times) - 1), delta=0.0015)
+            self.assertFalse(codel.dropping)
+
+        def test_codel_no_drops_below_target(self):
+            clock = Clock()
+            codel = CoDelQueues(FifoQueue(), target=0.005, interval=0.1, clock=clock)
+            for pkt in make_packets(1000):
+                codel.push(pkt)
+                clock.now += 0.001
+                codel.push(pkt)
+                codel.pop()
+                codel.pop() # waits 1ms each
+            self.assertEqual((codel.drops, len(codel)), (0, 0))
+
+        def test_schedulers_with_aqm(self):
+            packets = make_packets(300)
+            for aqm in (partial(RedQueues, min_threshold=20, max_threshold=60, weight=0.2, rng=random.Random(1)), CoDelQueues):
+                metrics = SchedulerMetrics()
+                scheduler = lambda packets, callback: priority_scheduler(packets, callback, maxsize=1000, metrics=metrics, aqm=aqm)
+                results = asyncio.run(scheduler_fill_first(packets, scheduler))
+                stats = metrics.snapshot()
+                self.assertEqual(len(results) + sum(stats.dropped.values()), 300)
+                self.assertEqual(stats.depth, 0)
+                self.assertEqual(results, sorted(results, key=lambda pkt: pkt.priority))
+            # CoDel drops queued packets: batches and metrics stay consistent
+            clock = Clock()
+            ticking_codel = lambda pkt_queues: CoDelQueues(pkt_queues, target=0.001, interval=0.002, clock=clock)
+            batches: list[list[Packet]] = []
+            async def batch_callback(batch: list[Packet]):
+                clock.now += 0.01
+                batches.append(batch)
+            async def run():
+                async def packet_stream():
+                    for pkt in packets:
+                        yield pkt
+                metrics = SchedulerMetrics()
+                await fifo_scheduler(packet_stream(), batch_callback, maxsize=1000, batch=Batching(size=16), metrics=metrics, aqm=ticking_codel)
+                return metrics.snapshot()
+            stats = asyncio.run(run())
+            self.assertGreater(sum(stats.dropped.values()), 0)
+            self.assertEqual(sum(map(len, batches)), sum(stats.dequeued.values()))
+            self.assertEqual(sum(stats.dequeued.values()) + sum(stats.dropped.values()), 300)
+
+    unittest.main()
@@ -0,0 +1,180 @@
+from typing import Callable, Literal, Any
+from collections import deque
+import argparse
+import heapq
+import random
+import statistics
+from scheduler import Packet, Priority, PacketQueues, FifoQueue
+from aqm import RedQueues, CoDelQueues
+
+# NOTE:
+# Discrete-event simulation of one bottleneck link in virtual time, to compare the
+# standing queue each drop policy leaves under the same offered load:
+#   python aqm_simulation.py --traffic aimd --flows 8
+#   python aqm_simulation.py --traffic poisson --load 0.95 1.05
+# aimd    => `--flows` window based senders (additive increase, halve the window on a
+#            loss, at most once per round trip), as TCP Reno would
+# poisson => unresponsive Poisson arrivals at `--load` times the link rate
+
+class VirtualClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+POLICIES: dict[str, Callable[[VirtualClock, float, int], PacketQueues]] = {
+    # (clock, link rate in packets/s, buffer in packets) -> queues
+    'taildrop': lambda clock, service_rate, buffer: FifoQueue(buffer),
+    'red': lambda clock, service_rate, buffer: RedQueues(
+        FifoQueue(buffer), min_threshold=buffer / 20, max_threshold=buffer / 7, max_p=0.1, weight=0.002,
+        service_rate=service_rate, clock=clock, rng=random.Random(0)
+    ),
+    'codel': lambda clock, service_rate, buffer: CoDelQueues(FifoQueue(buffer), target=0.005, interval=0.1, clock=clock),
+}
+
+def simulate(policy: str, traffic: Literal['aimd', 'poisson'], duration: float = 60.0, warmup: float = 5.0,
+             link_rate: float = 10e6, packet_bytes: int = 1500, buffer: int = 1000, rtt: float = 0.1,
+             flows: int = 8, load: float = 1.0, seed: int = 0) -> dict[str, Any]:
+    if warmup < 0 or duration <= warmup:
+        raise ValueError(f"nothing to measure: duration {duration}s, warmup {warmup}s.")
+    rng = random.Random(seed)
+    clock = VirtualClock()
+    service_rate = link_rate / 8 / packet_bytes
+    pkt_queues = POLICIES[policy](clock, service_rate, buffer)
+    payload = "x" * packet_bytes
+    packets = [Packet(priority=Priority.LOW, source_ip=f"10.0.0.{flow}", dest_ip="10.1.0.1", payload=payload) for flow in range(flows)]
+    arrivals: deque[float] = deque() # FIFO link: arrival time of each queued packet, in order
+    events: list[tuple[float, int, str, int]] = [] # (time, tie breaker, kind, flow)
+    sequence = 0
+    def schedule(at: float, kind: str, flow: int = 0) -> None:
+        nonlocal sequence
+        heapq.heappush(events, (at, sequence, kind, flow))
+        sequence += 1
+
+    measuring = lambda: clock.now >= warmup
+    sojourns: list[float] = []
+    queue_samples: list[int] = []
+    offered = dropped = delivered = 0
+    cwnd = [1.0] * flows
+    in_flight = [0] * flows
+    last_decrease = [-rtt] * flows
+    link_busy = False
+
+    def lost(flow: int) -> None:
+        nonlocal dropped
+        dropped += measuring()
+        if traffic == 'aimd':
+            schedule(clock.now + rtt, 'loss', flow) # noticed about a round trip later
+
+    def on_drop(pkt: Packet) -> None: # CoDel drops at the head of the queue
+        arrivals.popleft()
+        lost(int(pkt.source_ip.rsplit('.', 1)[1]))
+    if hasattr(pkt_queues, 'on_drop'):
+        pkt_queues.on_drop = on_drop
+
+    def start_transmission() -> None:
+        nonlocal link_busy
+        pkt = pkt_queues.pop()
+        sojourn = clock.now - arrivals.popleft()
+        if measuring():
+            sojourns.append(sojourn)
+        link_busy = True
+        schedule(clock.now + 1 / service_rate, 'sent', int(pkt.source_ip.rsplit('.', 1)[1]))
+
+    def send(flow: int) -> None:
+        nonlocal offered
+        offered += measuring()
+        if traffic == 'aimd':
+            in_flight[flow] += 1
+        if pkt_queues.push(packets[flow]):
+            arrivals.append(clock.now)
+            if not link_busy:
+                start_transmission()
+        else:
+            lost(flow)
+
+    def fill_window(flow: int) -> None:
+        while in_flight[flow] < int(cwnd[flow]):
+            send(flow)
+
+    if traffic == 'aimd':
+        for flow in range(flows):
+            schedule(rng.random() * rtt, 'ack', flow) # staggered starts
+            in_flight[flow] += 1
+    else:
+        schedule(rng.expovariate(load * service_rate), 'arrival')
+    schedule(warmup, 'sample')
+
+    while events:
+        clock.now, _, kind, flow = heapq.heappop(events)
+        if clock.now >= duration:
+            break
+        if kind == 'arrival':
+            send(rng.randrange(flows))
+            schedule(clock.now + rng.expovariate(load * service_rate), 'arrival')
+        elif kind == 'sent':
+            delivered += measuring()
+            link_busy = False
+            if pkt_queues:
+                start_transmission()
+            if traffic == 'aimd':
+                schedule(clock.now + rtt, 'ack', flow)
+        elif kind == 'ack':
+            in_flight[flow] -= 1
+            cwnd[flow] += 1 / cwnd[flow]
+            fill_window(flow)
+        elif kind == 'loss':
+            in_flight[flow] -= 1
+            if clock.now - last_decrease[flow] >= rtt + len(pkt_queues) / service_rate: # once per round trip
+                cwnd[flow] = max(1.0, cwnd[flow] / 2)
+                last_decrease[flow] = clock.now
+            fill_window(flow)
+        elif kind == 'sample':
+            queue_samples.append(len(pkt_queues))
+            schedule(clock.now + 0.01, 'sample')
+
+    measured = duration - warmup
+    percentiles = statistics.quantiles(sojourns, n=100) if len(sojourns) > 1 else [0.0] * 99
+    return {
+        'policy': policy, 'traffic': traffic, 'load': load if traffic == 'poisson' else None, 'flows': flows,
+        'utilization': delivered / (service_rate * measured),
+        'drop_rate': dropped / offered if offered else 0.0,
+        'sojourn_mean_ms': statistics.fmean(sojourns) * 1e3 if sojourns else 0.0,
+        'sojourn_p50_ms': percentiles[49] * 1e3,
+        'sojourn_p99_ms': percentiles[98] * 1e3,
+        'queue_median': statistics.median(queue_samples),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare drop policies on a simulated bottleneck link.")
+    parser.add_argument('--policies', nargs='+', choices=list(POLICIES), default=list(POLICIES))
+    parser.add_argument('--traffic', choices=['aimd', 'poisson'], default='aimd')
+    parser.add_argument('--flows', type=int, default=8)
+    parser.add_argument('--load', type=float, nargs='+', default=[1.05], help="offered load of poisson traffic, relative to the link rate")
+    parser.add_argument('--link-rate', type=float, default=10e6, help="bits per second")
+    parser.add_argument('--buffer', type=int, default=1000, help="packets")
+    parser.add_argument('--rtt', type=float, default=0.1, help="base round trip time in seconds")
+    parser.add_argument('--duration', type=float, default=60.0, help="simulated seconds, including the warmup")
+    parser.add_argument('--warmup', type=float, default=5.0, help="simulated seconds before measuring starts")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.warmup < 0 or args.duration <= args.warmup:
+        parser.error(f"the duration must exceed the warmup: {args.duration}s, warmup {args.warmup}s.")
+
+    loads = args.load if args.traffic == 'poisson' else [1.0]
+    print(f"{'policy':<10} {'load':>5} {'util':>6} {'drops':>7} {'mean':>9} {'p50':>9} {'p99':>9} {'queue':>7}")
+    for load in loads:
+        for policy in args.policies:
+            result = simulate(
+                policy, args.traffic, duration=args.duration, warmup=args.warmup, link_rate=args.link_rate, buffer=args.buffer,
+                rtt=args.rtt, flows=args.flows, load=load, seed=args.seed
+            )
+            print(
+                f"{policy:<10} {load if args.traffic == 'poisson' else '-':>5} {result['utilization']:>6.1%} {result['drop_rate']:>7.2%} "
+                f"{result['sojourn_mean_ms']:>7.1f}ms {result['sojourn_p50_ms']:>7.1f}ms {result['sojourn_p99_ms']:>7.1f}ms "
+                f"{result['queue_median']:>7.0f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+from typing import NamedTuple, Callable, Literal, Any
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import partial
+import numpy as np
+from router import Route, Router
+from ip_utils import int_to_ipv6, parse_cidr6
+from lpm import ENGINES, ENGINES6
+from flow_cache import FlowCache
+from parallel_router import ParallelRouter
+
+# NOTE:
+# Forwarding-plane benchmark harness. Every strategy is run against the same
+# seeded synthetic tables and address streams, and the results can be written
+# as JSON and compared with an earlier run:
+#   python benchmark.py --sizes 10000 100000 --output after.json --compare before.json
+
+# Rough shape of a public IPv4 table: mostly /24s, then /22-/23 and /16-/20.
+PREFIX_LENGTH_WEIGHTS: dict[int, float] = {
+    8: 0.001, 12: 0.002, 13: 0.003, 14: 0.005, 15: 0.006, 16: 0.013, 17: 0.008, 18: 0.014, 19: 0.025,
+    20: 0.04, 21: 0.045, 22: 0.11, 23: 0.09, 24: 0.6, 25: 0.01, 26: 0.01, 27: 0.008, 28: 0.005,
+    29: 0.003, 30: 0.002, 32: 0.001,
+}
+
+def synthetic_routes(count: int, links_count: int = 16, seed: int = 0) -> list[Route]:
+    rng = random.Random(seed)
+    lengths = rng.choices(list(PREFIX_LENGTH_WEIGHTS), weights=list(PREFIX_LENGTH_WEIGHTS.values()), k=count)
+    routes: list[Route] = []
+    for i, prefix_length in enumerate(lengths):
+        network = rng.getrandbits(32) >> (32 - prefix_length) << (32 - prefix_length)
+        ip = '.'.join(str((network >> shift) & 0xFF) for shift in (24, 16, 8, 0))
+        routes.append(Route(ip_cidr=f"{ip}/{prefix_length}", link_name=f"Link {i % links_count}"))
+    return routes
+
+# IPv6 tables are dominated by /48 and /32 (plus /29, /44, /40, /36) with some /56-/64.
+PREFIX_LENGTH_WEIGHTS6: dict[int, float] = {
+    19: 0.001, 20: 0.002, 24: 0.003, 28: 0.005, 29: 0.04, 32: 0.19, 33: 0.01, 36: 0.02, 40: 0.06,
+    44: 0.07, 46: 0.01, 47: 0.01, 48: 0.5, 52: 0.005, 56: 0.03, 60: 0.005, 64: 0.04,
+}
+
+def synthetic_routes6(count: int, links_count: int = 16, seed: int = 0) -> list[Route]:
+    """IPv6 routes clustered like real allocations: /32-ish blocks inside 2000::/3, longer prefixes inside them."""
+    rng = random.Random(seed)
+    blocks = [(0b001 << 125) | (rng.getrandbits(29) << 96) for _ in range(max(1, count // 20))]
+    lengths = rng.choices(list(PREFIX_LENGTH_WEIGHTS6), weights=list(PREFIX_LENGTH_WEIGHTS6.values()), k=count)
+    routes: list[Route] = []
+    for i, prefix_length in enumerate(lengths):
+        network = rng.choice(blocks) | rng.getrandbits(96)
+        network = network >> (128 - prefix_length) << (128 - prefix_length)
+        routes.append(Route(ip_cidr=f"{int_to_ipv6(network)}/{prefix_length}", link_name=f"Link {i % links_count}"))
+    return routes
+
+def random_addresses6(routes: list[Route], count: int, seed: int = 1) -> list[str]:
+    """Half the destinations fall inside announced prefixes, half are random in 2000::/3."""
+    rng = random.Random(seed)
+    networks = [parse_cidr6(route.ip_cidr).network for route in rng.sample(routes, min(len(routes), 5_000))]
+    addresses: list[str] = []
+    for i in range(count):
+        if i % 2:
+            address = rng.choice(networks) | rng.getrandbits(64)
+        else:
+            address = (0b001 << 125) | rng.getrandbits(125)
+        addresses.append(int_to_ipv6(address))
+    return addresses
+
+def random_addresses(count: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    return ['.'.join(str(rng.getrandbits(8)) for _ in range(4)) for _ in range(count)]
+
+def zipf_sample(population: list[str], count: int, exponent: float = 1.1, seed: int = 1) -> list[str]:
+    """Draw `count` destinations from `population` with Zipf-distributed popularity (rank 1 hottest)."""
+    weights = [1 / rank ** exponent for rank in range(1, len(population) + 1)]
+    return random.Random(seed).choices(population, weights=weights, k=count)
+
+def zipf_addresses(count: int, distinct: int = 100_000, exponent: float = 1.1, seed: int = 1) -> list[str]:
+    return zipf_sample(random_addresses(distinct, seed=seed), count, exponent, seed)
+
+
+class Strategy(NamedTuple):
+    family: Literal[4, 6]
+    build: Callable[[list[Route]], Any] # returns a Router or ParallelRouter
+    batch: bool = False # looked up through route_packets instead of route_packet
+    max_routes: int | None = None # skip larger tables (O(routes) strategies)
+    updates: bool = False # also measure single route announce/withdraw rate
+    # --memory: untraced setup (given the routes and a scratch directory), then the build of
+    # only the structure whose size is reported; by default the whole `build` is traced
+    prepare: Callable[[list[Route], str], Any] | None = None
+    structure: Callable[[Any], Any] | None = None
+    parallel: bool = False # `build` takes `workers=`, run once per count of the --workers sweep
+
+def _with_flow_cache(policy: Literal['lru', 'clock'], routes: list[Route]) -> Router:
+    return Router(routes, flow_cache=FlowCache(capacity=4096, policy=policy))
+
+def _save_snapshot(routes: list[Route], directory: str) -> str:
+    path = os.path.join(directory, "routes.fib")
+    Router(routes).save_snapshot(path)
+    return path
+
+def _from_snapshot(routes: list[Route]) -> Router:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = _save_snapshot(routes, tmp_dir) # preparation, not part of the measured build
+        start = time.perf_counter()
+        router = Router.from_snapshot(path)
+        router.snapshot_load_seconds = time.perf_counter() - start
+    return router # the mapping outlives the file
+
+def _parallel(routes: list[Route], workers: int | None = None) -> ParallelRouter:
+    return ParallelRouter(Router(routes), workers=workers) # each batch is split evenly over the workers
+
+STRATEGIES: dict[str, Strategy] = {
+    **{
+        name: Strategy(family=4, build=partial(Router, engine=engine), max_routes=10_000 if name == 'linear' else None, updates=name != 'linear')
+        for name, engine in ENGINES.items()
+    },
+    'stride+lru': Strategy(family=4, build=partial(_with_flow_cache, 'lru')),
+    'stride+clock': Strategy(family=4, build=partial(_with_flow_cache, 'clock')),
+    'snapshot': Strategy(family=4, build=_from_snapshot, prepare=_save_snapshot, structure=Router.from_snapshot),
+    'batch': Strategy(family=4, build=Router, batch=True, prepare=lambda routes, _: Router(routes), structure=lambda router: router.fib),
+    'parallel': Strategy(family=4, build=_parallel, batch=True, parallel=True),
+    **{
+        f"{name}6": Strategy(family=6, build=partial(Router, engine6=engine6), updates=True)
+        for name, engine6 in ENGINES6.items()
+    },
+}
+
+def measure_build(strategy: Strategy, routes: list[Route], memory: bool) -> tuple[Any, float, int | None]:
+    gc.collect()
+    start = time.perf_counter()
+    router = strategy.build(routes)
+    build_seconds = getattr(router, 'snapshot_load_seconds', time.perf_counter() - start)
+    memory_bytes: int | None = None
+    if memory and not isinstance(router, ParallelRouter):
+        # build a second copy under tracemalloc, so the timing above is not distorted
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prepared = strategy.prepare(routes, tmp_dir) if strategy.prepare else routes
+            gc.collect()
+            tracemalloc.start()
+            traced = (strategy.structure or strategy.build)(prepared)
+            memory_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del traced, prepared
+    return router, build_seconds, memory_bytes
+
+def measure_lookups(router: Any, strategy: Strategy, addresses: list[str], latency_samples: int) -> dict[str, Any]:
+    if strategy.batch:
+        batch = np.array([int.from_bytes(bytes(map(int, address.split('.')))) for address in addresses], dtype=np.uint32)
+        router.route_packets(batch) # compile, start every worker and map the table outside the timing
+        start = time.perf_counter()
+        router.route_packets(batch)
+        return {'lookups_per_sec': len(batch) / (time.perf_counter() - start), 'p50_ns': None, 'p99_ns': None}
+    route_packet = router.route_packet
+    start = time.perf_counter()
+    for address in addresses:
+        route_packet(address)
+    lookups_per_sec = len(addresses) / (time.perf_counter() - start)
+    clock = time.perf_counter_ns
+    latencies: list[int] = []
+    for address in addresses[:latency_samples]:
+        lookup_start = clock()
+        route_packet(address)
+        latencies.append(clock() - lookup_start)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {'lookups_per_sec': lookups_per_sec, 'p50_ns': percentiles[49], 'p99_ns': percentiles[98]}
+
+def measure_updates(router: Router, routes: list[Route]) -> float:
+    """Announce then withdraw every route one at a time."""
+    start = time.perf_counter()
+    for route in routes:
+        router.add_route(route.ip_cidr, route.link_name)
+    for route in routes:
+        router.withdraw_route(route.ip_cidr)
+    return 2 * len(routes) / (time.perf_counter() - start)
+
+def default_workers() -> list[int]:
+    """1, 2, 4, ... up to the CPU count."""
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    return counts
+
+def variants(name: str, workers: list[int]) -> list[tuple[str, Strategy]]:
+    """`name` and its strategy, or one `name/<workers>` variant per worker count for a parallel strategy."""
+    strategy = STRATEGIES[name]
+    if not strategy.parallel:
+        return [(name, strategy)]
+    return [(f"{name}/{count}", strategy._replace(build=partial(strategy.build, workers=count))) for count in workers]
+
+def run(sizes: list[int], strategy_names: list[str], lookups: int, latency_samples: int,
+        memory: bool, seed: int, workers: list[int] | None = None) -> list[dict[str, Any]]:
+    workers = workers or default_workers()
+    results: list[dict[str, Any]] = []
+    for routes_count in sizes:
+        for family in (4, 6):
+            names = [name for name in strategy_names if STRATEGIES[name].family == family]
+            if not names:
+                continue
+            if family == 4:
+                routes = synthetic_routes(routes_count, seed=seed)
+                uniform = random_addresses(lookups, seed=seed + 1)
+                churn = synthetic_routes(2_000, seed=seed + 2)
+            else:
+                routes = synthetic_routes6(routes_count, seed=seed)
+                uniform = random_addresses6(routes, lookups, seed=seed + 1)
+                churn = synthetic_routes6(2_000, seed=seed + 2)
+            streams = {'uniform': uniform, 'zipf': zipf_sample(uniform[:100_000], lookups, seed=seed + 3)}
+            for name, strategy in [variant for name in names for variant in variants(name, workers)]:
+                if strategy.max_routes is not None and routes_count > strategy.max_routes:
+                    continue
+                router, build_seconds, memory_bytes = measure_build(strategy, routes, memory)
+                try:
+                    for stream_name, addresses in streams.items():
+                        if isinstance(router, Router) and router.flow_cache is not None:
+                            router.flow_cache = FlowCache(router.flow_cache.capacity, router.flow_cache.policy)
+                        if strategy.max_routes is not None:
+                            addresses = addresses[:max(1_000, lookups // 100)]
+                        result: dict[str, Any] = {
+                            'strategy': name, 'family': family, 'routes': routes_count, 'stream': stream_name,
+                            'lookups': len(addresses), 'build_seconds': build_seconds, 'memory_bytes': memory_bytes,
+                            **measure_lookups(router, strategy, addresses, latency_samples),
+                        }
+                        if isinstance(router, Router) and router.flow_cache is not None:
+                            result['flow_cache_hit_rate'] = router.flow_cache.stats().hit_rate
+                        results.append(result)
+                        print(format_result(result), flush=True)
+                    if strategy.updates:
+                        result = {'strategy': name, 'family': family, 'routes': routes_count, 'stream': 'updates',
+                                  'updates_per_sec': measure_updates(router, churn)}
+                        results.append(result)
+                        print(format_result(result), flush=True)
+                finally:
+                    if isinstance(router, ParallelRouter):
+                        router.close()
+                    del router
+    return results
+
+def format_result(result: dict[str, Any]) -> str:
+    line = f"{result['routes']:>9} routes  {result['strategy']:<15} {result['stream']:<8}"
+    if 'updates_per_sec' in result:
+        return f"{line} {result['updates_per_sec']:>12,.0f} updates/s"
+    line += f" {result['lookups_per_sec']:>12,.0f} lookups/s  build {result['build_seconds']:8.3f}s"
+    if result['p99_ns'] is not None:
+        line += f"  p50 {result['p50_ns']:>7,.0f}ns  p99 {result['p99_ns']:>7,.0f}ns"
+    if result['memory_bytes'] is not None:
+        line += f"  mem {result['memory_bytes'] / 2**20:8.1f}MiB"
+    if 'flow_cache_hit_rate' in result:
+        line += f"  hit rate {result['flow_cache_hit_rate']:.1%}"
+    return line
+
+def environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit, 'timestamp': datetime.now(timezone.utc).isoformat(), 'python': sys.version.split()[0],
+        'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'numpy': np.__version__,
+    }
+
+def compare(results: list[dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """Print the change against an earlier results file; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {
+            (result['strategy'], result['routes'], result['stream']): result
+            for result in json.load(f)['results']
+        }
+    regressions = 0
+    print(f"\n--- compared with {baseline_path} (regression threshold {threshold:.0%}) ---")
+    for result in results:
+        old = baseline.get((result['strategy'], result['routes'], result['stream']))
+        metric = 'updates_per_sec' if 'updates_per_sec' in result else 'lookups_per_sec'
+        if old is None or not old.get(metric):
+            continue
+        change = result[metric] / old[metric] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{result['routes']:>9} routes  {result['strategy']:<15} {result['stream']:<8} {change:+8.1%} {metric}{flag}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the data-plane lookup strategies.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument('--lookups', type=int, default=200_000, help="addresses per stream")
+    parser.add_argument('--latency-samples', type=int, default=20_000)
+    parser.add_argument('--memory', action='store_true', help="measure structure size with tracemalloc (builds twice; mapped snapshot pages are not heap and not counted)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers(),
+                        help="worker counts to sweep for the parallel strategy (default: 1, 2, 4, ... up to the CPU count)")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    if min(args.workers) < 1:
+        parser.error(f"worker counts must be positive: {args.workers}.")
+
+    results = run(args.sizes, args.strategies, args.lookups, args.latency_samples, args.memory, args.seed, args.workers)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'config': vars(args), 'results': results}, f, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
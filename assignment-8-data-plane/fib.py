@@ -0,0 +1,343 @@
+from typing import Iterable, Iterator
+import bisect
+import mmap
+import os
+import struct
+import stat
+import sys
+import uuid
+import numpy as np
+from lpm import LookupEngine
+
+DEFAULT_LINK_ID = 0
+DEFAULT_LINK_NAME = "Default Gateway"
+
+# NOTE:
+# SNAPSHOT FILE LAYOUT (little-endian, every array 4-byte aligned)
+# header     => magic b"CFIB", format version (I), route count n (I), link name count m (I)
+# networks   => n x uint32, sorted by (prefix length desc, network asc)
+# lengths    => n x uint8, zero padded to a multiple of 4
+# link_ids   => n x uint32, indexes into the link name table
+# link names => m x (uint16 byte length + UTF-8 bytes), id 0 is the default gateway
+SNAPSHOT_MAGIC = b"CFIB"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<4sIII')
+_NAME_LENGTH = struct.Struct('<H')
+
+def _padded(size: int) -> int:
+    return (size + 3) & ~3
+
+class CompiledFib:
+    """Flat, array-based forwarding table for vectorized batch lookups.
+
+    Routes are stored as parallel arrays sorted by (prefix length descending, network
+    ascending), so each prefix length is one contiguous, sorted run that can be probed
+    for a whole batch of addresses with a single `np.searchsorted`. Link names are
+    interned into `link_names`; id 0 is always the default gateway.
+    """
+    def __init__(self, networks: np.ndarray, lengths: np.ndarray, link_ids: np.ndarray, link_names: list[str]) -> None:
+        self.networks = networks
+        self.lengths = lengths
+        self.link_ids = link_ids
+        self.link_names = link_names
+        # (prefix length, mask, start, end) for each run of equal prefix lengths
+        self.runs: list[tuple[int, int, int, int]] = []
+        boundaries = np.flatnonzero(np.diff(lengths)) + 1
+        for start, end in zip([0, *boundaries.tolist()], [*boundaries.tolist(), len(lengths)]):
+            if start == end:
+                continue
+            prefix_length = int(lengths[start])
+            mask = (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF
+            self.runs.append((prefix_length, mask, start, end))
+
+    @classmethod
+    def from_routes(cls, routes: Iterable[tuple[int, int, str]]) -> "CompiledFib":
+        """Compile (network, prefix_length, link_name) triples; prefixes must be unique."""
+        link_names: list[str] = [DEFAULT_LINK_NAME]
+        link_index: dict[str, int] = {}
+        networks: list[int] = []
+        lengths: list[int] = []
+        link_ids: list[int] = []
+        for network, prefix_length, link_name in routes:
+            networks.append(network)
+            lengths.append(prefix_length)
+            link_id = link_index.get(link_name)
+            if link_id is None:
+                link_id = link_index[link_name] = len(link_names)
+                link_names.append(link_name)
+            link_ids.append(link_id)
+        networks_array = np.array(networks, dtype=np.uint32)
+        lengths_array = np.array(lengths, dtype=np.uint8)
+        order = np.lexsort((networks_array, -lengths_array.astype(np.int16)))
+        return cls(
+            networks=networks_array[order],
+            lengths=lengths_array[order],
+            link_ids=np.array(link_ids, dtype=np.uint32)[order],
+            link_names=link_names,
+        )
+
+    def __len__(self) -> int:
+        return len(self.networks)
+
+    def items(self) -> Iterator[tuple[int, int, str]]:
+        link_names = self.link_names
+        for network, prefix_length, link_id in zip(self.networks.tolist(), self.lengths.tolist(), self.link_ids.tolist()):
+            yield network, prefix_length, link_names[link_id]
+
+    def to_bytes(self) -> bytes:
+        """Serialize the table in the snapshot layout."""
+        count = len(self)
+        names = b"".join(
+            _NAME_LENGTH.pack(len(encoded)) + encoded
+            for encoded in (link_name.encode("utf-8") for link_name in self.link_names)
+        )
+        return b"".join((
+            _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count, len(self.link_names)),
+            self.networks.astype('<u4').tobytes(),
+            self.lengths.astype(np.uint8).tobytes().ljust(_padded(count), b"\0"),
+            self.link_ids.astype('<u4').tobytes(),
+            names,
+        ))
+
+    def save(self, path: str | os.PathLike) -> None:
+        """Write the table in the snapshot layout, atomically and durably replacing `path`.
+
+        A new file gets the mode the umask allows, a replaced one keeps its mode.
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        # a unique temporary file per call, so concurrent saves to one path never share it
+        tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666) # umask applies
+        try:
+            with open(fd, 'wb') as f:
+                try:
+                    os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+                except FileNotFoundError:
+                    pass
+                f.write(self.to_bytes())
+                f.flush()
+                os.fsync(f.fileno()) # the data is on disk before the name points at it
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        if os.name == 'posix': # and the rename is on disk too
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> "CompiledFib":
+        """Map a snapshot read-only; the arrays are views of the page cache, not copies."""
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                raise ValueError(f"invalid forwarding table snapshot: {path}.")
+        return cls.from_buffer(buffer)
+
+    @classmethod
+    def from_buffer(cls, buffer) -> "CompiledFib":
+        """Build a table over any buffer holding the snapshot layout, without copying."""
+        if len(buffer) < _SNAPSHOT_HEADER.size:
+            raise ValueError("invalid forwarding table snapshot: truncated header.")
+        magic, version, count, names_count = _SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"invalid forwarding table snapshot: magic={magic!r}, version={version}.")
+        offset = _SNAPSHOT_HEADER.size
+        networks = np.frombuffer(buffer, dtype='<u4', count=count, offset=offset)
+        offset += 4 * count
+        lengths = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset)
+        offset += _padded(count)
+        link_ids = np.frombuffer(buffer, dtype='<u4', count=count, offset=offset)
+        offset += 4 * count
+        link_names: list[str] = []
+        try:
+            for _ in range(names_count):
+                (size,) = _NAME_LENGTH.unpack_from(buffer, offset)
+                offset += _NAME_LENGTH.size
+                link_names.append(bytes(buffer[offset:offset + size]).decode("utf-8"))
+                offset += size
+        except (struct.error, UnicodeDecodeError):
+            raise ValueError("invalid forwarding table snapshot: corrupt link name table.")
+        if sys.byteorder != 'little': # snapshots are little-endian; big-endian hosts pay one copy
+            networks, link_ids = networks.astype(np.uint32), link_ids.astype(np.uint32)
+        return cls(networks=networks, lengths=lengths, link_ids=link_ids, link_names=link_names)
+
+    def lookup_batch(self, addresses: np.ndarray) -> np.ndarray:
+        """Return the link id of the longest matching prefix for every uint32 address."""
+        addresses = np.asarray(addresses, dtype=np.uint32)
+        result = np.full(addresses.shape, DEFAULT_LINK_ID, dtype=np.uint32)
+        pending = np.arange(addresses.size)
+        flat_addresses = addresses.reshape(-1)
+        flat_result = result.reshape(-1)
+        for _, mask, start, end in self.runs: # longest prefixes first
+            if pending.size == 0:
+                break
+            networks = self.networks[start:end]
+            masked = flat_addresses[pending] & np.uint32(mask)
+            positions = np.searchsorted(networks, masked)
+            np.minimum(positions, len(networks) - 1, out=positions)
+            hits = networks[positions] == masked
+            flat_result[pending[hits]] = self.link_ids[start:end][positions[hits]]
+            pending = pending[~hits]
+        return result
+
+    def lookup(self, address: int) -> int:
+        return int(self.lookup_batch(np.array([address], dtype=np.uint32))[0])
+
+
+class CompiledFibEngine(LookupEngine):
+    """Read-only engine answering single lookups straight from a `CompiledFib`.
+
+    Each lookup binary-searches the run of every prefix length, longest first, so it
+    needs no build step: a router loaded from a snapshot serves as soon as the file is
+    mapped. It cannot be updated in place; `Router` swaps in a trie on the first update.
+    """
+    def __init__(self, fib: CompiledFib) -> None:
+        super().__init__(32)
+        self.fib = fib
+        self._networks = memoryview(np.ascontiguousarray(fib.networks, dtype=np.uint32))
+        self._link_ids = memoryview(np.ascontiguousarray(fib.link_ids, dtype=np.uint32))
+
+    def __len__(self) -> int:
+        return len(self.fib)
+
+    def __contains__(self, prefix: tuple[int, int]) -> bool:
+        network, prefix_length = prefix
+        for length, _, start, end in self.fib.runs:
+            if length == prefix_length:
+                position = bisect.bisect_left(self._networks, network, start, end)
+                return position < end and self._networks[position] == network
+        return False
+
+    def items(self) -> Iterator[tuple[int, int, str]]:
+        return self.fib.items()
+
+    def insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def remove(self, network: int, prefix_length: int) -> str | None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def apply_updates(self, updates: Iterable[tuple[int, int, str | None]]) -> None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def _begin(self) -> None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def _publish(self) -> None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def _insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def _remove(self, network: int, prefix_length: int) -> None:
+        raise TypeError("a compiled forwarding table is read-only.")
+
+    def lookup(self, address: int) -> str | None:
+        networks = self._networks
+        for _, mask, start, end in self.fib.runs: # longest prefixes first
+            key = address & mask
+            position = bisect.bisect_left(networks, key, start, end)
+            if position < end and networks[position] == key:
+                return self.fib.link_names[self._link_ids[position]]
+        return None
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import threading
+    import unittest
+    from lpm import LinearScan
+
+    class TestCompiledFib(unittest.TestCase):
+        def test_matches_linear_scan(self):
+            rng = random.Random(0)
+            engine = LinearScan()
+            for i in range(3000):
+                prefix_length = rng.choice([0, 8, 12, 16, 20, 22, 24, 24, 24, 28, 32])
+                engine.insert(rng.getrandbits(32), prefix_length, f"Link {i % 7}")
+            fib = CompiledFib.from_routes(engine.items())
+            addresses = [rng.getrandbits(32) for _ in range(5000)] + [network for network, _, _ in engine.items()]
+            link_ids = fib.lookup_batch(np.array(addresses, dtype=np.uint32))
+            for address, link_id in zip(addresses, link_ids.tolist()):
+                expected = engine.lookup(address)
+                self.assertEqual(fib.link_names[link_id], DEFAULT_LINK_NAME if expected is None else expected)
+
+        def test_empty_table(self):
+            fib = CompiledFib.from_routes([])
+            self.assertEqual(fib.lookup_batch(np.array([1, 2, 3], dtype=np.uint32)).tolist(), [0, 0, 0])
+            self.assertEqual(fib.link_names, [DEFAULT_LINK_NAME])
+
+        def test_runs_are_sorted(self):
+            fib = CompiledFib.from_routes([(0x0A000000, 8, "A"), (0x0B000000, 8, "B"), (0x0A010000, 16, "C")])
+            self.assertEqual([run[0] for run in fib.runs], [16, 8])
+            self.assertEqual(fib.link_names[fib.lookup(0x0A010101)], "C")
+            self.assertEqual(fib.link_names[fib.lookup(0x0B010101)], "B")
+
+        def test_snapshot_round_trip(self):
+            rng = random.Random(1)
+            engine = LinearScan()
+            for i in range(1001): # odd count exercises the lengths padding
+                engine.insert(rng.getrandbits(32), rng.choice([0, 8, 16, 19, 24, 32]), f"Link {i % 5} é")
+            fib = CompiledFib.from_routes(engine.items())
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "table.fib")
+                fib.save(path)
+                loaded = CompiledFib.load(path)
+                self.assertEqual(loaded.link_names, fib.link_names)
+                self.assertEqual(loaded.runs, fib.runs)
+                self.assertEqual(sorted(loaded.items()), sorted(engine.items()))
+                self.assertFalse(loaded.networks.flags.writeable) # a view of the mapping
+                compiled_engine = CompiledFibEngine(loaded)
+                self.assertEqual(len(compiled_engine), len(engine))
+                network, prefix_length, _ = next(engine.items())
+                self.assertIn((network, prefix_length), compiled_engine)
+                for address in [rng.getrandbits(32) for _ in range(3000)] + [network for network, _, _ in engine.items()]:
+                    self.assertEqual(compiled_engine.lookup(address), engine.lookup(address))
+                for update in (lambda: compiled_engine.insert(0, 0, "Link 0"), lambda: compiled_engine.remove(network, prefix_length)):
+                    with self.assertRaises(TypeError):
+                        update()
+                del loaded, compiled_engine
+
+        def test_concurrent_saves(self):
+            fibs = [CompiledFib.from_routes([(i << 24, 8, f"Link {i}")] * 20_000) for i in range(4)]
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "table.fib")
+                savers = [threading.Thread(target=fib.save, args=(path,)) for fib in fibs for _ in range(5)]
+                for saver in savers:
+                    saver.start()
+                for saver in savers:
+                    saver.join()
+                self.assertIn(CompiledFib.load(path).to_bytes(), [fib.to_bytes() for fib in fibs])
+                self.assertEqual(os.listdir(tmp_dir), ["table.fib"])
+
+        @unittest.skipUnless(os.name == 'posix', "POSIX file modes")
+        def test_save_file_mode(self):
+            fib = CompiledFib.from_routes([(10 << 24, 8, "Link A")])
+            umask = os.umask(0o022)
+            try:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    path = os.path.join(tmp_dir, "table.fib")
+                    fib.save(path)
+                    self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644) # readable by other users
+                    os.chmod(path, 0o640)
+                    fib.save(path)
+                    self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640) # a replaced snapshot keeps its mode
+            finally:
+                os.umask(umask)
+
+        def test_load_rejects_garbage(self):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "table.fib")
+                for content in (b"", b"not a forwarding table snapshot"):
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                    with self.assertRaises(ValueError):
+                        CompiledFib.load(path)
+
+    unittest.main()
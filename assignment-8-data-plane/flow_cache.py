@@ -0,0 +1,168 @@
+from typing import NamedTuple, Literal, Hashable
+from collections import OrderedDict
+
+class FlowCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+    capacity: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class FlowCache:
+    """Bounded destination -> link cache placed in front of the LPM lookup.
+
+    Entries are tagged with the route table generation they were computed under; the
+    first access with a newer generation drops every entry, so a route change can never
+    be answered with a stale next hop. Accesses with an older generation miss and leave
+    the cache alone. Eviction is LRU (`OrderedDict`) or CLOCK
+    (second chance over a fixed ring, cheaper on hits). Not thread-safe: share a
+    cache only between lookups that run on the same thread.
+    """
+    def __init__(self, capacity: int = 65536, policy: Literal['lru', 'clock'] = 'lru') -> None:
+        if capacity < 1:
+            raise ValueError(f"flow cache capacity must be positive: {capacity}.")
+        if policy not in ('lru', 'clock'):
+            raise ValueError(f"unknown flow cache eviction policy: {policy}.")
+        self.capacity = capacity
+        self.policy = policy
+        self.generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        # LRU state
+        self._lru: OrderedDict[Hashable, str] = OrderedDict()
+        # CLOCK state
+        self._slots: dict[Hashable, int] = {}
+        self._keys: list[Hashable] = []
+        self._links: list[str] = []
+        self._referenced = bytearray(capacity)
+        self._hand = 0
+
+    def __len__(self) -> int:
+        return len(self._lru) if self.policy == 'lru' else len(self._slots)
+
+    def get(self, key: Hashable, generation: int) -> str | None:
+        if generation != self.generation:
+            if generation < self.generation:
+                self.misses += 1
+                return None # a reader of an older table must not roll the cache back
+            self._sync(generation)
+        if self.policy == 'lru':
+            link_name = self._lru.get(key)
+            if link_name is not None:
+                self._lru.move_to_end(key)
+        else:
+            slot = self._slots.get(key)
+            link_name = None
+            if slot is not None:
+                self._referenced[slot] = 1
+                link_name = self._links[slot]
+        if link_name is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return link_name
+
+    def put(self, key: Hashable, link_name: str, generation: int) -> None:
+        if generation != self.generation:
+            if generation < self.generation:
+                return # computed against a table that has since changed
+            self._sync(generation)
+        if self.policy == 'lru':
+            self._lru[key] = link_name
+            self._lru.move_to_end(key)
+            if len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+                self.evictions += 1
+            return
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._links[slot] = link_name
+            self._referenced[slot] = 1
+            return
+        if len(self._keys) < self.capacity:
+            self._slots[key] = len(self._keys)
+            self._keys.append(key)
+            self._links.append(link_name)
+            return
+        referenced, hand = self._referenced, self._hand
+        while referenced[hand]: # give referenced entries a second chance
+            referenced[hand] = 0
+            hand = (hand + 1) % self.capacity
+        del self._slots[self._keys[hand]]
+        self._slots[key] = hand
+        self._keys[hand] = key
+        self._links[hand] = link_name
+        self._hand = (hand + 1) % self.capacity
+        self.evictions += 1
+
+    def clear(self) -> None:
+        self._lru.clear()
+        self._slots.clear()
+        self._keys.clear()
+        self._links.clear()
+        self._referenced = bytearray(self.capacity)
+        self._hand = 0
+
+    def stats(self) -> FlowCacheStats:
+        return FlowCacheStats(
+            hits=self.hits, misses=self.misses, evictions=self.evictions,
+            invalidations=self.invalidations, size=len(self), capacity=self.capacity
+        )
+
+    def _sync(self, generation: int) -> None:
+        if len(self):
+            self.invalidations += 1
+        self.clear()
+        self.generation = generation
+
+if __name__ == "__main__":
+    import unittest
+
+    class TestFlowCache(unittest.TestCase):
+        def test_lru_eviction(self):
+            cache = FlowCache(capacity=2, policy='lru')
+            cache.put("a", "Link 0", 0)
+            cache.put("b", "Link 1", 0)
+            self.assertEqual(cache.get("a", 0), "Link 0") # "b" is now least recently used
+            cache.put("c", "Link 2", 0)
+            self.assertIsNone(cache.get("b", 0))
+            self.assertEqual(cache.get("c", 0), "Link 2")
+            self.assertEqual(cache.stats(), FlowCacheStats(hits=2, misses=1, evictions=1, invalidations=0, size=2, capacity=2))
+
+        def test_clock_eviction(self):
+            cache = FlowCache(capacity=3, policy='clock')
+            for key in "abc":
+                cache.put(key, f"Link {key}", 0)
+            cache.get("a", 0) # referenced, survives the next sweep
+            cache.put("d", "Link d", 0)
+            self.assertEqual(cache.get("a", 0), "Link a")
+            self.assertIsNone(cache.get("b", 0))
+            self.assertEqual(cache.get("d", 0), "Link d")
+            self.assertEqual(len(cache), 3)
+            self.assertEqual(cache.evictions, 1)
+
+        def test_generation_invalidates(self):
+            for policy in ('lru', 'clock'):
+                cache = FlowCache(capacity=4, policy=policy)
+                cache.put("a", "Link 0", 0)
+                self.assertIsNone(cache.get("a", 1))
+                self.assertEqual(cache.invalidations, 1)
+                cache.put("a", "Link 0", 0) # stale result, dropped
+                self.assertIsNone(cache.get("a", 1))
+                cache.put("a", "Link 1", 1)
+                self.assertEqual(cache.get("a", 1), "Link 1")
+                self.assertIsNone(cache.get("a", 0)) # stale reader: a miss, the cache keeps generation 1
+                self.assertEqual((cache.generation, cache.get("a", 1), cache.invalidations), (1, "Link 1", 1))
+
+        def test_invalid_arguments(self):
+            with self.assertRaises(ValueError):
+                FlowCache(capacity=0)
+            with self.assertRaises(ValueError):
+                FlowCache(policy='fifo') # type: ignore
+
+    unittest.main()
@@ -1,9 +1,21 @@
 from typing import NamedTuple, Literal, overload
+import socket
 
 class IpCidrInfo(NamedTuple):
     cidr_prefix: str
     prefix_length: int
 
+class IpPrefix(NamedTuple):
+    network: int # 32-bit (IPv4) or 128-bit (IPv6) network address with the host bits cleared
+    mask: int
+    
+    @property
+    def prefix_length(self) -> int:
+        return self.mask.bit_count()
+    
+    def __contains__(self, address: int) -> bool:
+        return address & self.mask == self.network
+
 
 def ip_to_binary(ip_address: str) -> str:
     ip_address_parts: list[str] = ip_address.split('.')
@@ -40,6 +52,85 @@ def get_network_prefix(ip_cidr: str, *, return_cidr_prefix: bool = False) -> str
             prefix_length=prefix_length
         )
     return ip_binary[:prefix_length]
+
+# NOTE:
+# Integer-native helpers. Addresses are plain 32-bit ints and prefixes are
+# (network, mask) pairs, so matching is a single `address & mask == network`.
+# Parsing goes through inet_pton, which is strict: exactly four decimal
+# octets in 0-255, no leading zeros and no surrounding whitespace.
+
+def is_valid_ipv4(ip_address: str) -> bool:
+    try:
+        socket.inet_pton(socket.AF_INET, ip_address)
+    except (OSError, ValueError, TypeError):
+        return False
+    return True
+
+def ip_to_int(ip_address: str) -> int:
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip_address))
+    except (OSError, ValueError, TypeError):
+        raise ValueError(f"invalid IPV4 address: {ip_address}.")
+
+def int_to_ip(address: int) -> str:
+    if not (0 <= address <= 0xFFFFFFFF):
+        raise ValueError(f"IPV4 address must fit in 32 bits: {address}.")
+    return socket.inet_ntop(socket.AF_INET, address.to_bytes(4))
+
+def prefix_mask(prefix_length: int) -> int:
+    if not (0 <= prefix_length <= 32):
+        raise ValueError(f"CIDR prefix length must be between 0 and 32: {prefix_length}.")
+    return (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF
+
+def parse_cidr(ip_cidr: str) -> IpPrefix:
+    ip, sep, cidr = ip_cidr.partition('/')
+    if not sep:
+        raise ValueError(f"invalid IPV4 CIDR address: {ip_cidr}.")
+    if not (cidr.isascii() and cidr.isdigit()):
+        raise ValueError(f"invalid CIDR prefix length: {cidr}.")
+    mask = prefix_mask(int(cidr))
+    return IpPrefix(network=ip_to_int(ip) & mask, mask=mask)
+
+def prefix_matches(address: int, prefix: IpPrefix) -> bool:
+    return address & prefix.mask == prefix.network
+
+# NOTE:
+# IPv6 counterparts of the helpers above. Addresses are 128-bit ints and
+# prefixes reuse IpPrefix; parsing accepts every RFC 4291 text form that
+# inet_pton does ("::" compression, embedded dotted IPv4 tail).
+IPV6_MAX = (1 << 128) - 1
+
+def is_valid_ipv6(ip_address: str) -> bool:
+    try:
+        socket.inet_pton(socket.AF_INET6, ip_address)
+    except (OSError, ValueError, TypeError):
+        return False
+    return True
+
+def ipv6_to_int(ip_address: str) -> int:
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_address))
+    except (OSError, ValueError, TypeError):
+        raise ValueError(f"invalid IPV6 address: {ip_address}.")
+
+def int_to_ipv6(address: int) -> str:
+    if not (0 <= address <= IPV6_MAX):
+        raise ValueError(f"IPV6 address must fit in 128 bits: {address}.")
+    return socket.inet_ntop(socket.AF_INET6, address.to_bytes(16))
+
+def prefix_mask6(prefix_length: int) -> int:
+    if not (0 <= prefix_length <= 128):
+        raise ValueError(f"IPV6 prefix length must be between 0 and 128: {prefix_length}.")
+    return (IPV6_MAX << (128 - prefix_length)) & IPV6_MAX
+
+def parse_cidr6(ip_cidr: str) -> IpPrefix:
+    ip, sep, cidr = ip_cidr.partition('/')
+    if not sep:
+        raise ValueError(f"invalid IPV6 CIDR address: {ip_cidr}.")
+    if not (cidr.isascii() and cidr.isdigit()):
+        raise ValueError(f"invalid CIDR prefix length: {cidr}.")
+    mask = prefix_mask6(int(cidr))
+    return IpPrefix(network=ipv6_to_int(ip) & mask, mask=mask)
     
 if __name__ == "__main__":
     import unittest
@@ -49,4 +140,49 @@ if __name__ == "__main__":
 
         def test_get_network_prefix(self):
             self.assertEqual(get_network_prefix("200.23.16.0/23"), "11001000000101110001000")
+
+        def test_ip_to_int(self):
+            self.assertEqual(ip_to_int("192.168.1.1"), int(ip_to_binary("192.168.1.1"), 2))
+            self.assertEqual(int_to_ip(ip_to_int("10.0.255.7")), "10.0.255.7")
+            for invalid in ("1.2.3", "256.1.1.1", "01.2.3.4", " 1.2.3.4", "1.2.3.4/8", "a.b.c.d", ""):
+                with self.assertRaises(ValueError):
+                    ip_to_int(invalid)
+                self.assertFalse(is_valid_ipv4(invalid))
+            self.assertTrue(is_valid_ipv4("0.0.0.0"))
+
+        def test_parse_cidr(self):
+            prefix = parse_cidr("200.23.17.9/23")
+            self.assertEqual(prefix, IpPrefix(network=ip_to_int("200.23.16.0"), mask=0xFFFFFE00))
+            self.assertEqual(prefix.prefix_length, 23)
+            self.assertEqual(f"{prefix.network:032b}"[:prefix.prefix_length], get_network_prefix("200.23.16.0/23"))
+            self.assertEqual(parse_cidr("0.0.0.0/0"), IpPrefix(network=0, mask=0))
+            self.assertTrue(prefix_matches(ip_to_int("200.23.17.255"), prefix))
+            self.assertIn(ip_to_int("200.23.16.1"), prefix)
+            self.assertFalse(prefix_matches(ip_to_int("200.23.18.0"), prefix))
+            for invalid in ("200.23.16.0", "200.23.16.0/33", "200.23.16.0/-1", "200.23.16.0/ 8"):
+                with self.assertRaises(ValueError):
+                    parse_cidr(invalid)
+        def test_ipv6_to_int(self):
+            self.assertEqual(ipv6_to_int("::1"), 1)
+            self.assertEqual(ipv6_to_int("2001:db8::ff00:42:8329"), 0x20010DB8000000000000FF0000428329)
+            self.assertEqual(ipv6_to_int("::ffff:192.0.2.1"), 0xFFFF00000000 | ip_to_int("192.0.2.1"))
+            self.assertEqual(int_to_ipv6(ipv6_to_int("2001:0db8:0000::0001")), "2001:db8::1")
+            for invalid in ("2001:db8::1::1", "1.2.3.4", "2001:db8:::1", "12345::", "g::1", ""):
+                with self.assertRaises(ValueError):
+                    ipv6_to_int(invalid)
+                self.assertFalse(is_valid_ipv6(invalid))
+            with self.assertRaises(ValueError):
+                int_to_ipv6(1 << 128)
+
+        def test_parse_cidr6(self):
+            prefix = parse_cidr6("2001:db8:abcd:12::5/48")
+            self.assertEqual(prefix.network, ipv6_to_int("2001:db8:abcd::"))
+            self.assertEqual(prefix.prefix_length, 48)
+            self.assertTrue(prefix_matches(ipv6_to_int("2001:db8:abcd:ffff::1"), prefix))
+            self.assertFalse(prefix_matches(ipv6_to_int("2001:db8:abce::1"), prefix))
+            self.assertEqual(parse_cidr6("::/0"), IpPrefix(network=0, mask=0))
+            for invalid in ("2001:db8::", "2001:db8::/129", "10.0.0.0/8"):
+                with self.assertRaises(ValueError):
+                    parse_cidr6(invalid)
+
     unittest.main()
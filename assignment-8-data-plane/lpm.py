@@ -0,0 +1,608 @@
+from typing import Iterator, Iterable, Callable
+from abc import ABC, abstractmethod
+from functools import partial
+
+# NOTE:
+# Longest-prefix-match (LPM) lookup engines used by `Router`.
+# Every engine stores prefixes as (network, prefix_length) integer pairs where
+# `network` is the full-width address with the host bits cleared, and returns
+# the link name of the longest matching prefix (or None when nothing matches).
+
+class LookupEngine(ABC):
+    """Base class for the LPM lookup engines.
+
+    Updates are copy-on-write: a batch builds new nodes along the path of each changed
+    prefix (O(prefix length) per update) and publishes them with one assignment of the
+    root, so a concurrent `lookup` sees either the whole batch or none of it. Writers
+    (`insert`, `remove`, `apply_updates`, `items`) must be serialized by the caller.
+    """
+    def __init__(self, width: int = 32) -> None:
+        self.width = width
+        self._routes: dict[tuple[int, int], str] = {}
+        self._version = 0 # nodes created by the running batch carry this, and may be edited in place
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def __contains__(self, prefix: tuple[int, int]) -> bool:
+        return prefix in self._routes
+
+    def items(self) -> Iterator[tuple[int, int, str]]:
+        """Yield every stored route as (network, prefix_length, link_name)."""
+        for (network, prefix_length), link_name in self._routes.items():
+            yield network, prefix_length, link_name
+
+    def insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        """Insert a route, replacing the link of an identical prefix."""
+        self.apply_updates([(network, prefix_length, link_name)])
+
+    def remove(self, network: int, prefix_length: int) -> str | None:
+        """Withdraw a route; returns its link name, or None if it was not stored."""
+        link_name = self._routes.get((network & self.mask(prefix_length), prefix_length))
+        if link_name is not None:
+            self.apply_updates([(network, prefix_length, None)])
+        return link_name
+
+    def apply_updates(self, updates: Iterable[tuple[int, int, str | None]]) -> None:
+        """Apply (network, prefix_length, link_name) updates, where a None link withdraws the prefix."""
+        updates = list(updates)
+        for _, prefix_length, _ in updates:
+            if not (0 <= prefix_length <= self.width):
+                raise ValueError(f"prefix length must be between 0 and {self.width}: {prefix_length}.")
+        self._version += 1
+        self._begin()
+        for network, prefix_length, link_name in updates:
+            network &= self.mask(prefix_length)
+            if link_name is not None:
+                self._routes[network, prefix_length] = link_name
+                self._insert(network, prefix_length, link_name)
+            elif self._routes.pop((network, prefix_length), None) is not None:
+                self._remove(network, prefix_length)
+        self._publish()
+
+    @abstractmethod
+    def lookup(self, address: int) -> str | None:
+        ...
+
+    def mask(self, prefix_length: int) -> int:
+        return ((1 << prefix_length) - 1) << (self.width - prefix_length)
+
+    @abstractmethod
+    def _begin(self) -> None:
+        """Start a batch: take a private, writable root."""
+
+    @abstractmethod
+    def _publish(self) -> None:
+        """End a batch: make the writable root visible to lookups."""
+
+    @abstractmethod
+    def _insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        ...
+
+    @abstractmethod
+    def _remove(self, network: int, prefix_length: int) -> None:
+        ...
+
+
+class LinearScan(LookupEngine):
+    """The original O(routes) scan over a table sorted by prefix length (longest first).
+
+    Every batch re-sorts the whole table; it is kept as the reference implementation.
+    """
+    def __init__(self, width: int = 32) -> None:
+        super().__init__(width)
+        self._table: list[tuple[int, int, str]] = [] # (mask, network, link_name)
+
+    def _begin(self) -> None:
+        pass
+
+    def _insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        pass
+
+    def _remove(self, network: int, prefix_length: int) -> None:
+        pass
+
+    def _publish(self) -> None:
+        self._table = sorted(
+            (
+                (self.mask(length), prefix, link)
+                for (prefix, length), link in self._routes.items()
+            ),
+            key=lambda x: x[0],
+            reverse=True # Longest prefix first
+        )
+
+    def lookup(self, address: int) -> str | None:
+        for mask, network, link_name in self._table:
+            if address & mask == network:
+                return link_name
+        return None
+
+
+class _TrieNode:
+    __slots__ = ('network', 'prefix_length', 'shift', 'link_name', 'children', 'version')
+    def __init__(self, network: int, prefix_length: int, width: int, version: int, link_name: str | None = None) -> None:
+        self.network = network
+        self.prefix_length = prefix_length
+        self.shift = width - prefix_length
+        self.link_name = link_name
+        self.children: list[_TrieNode | None] = [None, None]
+        self.version = version
+
+    def copy(self, version: int) -> "_TrieNode":
+        node = _TrieNode.__new__(_TrieNode)
+        node.network = self.network
+        node.prefix_length = self.prefix_length
+        node.shift = self.shift
+        node.link_name = self.link_name
+        node.children = self.children.copy()
+        node.version = version
+        return node
+
+
+class BinaryTrie(LookupEngine):
+    """Path-compressed binary trie: one node per stored prefix or branching point."""
+    def __init__(self, width: int = 32) -> None:
+        super().__init__(width)
+        self._root: _TrieNode | None = None
+        self._next_root: _TrieNode | None = None
+
+    def _bit(self, value: int, position: int) -> int:
+        return (value >> (self.width - 1 - position)) & 1
+
+    def _writable(self, node: _TrieNode) -> _TrieNode:
+        return node if node.version == self._version else node.copy(self._version)
+
+    def _begin(self) -> None:
+        self._next_root = self._root
+
+    def _publish(self) -> None:
+        self._root = self._next_root
+
+    def _attach(self, parent: _TrieNode | None, bit: int, node: _TrieNode | None) -> None:
+        if parent is None:
+            self._next_root = node
+        else:
+            parent.children[bit] = node
+
+    def _insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        width, version = self.width, self._version
+        parent: _TrieNode | None = None
+        parent_bit = 0
+        node = self._next_root
+        while True:
+            if node is None:
+                node = _TrieNode(network, prefix_length, width, version, link_name)
+                break
+            diff = node.network ^ network
+            common = min(width - diff.bit_length(), node.prefix_length, prefix_length)
+            if common == node.prefix_length == prefix_length:
+                node = self._writable(node)
+                node.link_name = link_name
+                break
+            if common == node.prefix_length: # node is an ancestor, keep walking
+                node = self._writable(node)
+                self._attach(parent, parent_bit, node)
+                parent, parent_bit = node, self._bit(network, common)
+                node = node.children[parent_bit]
+                continue
+            leaf = _TrieNode(network, prefix_length, width, version, link_name)
+            if common == prefix_length: # new prefix is an ancestor of node
+                leaf.children[self._bit(node.network, common)] = node
+                node = leaf
+            else: # split at the first differing bit
+                glue = _TrieNode(network & self.mask(common), common, width, version)
+                glue.children[self._bit(network, common)] = leaf
+                glue.children[self._bit(node.network, common)] = node
+                node = glue
+            break
+        self._attach(parent, parent_bit, node)
+
+    def _remove(self, network: int, prefix_length: int) -> None:
+        # the prefix is known to be stored, so the walk always ends on its node
+        path: list[tuple[_TrieNode | None, int]] = [(None, 0)] # (writable parent, bit) above each node
+        node = self._next_root
+        while node.prefix_length != prefix_length:
+            node = self._writable(node)
+            self._attach(*path[-1], node)
+            bit = self._bit(network, node.prefix_length)
+            path.append((node, bit))
+            node = node.children[bit]
+        parent, bit = path[-1]
+        left, right = node.children
+        if left is not None and right is not None: # still a branching point
+            node = self._writable(node)
+            node.link_name = None
+            self._attach(parent, bit, node)
+            return
+        self._attach(parent, bit, left or right)
+        if parent is not None and parent.link_name is None and left is None and right is None:
+            # the parent was a branching point with this node as one of its two children
+            self._attach(*path[-2], parent.children[bit ^ 1])
+
+    def lookup(self, address: int) -> str | None:
+        top = self.width - 1
+        best: str | None = None
+        node = self._root
+        while node is not None:
+            if (address ^ node.network) >> node.shift:
+                break
+            if node.link_name is not None:
+                best = node.link_name
+            if node.shift == 0:
+                break
+            node = node.children[(address >> (top - node.prefix_length)) & 1]
+        return best
+
+
+class _StrideNode:
+    __slots__ = ('links', 'lengths', 'children', 'version')
+    def __init__(self, size: int, version: int) -> None:
+        self.links: list[str | None] = [None] * size
+        self.lengths: list[int] = [-1] * size # prefix length behind each expanded slot
+        self.children: list[_StrideNode | None] = [None] * size
+        self.version = version
+
+    def copy(self, version: int) -> "_StrideNode":
+        node = _StrideNode.__new__(_StrideNode)
+        node.links = self.links.copy()
+        node.lengths = self.lengths.copy()
+        node.children = self.children.copy()
+        node.version = version
+        return node
+
+    def is_empty(self) -> bool:
+        return not any(self.children) and all(link is None for link in self.links)
+
+
+class StrideTrie(LookupEngine):
+    """Multibit trie with controlled prefix expansion; a lookup costs one list index per stride."""
+    def __init__(self, width: int = 32, strides: tuple[int, ...] = (8, 8, 8, 8)) -> None:
+        if sum(strides) != width:
+            raise ValueError(f"strides must add up to the address width {width}: {strides}.")
+        super().__init__(width)
+        self.strides = strides
+        self._levels: list[tuple[int, int, int]] = [] # (depth, shift, stride mask) per level
+        depth = 0
+        for stride in strides:
+            self._levels.append((depth, width - depth - stride, (1 << stride) - 1))
+            depth += stride
+        self._root = self._next_root = self._new_root()
+
+    def _new_root(self) -> _StrideNode:
+        return _StrideNode(1 << self.strides[0], self._version)
+
+    def _writable(self, node: _StrideNode) -> _StrideNode:
+        return node if node.version == self._version else node.copy(self._version)
+
+    def _begin(self) -> None:
+        self._next_root = self._writable(self._root)
+
+    def _publish(self) -> None:
+        self._root = self._next_root
+
+    def _insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        node = self._next_root
+        for level, (depth, shift, stride_mask) in enumerate(self._levels):
+            stride = self.strides[level]
+            index = (network >> shift) & stride_mask
+            if prefix_length <= depth + stride:
+                # expand the prefix over every slot it covers in this node
+                for slot in range(index, index + (1 << (depth + stride - prefix_length))):
+                    if node.lengths[slot] <= prefix_length:
+                        node.links[slot] = link_name
+                        node.lengths[slot] = prefix_length
+                return
+            child = node.children[index]
+            if child is None:
+                child = _StrideNode(1 << self.strides[level + 1], self._version)
+            else:
+                child = self._writable(child)
+            node.children[index] = child
+            node = child
+
+    def _remove(self, network: int, prefix_length: int) -> None:
+        path: list[tuple[_StrideNode, int]] = [] # (writable parent, index) above each node
+        node = self._next_root
+        for level, (depth, shift, stride_mask) in enumerate(self._levels):
+            stride = self.strides[level]
+            index = (network >> shift) & stride_mask
+            if prefix_length <= depth + stride:
+                break
+            child = self._writable(node.children[index])
+            node.children[index] = child
+            path.append((node, index))
+            node = child
+        # Slots the prefix expanded into fall back to the longest shorter prefix stored
+        # in this same node; shorter ones live in ancestors and are found by the lookup.
+        link_name, fallback_length = None, -1
+        for length in range(prefix_length - 1, depth if depth else -1, -1):
+            link_name = self._routes.get((network & self.mask(length), length))
+            if link_name is not None:
+                fallback_length = length
+                break
+        for slot in range(index, index + (1 << (depth + stride - prefix_length))):
+            if node.lengths[slot] == prefix_length:
+                node.links[slot] = link_name
+                node.lengths[slot] = fallback_length
+        for parent, index in reversed(path): # prune nodes left without routes
+            if not parent.children[index].is_empty():
+                break
+            parent.children[index] = None
+
+    def lookup(self, address: int) -> str | None:
+        best: str | None = None
+        node: _StrideNode | None = self._root
+        for _, shift, stride_mask in self._levels:
+            index = (address >> shift) & stride_mask
+            link_name = node.links[index]
+            if link_name is not None:
+                best = link_name
+            node = node.children[index]
+            if node is None:
+                break
+        return best
+
+
+class _SparseStrideNode:
+    __slots__ = ('links', 'lengths', 'children', 'version')
+    def __init__(self, version: int) -> None:
+        self.links: dict[int, str] = {}
+        self.lengths: dict[int, int] = {} # prefix length behind each expanded slot
+        self.children: dict[int, _SparseStrideNode] = {}
+        self.version = version
+
+    def copy(self, version: int) -> "_SparseStrideNode":
+        node = _SparseStrideNode.__new__(_SparseStrideNode)
+        node.links = self.links.copy()
+        node.lengths = self.lengths.copy()
+        node.children = self.children.copy()
+        node.version = version
+        return node
+
+    def is_empty(self) -> bool:
+        return not self.links and not self.children
+
+
+class SparseStrideTrie(StrideTrie):
+    """Multibit trie whose nodes are dicts holding only the occupied slots.
+
+    Meant for IPv6, where dense nodes could not afford the memory. The default 8-bit
+    strides put a level boundary every 8 bits, so the common prefix lengths (/32, /40,
+    /48, /56, /64) fill one slot and any prefix expands into at most 128 slots. A node
+    holds at most 256 slots, so the copy-on-write of a batch copies at most 256 entries
+    per level on the path of each update, whatever the size of the table. Wider strides
+    save probes per lookup but make every update copy the whole (up to 2**stride slot)
+    nodes it touches, the root included.
+    """
+    def __init__(self, width: int = 128, strides: tuple[int, ...] | None = None) -> None:
+        if strides is None:
+            strides = (8,) * (width // 8)
+        super().__init__(width, strides)
+
+    def _new_root(self) -> _SparseStrideNode:
+        return _SparseStrideNode(self._version)
+
+    def _insert(self, network: int, prefix_length: int, link_name: str) -> None:
+        node = self._next_root
+        for level, (depth, shift, stride_mask) in enumerate(self._levels):
+            stride = self.strides[level]
+            index = (network >> shift) & stride_mask
+            if prefix_length <= depth + stride:
+                lengths, links = node.lengths, node.links
+                for slot in range(index, index + (1 << (depth + stride - prefix_length))):
+                    if lengths.get(slot, -1) <= prefix_length:
+                        links[slot] = link_name
+                        lengths[slot] = prefix_length
+                return
+            child = node.children.get(index)
+            if child is None:
+                child = _SparseStrideNode(self._version)
+            else:
+                child = self._writable(child)
+            node.children[index] = child
+            node = child
+
+    def _remove(self, network: int, prefix_length: int) -> None:
+        path: list[tuple[_SparseStrideNode, int]] = []
+        node = self._next_root
+        for level, (depth, shift, stride_mask) in enumerate(self._levels):
+            stride = self.strides[level]
+            index = (network >> shift) & stride_mask
+            if prefix_length <= depth + stride:
+                break
+            child = self._writable(node.children[index])
+            node.children[index] = child
+            path.append((node, index))
+            node = child
+        link_name, fallback_length = None, -1
+        for length in range(prefix_length - 1, depth if depth else -1, -1):
+            link_name = self._routes.get((network & self.mask(length), length))
+            if link_name is not None:
+                fallback_length = length
+                break
+        for slot in range(index, index + (1 << (depth + stride - prefix_length))):
+            if node.lengths.get(slot) == prefix_length:
+                if link_name is None:
+                    del node.links[slot], node.lengths[slot]
+                else:
+                    node.links[slot] = link_name
+                    node.lengths[slot] = fallback_length
+        for parent, index in reversed(path):
+            if not parent.children[index].is_empty():
+                break
+            del parent.children[index]
+
+    def lookup(self, address: int) -> str | None:
+        best: str | None = None
+        node: _SparseStrideNode | None = self._root
+        for _, shift, stride_mask in self._levels:
+            index = (address >> shift) & stride_mask
+            link_name = node.links.get(index)
+            if link_name is not None:
+                best = link_name
+            node = node.children.get(index)
+            if node is None:
+                break
+        return best
+
+
+ENGINES: dict[str, type[LookupEngine]] = {
+    'linear': LinearScan,
+    'binary': BinaryTrie,
+    'stride': StrideTrie,
+}
+
+# engine factories for 128-bit (IPv6) addresses
+ENGINES6: dict[str, Callable[[], LookupEngine]] = {
+    'binary': partial(BinaryTrie, width=128),
+    'sparse-stride': SparseStrideTrie,
+}
+
+if __name__ == "__main__":
+    import random
+    import unittest
+
+    def random_table(count: int, seed: int = 0) -> list[tuple[int, int, str]]:
+        rng = random.Random(seed)
+        table: list[tuple[int, int, str]] = []
+        for i in range(count):
+            prefix_length = rng.choice([0, 1, 7, 8, 9, 15, 16, 17, 20, 23, 24, 24, 24, 25, 31, 32])
+            table.append((rng.getrandbits(32), prefix_length, f"Link {i % 13}"))
+        return table
+
+    class TestLookupEngines(unittest.TestCase):
+        def setUp(self):
+            self.routes = [
+                (0xDF010100, 24, "Link 0"), # 223.1.1.0/24
+                (0xDF010200, 24, "Link 1"), # 223.1.2.0/24
+                (0xDF010300, 24, "Link 2"), # 223.1.3.0/24
+                (0xDF010000, 16, "Link 4 (ISP)"), # 223.1.0.0/16
+            ]
+
+        def test_small_table(self):
+            for engine_cls in ENGINES.values():
+                engine = engine_cls()
+                for route in self.routes:
+                    engine.insert(*route)
+                with self.subTest(engine=engine_cls.__name__):
+                    self.assertEqual(engine.lookup(0xDF010164), "Link 0") # 223.1.1.100
+                    self.assertEqual(engine.lookup(0xDF010205), "Link 1") # 223.1.2.5
+                    self.assertEqual(engine.lookup(0xDF01FA01), "Link 4 (ISP)") # 223.1.250.1
+                    self.assertIsNone(engine.lookup(0xC6336401)) # 198.51.100.1
+
+        def test_engines_agree_with_linear_scan(self):
+            table = random_table(2000)
+            engines = [engine_cls() for engine_cls in ENGINES.values()]
+            for engine in engines:
+                for route in table:
+                    engine.insert(*route)
+            rng = random.Random(1)
+            addresses = [rng.getrandbits(32) for _ in range(5000)]
+            # also probe addresses inside and at the edges of stored prefixes
+            addresses += [network for network, _, _ in table]
+            addresses += [network | (engines[0].mask(length) ^ 0xFFFFFFFF) for network, length, _ in table]
+            reference, *others = engines
+            for address in addresses:
+                expected = reference.lookup(address)
+                for engine in others:
+                    self.assertEqual(engine.lookup(address), expected, f"{type(engine).__name__} {address:#010x}")
+
+        def test_duplicate_prefix_replaces_link(self):
+            for engine_cls in ENGINES.values():
+                engine = engine_cls()
+                engine.insert(0x0A000000, 8, "Link A")
+                engine.insert(0x0A000000, 8, "Link B")
+                self.assertEqual(engine.lookup(0x0A010203), "Link B")
+                self.assertEqual(len(engine), 1)
+
+        def test_random_updates_agree_with_linear_scan(self):
+            rng = random.Random(2)
+            table = random_table(600, seed=3)
+            engines = [engine_cls() for engine_cls in ENGINES.values()]
+            reference, *others = engines
+            for _ in range(40):
+                batch = []
+                for _ in range(rng.randint(1, 30)):
+                    network, prefix_length, link_name = rng.choice(table)
+                    if rng.random() < 0.4:
+                        link_name = None # withdraw, possibly a prefix that is not stored
+                    batch.append((network, prefix_length, link_name))
+                for engine in engines:
+                    engine.apply_updates(batch)
+                self.assertEqual({*reference.items()}, {*others[0].items()})
+                for address in [rng.getrandbits(32) for _ in range(300)] + [network for network, _, _ in table]:
+                    expected = reference.lookup(address)
+                    for engine in others:
+                        self.assertEqual(engine.lookup(address), expected, f"{type(engine).__name__} {address:#010x}")
+
+        def test_withdraw_all_routes(self):
+            table = random_table(500, seed=4)
+            for engine_cls in (BinaryTrie, StrideTrie):
+                engine = engine_cls()
+                engine.apply_updates(table)
+                for network, prefix_length, _ in table:
+                    engine.remove(network, prefix_length)
+                self.assertEqual(len(engine), 0)
+                self.assertIsNone(engine.lookup(0xDF010164))
+                if engine_cls is BinaryTrie:
+                    self.assertIsNone(engine._root)
+                else:
+                    self.assertTrue(engine._root.is_empty())
+
+        def test_remove_returns_link(self):
+            for engine_cls in ENGINES.values():
+                engine = engine_cls()
+                engine.apply_updates(self.routes)
+                self.assertEqual(engine.remove(0xDF010105, 24), "Link 0") # host bits are ignored
+                self.assertIsNone(engine.remove(0xDF010100, 24))
+                self.assertEqual(engine.lookup(0xDF010164), "Link 4 (ISP)")
+
+        def test_batch_leaves_published_version_untouched(self):
+            table = random_table(300, seed=5)
+            addresses = [network for network, _, _ in table]
+            for engine_cls in (BinaryTrie, StrideTrie):
+                engine = engine_cls()
+                engine.apply_updates(table[:200])
+                old_root = engine._root
+                before = [engine.lookup(address) for address in addresses]
+                engine.apply_updates([*table[200:], *((network, length, None) for network, length, _ in table[:100])])
+                new_root, engine._root = engine._root, old_root
+                self.assertEqual([engine.lookup(address) for address in addresses], before)
+                engine._root = new_root
+
+        def test_ipv6_engines_agree_with_linear_scan(self):
+            rng = random.Random(6)
+            table = []
+            for i in range(1500):
+                prefix_length = rng.choice([0, 16, 29, 32, 32, 40, 44, 48, 48, 48, 56, 64, 64, 65, 128])
+                table.append(((0x2001 << 112) | rng.getrandbits(112 if i % 2 else 100), prefix_length, f"Link {i % 11}"))
+            reference = LinearScan(width=128)
+            engines = [BinaryTrie(width=128), SparseStrideTrie(), SparseStrideTrie(strides=(16, 16, 8, 8, 8, 8, 8, 8, 16, 16, 16)), StrideTrie(width=128, strides=(8,) * 16)]
+            for engine in (reference, *engines):
+                engine.apply_updates(table[:1000])
+                engine.apply_updates([*table[1000:], *((network, length, None) for network, length, _ in table[:300])])
+            addresses = [rng.getrandbits(128) for _ in range(500)] + [network | rng.getrandbits(8) for network, _, _ in table]
+            for address in addresses:
+                expected = reference.lookup(address)
+                for engine in engines:
+                    self.assertEqual(engine.lookup(address), expected, f"{type(engine).__name__} {address:#034x}")
+
+        def test_sparse_stride_trie_prunes(self):
+            engine = SparseStrideTrie()
+            table = [((0x2001 << 112) | (i << 64), 64, "Link 0") for i in range(50)] + [(0x2001 << 112, 16, "Link 1")]
+            engine.apply_updates(table)
+            engine.apply_updates((network, length, None) for network, length, _ in table)
+            self.assertTrue(engine._root.is_empty())
+
+        def test_incomplete_engine_is_abstract(self):
+            class NoRemove(LinearScan):
+                _remove = LookupEngine._remove
+            with self.assertRaises(TypeError):
+                NoRemove()
+
+        def test_invalid_strides(self):
+            with self.assertRaises(ValueError):
+                StrideTrie(strides=(8, 8, 8))
+
+    unittest.main()
@@ -0,0 +1,187 @@
+from array import array
+from scheduler import Packet, CompactPacket, AnyPacket, single_flow
+from ip_utils import ip_to_int, ipv6_to_int
+
+# NOTE:
+# PACKET RING LAYOUT (struct of arrays, `maxsize` slots, slot i = i-th queued packet mod maxsize)
+# priorities  bytearray   [maxsize]
+# flags       bytearray   [maxsize]  bit 0 => IPv6
+# addresses   array('Q')  [4 * maxsize]  source high, source low, dest high, dest low 64 bits (IPv4: low words only)
+# offsets     array('I')  [maxsize]  payload start in the arena
+# lengths     array('I')  [maxsize]
+# arena       bytearray   [payload_capacity]  payloads, written as a byte ring in FIFO order
+
+_LOW_64 = (1 << 64) - 1
+
+class PacketRing:
+    """FIFO packet buffer stored as a struct of arrays, so a queued packet costs no Python objects.
+
+    Accepts `Packet`s and `CompactPacket`s and always returns `CompactPacket`s, whose
+    payload is copied out of the arena. Drop policy is tail drop once `maxsize` packets
+    or `payload_capacity` payload bytes (default `maxsize` * 1500) are buffered. A payload
+    that does not fit before the end of the arena is written at its start, leaving the
+    end unused until the ring wraps.
+
+    Every push and pop copies fields in and out one at a time, so the ring costs more CPU
+    per packet than a deque of packet objects; it pays off when deep buffers dominate memory.
+    """
+    flow_key = staticmethod(single_flow)
+
+    def __init__(self, maxsize: int = 1024, payload_capacity: int | None = None) -> None:
+        if maxsize < 1:
+            raise ValueError(f"queue size must be positive: {maxsize}.")
+        self.maxsize = maxsize
+        self.payload_capacity = maxsize * 1500 if payload_capacity is None else payload_capacity
+        self._priorities = bytearray(maxsize)
+        self._flags = bytearray(maxsize)
+        self._addresses = array('Q', bytes(32 * maxsize))
+        self._offsets = array('I', bytes(4 * maxsize))
+        self._lengths = array('I', bytes(4 * maxsize))
+        self._arena = memoryview(bytearray(self.payload_capacity)) # slicing a memoryview does not copy
+        self._head = 0 # oldest slot
+        self._size = 0
+        self._tail_byte = 0 # next payload byte to write
+        self._wrapped = False # payloads run from the head to the end of the arena, then from 0 to `_tail_byte`
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, pkt: AnyPacket) -> bool:
+        if self._size == self.maxsize:
+            return False
+        if isinstance(pkt, CompactPacket):
+            source, dest, ipv6, payload = pkt.source, pkt.dest, pkt.ipv6, pkt.payload
+        else:
+            ipv6 = ':' in pkt.dest_ip
+            to_int = ipv6_to_int if ipv6 else ip_to_int
+            source, dest, payload = to_int(pkt.source_ip), to_int(pkt.dest_ip), pkt.payload.encode()
+        length = len(payload)
+        offset = self._allocate(length)
+        if offset is None:
+            return False
+        slot = self._head + self._size
+        if slot >= self.maxsize:
+            slot -= self.maxsize
+        self._priorities[slot] = pkt.priority
+        self._flags[slot] = ipv6
+        i = 4 * slot
+        if ipv6:
+            self._addresses[i:i + 4] = array('Q', (source >> 64, source & _LOW_64, dest >> 64, dest & _LOW_64))
+        else:
+            addresses = self._addresses
+            addresses[i + 1] = source
+            addresses[i + 3] = dest
+        self._offsets[slot] = offset
+        self._lengths[slot] = length
+        self._arena[offset:offset + length] = payload
+        self._size += 1
+        return True
+
+    def pop(self) -> CompactPacket:
+        if not self._size:
+            raise IndexError("pop from empty packet ring.")
+        slot = self._head
+        offset = self._offsets[slot]
+        payload = self._arena[offset:offset + self._lengths[slot]].tobytes()
+        i = 4 * slot
+        if self._flags[slot]:
+            high_source, source, high_dest, dest = self._addresses[i:i + 4]
+            pkt = CompactPacket(self._priorities[slot], high_source << 64 | source, high_dest << 64 | dest, payload, True)
+        else:
+            addresses = self._addresses
+            pkt = CompactPacket(self._priorities[slot], addresses[i + 1], addresses[i + 3], payload)
+        slot += 1
+        self._head = 0 if slot == self.maxsize else slot
+        self._size -= 1
+        if not self._size:
+            self._tail_byte = 0
+            self._wrapped = False
+        elif self._wrapped and self._offsets[self._head] < offset:
+            self._wrapped = False # the oldest payload is back at the start of the arena
+        return pkt
+
+    def _allocate(self, length: int) -> int | None:
+        tail = self._tail_byte
+        head = self._offsets[self._head] if self._size else 0
+        if self._wrapped:
+            if head - tail < length:
+                return None
+        elif self.payload_capacity - tail < length:
+            if head < length:
+                return None
+            tail = 0
+            self._wrapped = True
+        self._tail_byte = tail + length
+        return tail
+
+if __name__ == "__main__":
+    import asyncio
+    import random
+    import unittest
+    from scheduler import Priority, fifo_scheduler, serve_queues, PriorityQueues, DeficitRoundRobinQueues, by_flow
+
+    class TestPacketRing(unittest.TestCase):
+        def test_compact_packet(self):
+            pkt = Packet(priority=Priority.MEDIUM, source_ip="2001:db8:1::7", dest_ip="2001:db8::1", payload="Video Packet 1")
+            compact = CompactPacket.from_packet(pkt)
+            self.assertEqual((compact.dest_ip, compact.ipv6, compact.payload), ("2001:db8::1", True, b"Video Packet 1"))
+            self.assertEqual(compact.to_packet(), pkt)
+            self.assertEqual(CompactPacket.from_packet(compact.to_packet()), compact)
+            self.assertFalse(hasattr(compact, '__dict__'))
+            self.assertEqual(len({compact, CompactPacket.from_packet(pkt)}), 1)
+            v4 = CompactPacket(0, 1, 2, b"")
+            v6 = CompactPacket(0, 1, 2, b"", ipv6=True)
+            self.assertNotEqual(by_flow(v4), by_flow(v6))
+
+        def test_fifo_order_and_wrap_around(self):
+            rng = random.Random(0)
+            ring = PacketRing(maxsize=16, payload_capacity=4_000)
+            expected: list[CompactPacket] = []
+            for i in range(5_000):
+                if rng.random() < 0.55:
+                    bits = 128 if i % 2 else 32
+                    pkt = CompactPacket(i % 3, rng.getrandbits(bits), rng.getrandbits(bits), rng.randbytes(rng.randint(0, 1_500)), ipv6=bits == 128)
+                    if ring.push(pkt):
+                        expected.append(pkt)
+                    else:
+                        # full, or the free bytes are split by at most one unused arena tail (< one payload)
+                        self.assertTrue(len(ring) == 16 or sum(len(pkt.payload) for pkt in expected) + len(pkt.payload) > 4_000 - 1_500)
+                elif ring:
+                    self.assertEqual(ring.pop(), expected.pop(0))
+                self.assertEqual(len(ring), len(expected))
+            while ring:
+                self.assertEqual(ring.pop(), expected.pop(0))
+            with self.assertRaises(IndexError):
+                ring.pop()
+
+        def test_schedulers_accept_both_representations(self):
+            rng = random.Random(1)
+            packets = [
+                Packet(priority=Priority(i % 3), source_ip=f"10.0.{i % 5}.1", dest_ip="10.1.0.1", payload="x" * rng.randint(64, 1_500))
+                for i in range(300)
+            ]
+            compact = [CompactPacket.from_packet(pkt) for pkt in packets]
+            def drain(pkt_queues, packets):
+                for pkt in packets:
+                    self.assertTrue(pkt_queues.push(pkt))
+                return [pkt_queues.pop() for _ in packets]
+            for make_queues in (lambda: PriorityQueues(maxsize=300), lambda: DeficitRoundRobinQueues(maxsize=300, flow_key=by_flow)):
+                self.assertEqual([CompactPacket.from_packet(pkt) for pkt in drain(make_queues(), packets)], drain(make_queues(), compact))
+            self.assertEqual(drain(PacketRing(maxsize=300), packets), compact) # a ring returns compact packets
+            received: list[CompactPacket] = []
+            async def pkt_reader_callback(pkt: CompactPacket):
+                received.append(pkt)
+            async def run():
+                async def packet_stream():
+                    for pkt in compact:
+                        yield pkt
+                await serve_queues(packet_stream(), pkt_reader_callback, PacketRing(maxsize=300))
+                async def mixed_stream():
+                    for pkt, other in zip(packets, compact):
+                        yield pkt if other.priority else other
+                await fifo_scheduler(mixed_stream(), pkt_reader_callback, maxsize=300)
+            asyncio.run(run())
+            self.assertEqual(received[:300], compact)
+            self.assertEqual([pkt if isinstance(pkt, CompactPacket) else CompactPacket.from_packet(pkt) for pkt in received[300:]], compact)
+
+    unittest.main()
@@ -0,0 +1,232 @@
+from typing import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import multiprocessing
+import os
+import threading
+import numpy as np
+from fib import CompiledFib
+from router import Router, RouteUpdate, AddressBatch, to_address_array
+
+# NOTE:
+# SHARED MEMORY SEGMENTS
+# table => the compiled forwarding table in the snapshot layout (see fib.py),
+#          one segment per published route table generation
+# io    => one per batch: n input addresses (uint32) followed by n link ids (uint32);
+#          every worker task reads and writes its own [start, end) slice in place
+
+# Worker side: the table segment this process attached to last.
+_worker_table: tuple[str, SharedMemory, CompiledFib] | None = None
+
+def _attach_table(name: str) -> CompiledFib:
+    global _worker_table
+    if _worker_table is not None:
+        if _worker_table[0] == name:
+            return _worker_table[2]
+        old_segment = _worker_table[1]
+        _worker_table = None # release the arrays viewing the old segment before closing it
+        old_segment.close()
+    segment = SharedMemory(name=name, track=False)
+    fib = CompiledFib.from_buffer(segment.buf)
+    _worker_table = (name, segment, fib)
+    return fib
+
+def _route_chunk(table_name: str, io_name: str, count: int, start: int, end: int) -> None:
+    fib = _attach_table(table_name)
+    io_segment = SharedMemory(name=io_name, track=False)
+    try:
+        addresses = np.ndarray((end - start,), dtype=np.uint32, buffer=io_segment.buf, offset=4 * start)
+        link_ids = np.ndarray((end - start,), dtype=np.uint32, buffer=io_segment.buf, offset=4 * (count + start))
+        link_ids[:] = fib.lookup_batch(addresses)
+        del addresses, link_ids
+    finally:
+        io_segment.close()
+
+
+class ParallelRouter:
+    """Fans `Router.route_packets` batches out to a pool of worker processes.
+
+    The compiled table is published once into shared memory and every worker maps it,
+    so nothing per-route is pickled. Addresses and results also travel through shared
+    memory; each worker fills its own slice of the result array, so results come back
+    in input order. A route update publishes a new table segment: batches already
+    running finish on the table they started with, later batches use the new one, and
+    a segment is unlinked once no batch uses it. Updates applied straight to the wrapped
+    `router` are picked up too: a batch that finds the router at a newer generation than
+    the published table republishes it first. Without `chunk_size` a batch is split
+    evenly over the workers.
+    """
+    def __init__(self, router: Router, workers: int | None = None, chunk_size: int | None = None) -> None:
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError(f"chunk size must be positive: {chunk_size}.")
+        self.router = router
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        # forkserver where available: workers never inherit this process's threads or locks
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(start_method))
+        self._update_lock = threading.Lock() # serializes route updates
+        self._table_lock = threading.Lock() # guards the published table and its reader counts
+        self._segments: dict[str, SharedMemory] = {}
+        self._readers: dict[str, int] = {}
+        self._table: tuple[str, list[str], int] | None = None # (segment name, link names, router generation)
+        with self._update_lock:
+            self._publish()
+
+    def __enter__(self) -> "ParallelRouter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        with self._table_lock:
+            for segment in self._segments.values():
+                segment.close()
+                segment.unlink()
+            self._segments.clear()
+            self._readers.clear()
+            self._table = None
+
+    def route_packet(self, dest_ip: str) -> str:
+        return self.router.route_packet(dest_ip)
+
+    def route_packets(self, addresses: AddressBatch) -> tuple[np.ndarray, list[str]]:
+        """Same contract as `Router.route_packets`, computed by the worker processes."""
+        address_array = to_address_array(addresses)
+        count = len(address_array)
+        chunk_size = self.chunk_size or max(1, -(-count // self.workers))
+        table = self._table
+        if table is not None and table[2] != self.router.generation:
+            with self._update_lock:
+                table = self._table
+                if table is not None and table[2] != self.router.generation:
+                    self._publish()
+        with self._table_lock:
+            if self._table is None:
+                raise RuntimeError("parallel router is closed.")
+            table_name, link_names, _ = self._table
+            self._readers[table_name] += 1
+        try:
+            io_segment = SharedMemory(create=True, size=max(8 * count, 1))
+            try:
+                inputs = np.ndarray((count,), dtype=np.uint32, buffer=io_segment.buf)
+                inputs[:] = address_array
+                futures = [
+                    self._executor.submit(_route_chunk, table_name, io_segment.name, count, start, min(start + chunk_size, count))
+                    for start in range(0, count, chunk_size)
+                ]
+                for future in futures:
+                    future.result()
+                link_ids = np.ndarray((count,), dtype=np.uint32, buffer=io_segment.buf, offset=4 * count).copy()
+                del inputs
+            finally:
+                io_segment.close()
+                io_segment.unlink()
+        finally:
+            with self._table_lock:
+                self._readers[table_name] -= 1
+                self._retire_unused()
+        return link_ids, link_names
+
+    def add_route(self, ip_cidr: str, link_name: str) -> None:
+        self.apply_updates([RouteUpdate(ip_cidr=ip_cidr, link_name=link_name)])
+
+    def withdraw_route(self, ip_cidr: str) -> bool:
+        with self._update_lock:
+            withdrawn = self.router.withdraw_route(ip_cidr)
+            if withdrawn:
+                self._publish()
+        return withdrawn
+
+    def apply_updates(self, updates: Iterable[RouteUpdate | tuple[str, str | None]]) -> None:
+        with self._update_lock:
+            self.router.apply_updates(updates)
+            self._publish()
+
+    def _publish(self) -> None:
+        generation = self.router.generation # read first: a racing update only makes the next batch republish
+        fib = self.router.fib
+        data = fib.to_bytes()
+        segment = SharedMemory(create=True, size=len(data))
+        segment.buf[:len(data)] = data
+        with self._table_lock:
+            self._segments[segment.name] = segment
+            self._readers[segment.name] = 0
+            self._table = (segment.name, fib.link_names, generation)
+            self._retire_unused()
+
+    def _retire_unused(self) -> None:
+        current = self._table[0] if self._table is not None else None
+        for name in [name for name, readers in self._readers.items() if readers == 0 and name != current]:
+            del self._readers[name]
+            segment = self._segments.pop(name)
+            segment.close()
+            segment.unlink()
+
+if __name__ == "__main__":
+    import random
+    import unittest
+    from benchmark import synthetic_routes
+
+    class TestParallelRouter(unittest.TestCase):
+        @classmethod
+        def setUpClass(cls):
+            cls.router = Router(synthetic_routes(5_000))
+            cls.parallel = ParallelRouter(cls.router, workers=2, chunk_size=10_000)
+
+        @classmethod
+        def tearDownClass(cls):
+            cls.parallel.close()
+
+        def test_matches_router(self):
+            addresses = np.random.default_rng(0).integers(0, 1 << 32, size=55_555, dtype=np.uint32)
+            expected_ids, expected_names = self.router.route_packets(addresses)
+            link_ids, link_names = self.parallel.route_packets(addresses)
+            self.assertEqual(
+                [link_names[i] for i in link_ids.tolist()],
+                [expected_names[i] for i in expected_ids.tolist()]
+            )
+            self.assertEqual(len(self.parallel.route_packets([])[0]), 0)
+            link_ids, link_names = self.parallel.route_packets(["223.1.1.1", "198.51.100.1"])
+            self.assertEqual([link_names[i] for i in link_ids], [self.router.route_packet("223.1.1.1"), self.router.route_packet("198.51.100.1")])
+
+        def test_updates_on_wrapped_router(self):
+            addresses = ["223.1.1.1", "10.9.9.9"]
+            with ParallelRouter(Router([("10.0.0.0/8", "Link A")]), workers=1) as parallel:
+                parallel.router.add_route("223.1.1.0/24", "Link B")
+                link_ids, link_names = parallel.route_packets(addresses)
+                self.assertEqual([link_names[i] for i in link_ids], ["Link B", "Link A"])
+                parallel.router.withdraw_route("10.0.0.0/8")
+                link_ids, link_names = parallel.route_packets(addresses)
+                self.assertEqual([link_names[i] for i in link_ids], ["Link B", "Default Gateway"])
+                self.assertEqual(len(parallel._segments), 1)
+
+        def test_updates_while_batches_run(self):
+            addresses = np.random.default_rng(1).integers(0, 1 << 32, size=40_000, dtype=np.uint32)
+            rng = random.Random(2)
+            updates = [("0.0.0.0/1", f"Link U{i}") for i in range(8)]
+            results: list[list[str]] = []
+            def run_batches():
+                for _ in range(6):
+                    link_ids, link_names = self.parallel.route_packets(addresses)
+                    results.append([link_names[i] for i in link_ids.tolist()])
+            thread = threading.Thread(target=run_batches)
+            thread.start()
+            expected: list[list[str]] = []
+            for update in updates:
+                link_ids, link_names = self.router.route_packets(addresses)
+                expected.append([link_names[i] for i in link_ids.tolist()])
+                self.parallel.apply_updates([update])
+                threading.Event().wait(rng.random() / 50)
+            link_ids, link_names = self.router.route_packets(addresses)
+            expected.append([link_names[i] for i in link_ids.tolist()])
+            thread.join()
+            for result in results: # every batch saw exactly one table generation
+                self.assertIn(result, expected)
+            self.assertEqual(len(self.parallel._segments), 1) # retired tables were unlinked
+            link_ids, link_names = self.parallel.route_packets(addresses)
+            self.assertEqual([link_names[i] for i in link_ids.tolist()], expected[-1])
+
+    unittest.main()
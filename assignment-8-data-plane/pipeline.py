@@ -0,0 +1,307 @@
+from typing import NamedTuple, AsyncIterator, Callable, Awaitable, Literal, Mapping
+import asyncio
+from router import Router
+from scheduler import Packet, CompactPacket, AnyPacket, PacketQueues, PriorityQueues, packet_size
+from shaper import TokenBucket
+
+# NOTE:
+# INGRESS => Router.route_packet(dest_ip) (route_address for a CompactPacket) => egress link queues => line rate => transmit
+# One dispatcher routes every ingress packet into the queues (any `PacketQueues`) of its
+# egress link; one drain task per link pops from them and hands batches to `transmit`
+# at the link's line rate. With overflow='block' a full link queue stalls the dispatcher
+# (backpressure to ingress, nothing is dropped); with overflow='drop' the packet is
+# dropped and counted, as a router would. A packet whose destination does not parse is
+# dropped and counted in `unroutable`. If `transmit` raises, the run stops: ingress is
+# cancelled, the other links are cancelled and `run` raises that exception.
+
+class Link(NamedTuple):
+    rate: float | None = None # line rate in bytes/s, None => as fast as `transmit` returns
+    queues: Callable[[], PacketQueues] = PriorityQueues
+
+class LinkStats(NamedTuple):
+    received: int # routed to this link
+    transmitted: int
+    transmitted_bytes: int
+    dropped: int
+    queued: int
+
+class _Egress:
+    __slots__ = ('queues', 'bucket', 'ready', 'space', 'received', 'transmitted', 'transmitted_bytes', 'dropped')
+
+    def __init__(self, queues: PacketQueues, bucket: TokenBucket | None) -> None:
+        self.queues = queues
+        self.bucket = bucket
+        self.ready = asyncio.Event() # packets were queued
+        self.space = asyncio.Event() # packets were popped
+        self.received = self.transmitted = self.transmitted_bytes = self.dropped = 0
+
+class ForwardingPipeline:
+    """Routes ingress packets into per egress link queues and drains each link at its line rate.
+
+    Links listed in `links` use their own `Link` settings, any other link the router
+    returns (including "Default Gateway") is created on first use from `default_link`.
+    A link sends at most `batch_size` packets per `transmit` call, and when it is ahead
+    of its line rate it sleeps in steps of at least `tick` seconds instead of once per
+    packet, so the rate holds on average over a few ticks. The dispatcher also yields
+    to the links every `batch_size` ingress packets. Every `run` starts with new, empty
+    link queues, and `stats` reports the last run.
+    """
+    def __init__(self, router: Router, transmit: Callable[[str, list[AnyPacket]], Awaitable[None]] | None = None,
+                 links: Mapping[str, Link] | None = None, default_link: Link = Link(),
+                 overflow: Literal['block', 'drop'] = 'block', batch_size: int = 64, tick: float = 0.001) -> None:
+        if overflow not in ('block', 'drop'):
+            raise ValueError(f"unknown overflow policy: {overflow}.")
+        if batch_size < 1 or tick <= 0:
+            raise ValueError(f"batch size and tick must be positive: {batch_size}, {tick}s.")
+        self.router = router
+        self.transmit = transmit
+        self.links = dict(links or {})
+        self.default_link = default_link
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.tick = tick
+        self._egress: dict[str, _Egress] = {}
+        self._drain_tasks: list[asyncio.Task] = []
+        self._ingress_ended = False
+        self._dispatcher: asyncio.Task | None = None
+        self._failure: BaseException | None = None # first exception raised by a drain task
+        self.unroutable = 0 # ingress packets dropped because their destination does not parse
+
+    def stats(self) -> dict[str, LinkStats]:
+        return {
+            name: LinkStats(
+                received=egress.received, transmitted=egress.transmitted, transmitted_bytes=egress.transmitted_bytes,
+                dropped=egress.dropped, queued=len(egress.queues)
+            )
+            for name, egress in self._egress.items()
+        }
+
+    async def run(self, packets: AsyncIterator[AnyPacket | None]) -> None:
+        """Forwards `packets` until the stream ends (or yields None) and every link queue is drained."""
+        self._ingress_ended = False
+        self._failure = None
+        self._egress = {} # the drain tasks of the last run have exited
+        for name in self.links:
+            self._add_egress(name)
+        self._dispatcher = asyncio.create_task(self._dispatch(packets))
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            if self._failure is None: # run itself was cancelled
+                raise
+        finally:
+            self._ingress_ended = True
+            for egress in self._egress.values():
+                egress.ready.set()
+            tasks, self._drain_tasks = self._drain_tasks, []
+            if self._failure is not None:
+                for task in tasks:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True) # failures are recorded by _drain_done
+        if self._failure is not None:
+            raise self._failure
+
+    def _add_egress(self, name: str) -> _Egress:
+        link = self.links.get(name, self.default_link)
+        bucket = None
+        if link.rate is not None:
+            # one tick of line rate, and at least a few jumbo frames, may go out back to back
+            bucket = TokenBucket(link.rate, max(int(link.rate * self.tick), 4 * 9000), asyncio.get_running_loop().time())
+        egress = self._egress[name] = _Egress(link.queues(), bucket)
+        task = asyncio.create_task(self._drain(name, egress))
+        task.add_done_callback(self._drain_done)
+        self._drain_tasks.append(task)
+        return egress
+
+    def _drain_done(self, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is None or self._failure is not None:
+            return
+        # a dead link would leave a blocked dispatcher waiting for space forever
+        self._failure = task.exception()
+        self._dispatcher.cancel()
+
+    async def _dispatch(self, packets: AsyncIterator[AnyPacket | None]) -> None:
+        route_packet, route_address = self.router.route_packet, self.router.route_address
+        egresses, block = self._egress, self.overflow == 'block'
+        until_yield = self.batch_size
+        async for pkt in packets:
+            if pkt is None:
+                break
+            try:
+                if type(pkt) is CompactPacket:
+                    name = route_address(pkt.dest, pkt.ipv6)
+                else:
+                    name = route_packet(pkt.dest_ip)
+            except ValueError:
+                self.unroutable += 1
+                continue
+            egress = egresses.get(name)
+            if egress is None:
+                egress = self._add_egress(name)
+            egress.received += 1
+            queued = egress.queues.push(pkt)
+            while not queued and block:
+                egress.space.clear()
+                await egress.space.wait()
+                queued = egress.queues.push(pkt)
+            if queued:
+                egress.ready.set()
+            else:
+                egress.dropped += 1
+            until_yield -= 1
+            if not until_yield:
+                until_yield = self.batch_size
+                await asyncio.sleep(0)
+
+    async def _drain(self, name: str, egress: _Egress) -> None:
+        loop = asyncio.get_running_loop()
+        pkt_queues, bucket, transmit = egress.queues, egress.bucket, self.transmit
+        while True:
+            if not pkt_queues:
+                if self._ingress_ended:
+                    return
+                egress.ready.clear()
+                await egress.ready.wait()
+                continue
+            if bucket is not None:
+                bucket.refill(loop.time())
+                if bucket.tokens <= 0: # ahead of the line rate
+                    await asyncio.sleep(max(self.tick, -bucket.tokens / bucket.rate))
+                    continue
+            batch: list[AnyPacket] = []
+            sent_bytes = 0
+            while pkt_queues and len(batch) < self.batch_size:
+                pkt = pkt_queues.pop()
+                batch.append(pkt)
+                sent_bytes += packet_size(pkt)
+                if bucket is not None:
+                    bucket.tokens -= packet_size(pkt) # may go negative, repaid by the next sleep
+                    if bucket.tokens <= 0:
+                        break
+            egress.space.set()
+            if transmit is not None:
+                await transmit(name, batch)
+            else:
+                await asyncio.sleep(0) # let ingress run between batches
+            egress.transmitted += len(batch)
+            egress.transmitted_bytes += sent_bytes
+
+if __name__ == "__main__":
+    import unittest
+    from scheduler import Priority, FifoQueue
+    from router import Route
+    from packet_ring import PacketRing
+
+    def make_packets(dest_ips: list[str], size: int = 100) -> list[Packet]:
+        return [
+            Packet(priority=Priority(i % len(Priority)), source_ip="10.0.0.1", dest_ip=dest_ip, payload=f"{i:<{size}}")
+            for i, dest_ip in enumerate(dest_ips)
+        ]
+
+    async def packet_stream(packets: list[Packet], yield_every: int = 1):
+        for i, pkt in enumerate(packets):
+            if i % yield_every == 0:
+                await asyncio.sleep(0)
+            yield pkt
+
+    class TestForwardingPipeline(unittest.TestCase):
+        def setUp(self):
+            self.router = Router([
+                Route(ip_cidr="223.1.1.0/24", link_name="Link 0"),
+                Route(ip_cidr="223.1.2.0/24", link_name="Link 1"),
+                Route(ip_cidr="223.1.3.0/24", link_name="Link 2"),
+            ])
+            self.sent: dict[str, list[Packet]] = {}
+
+        async def transmit(self, link_name: str, batch: list[Packet]):
+            self.sent.setdefault(link_name, []).extend(batch)
+
+        def test_routes_to_links(self):
+            packets = make_packets([f"223.1.{i % 4}.{i % 250}" for i in range(1_000)]) # 223.1.0.x has no route
+            pipeline = ForwardingPipeline(self.router, self.transmit, default_link=Link(queues=FifoQueue))
+            asyncio.run(pipeline.run(packet_stream(packets)))
+            for link_name in ("Link 0", "Link 1", "Link 2", "Default Gateway"):
+                self.assertEqual(self.sent[link_name], [pkt for pkt in packets if self.router.route_packet(pkt.dest_ip) == link_name])
+            stats = pipeline.stats()
+            self.assertEqual(stats["Link 1"], LinkStats(received=250, transmitted=250, transmitted_bytes=250 * 100, dropped=0, queued=0))
+
+        def test_runs_twice(self):
+            packets = make_packets([f"223.1.{i % 4}.{i % 250}" for i in range(100)])
+            pipeline = ForwardingPipeline(
+                self.router, self.transmit, links={"Link 0": Link()}, default_link=Link(queues=lambda: PriorityQueues(maxsize=8)), batch_size=4
+            )
+            async def run():
+                await asyncio.wait_for(pipeline.run(packet_stream(packets, yield_every=len(packets))), timeout=5)
+            for _ in range(2):
+                asyncio.run(run())
+            for link_name in ("Link 0", "Link 1", "Default Gateway"):
+                self.assertEqual(pipeline.stats()[link_name], LinkStats(received=25, transmitted=25, transmitted_bytes=25 * 100, dropped=0, queued=0))
+                self.assertEqual(len(self.sent[link_name]), 50)
+
+        def test_backpressure_is_lossless(self):
+            packets = make_packets([f"223.1.1.{i % 250}" for i in range(2_000)])
+            # the whole stream is ready at once, but the link only buffers 8 packets
+            pipeline = ForwardingPipeline(self.router, self.transmit, default_link=Link(queues=lambda: PriorityQueues(maxsize=8)), batch_size=4)
+            asyncio.run(pipeline.run(packet_stream(packets, yield_every=len(packets))))
+            self.assertEqual(len(self.sent["Link 0"]), 2_000)
+            self.assertEqual(pipeline.stats()["Link 0"].dropped, 0)
+
+        def test_compact_packets(self):
+            packets = make_packets([f"223.1.{i % 4}.{i % 250}" for i in range(1_000)])
+            compact = [CompactPacket.from_packet(pkt) for pkt in packets]
+            pipeline = ForwardingPipeline(self.router, self.transmit, default_link=Link(queues=lambda: PacketRing(maxsize=64)))
+            asyncio.run(pipeline.run(packet_stream(compact)))
+            for link_name in ("Link 0", "Link 1", "Link 2", "Default Gateway"):
+                self.assertEqual(self.sent[link_name], [CompactPacket.from_packet(pkt) for pkt in packets if self.router.route_packet(pkt.dest_ip) == link_name])
+            self.assertEqual(pipeline.stats()["Link 1"].transmitted_bytes, 250 * 100)
+
+        def test_drop_overflow(self):
+            packets = make_packets([f"223.1.2.{i % 250}" for i in range(2_000)])
+            pipeline = ForwardingPipeline(
+                self.router, self.transmit, default_link=Link(queues=lambda: PriorityQueues(maxsize=8)), overflow='drop', batch_size=1_000
+            )
+            asyncio.run(pipeline.run(packet_stream(packets, yield_every=len(packets))))
+            stats = pipeline.stats()["Link 1"]
+            self.assertEqual((stats.received, stats.queued), (2_000, 0))
+            self.assertGreater(stats.dropped, 0)
+            self.assertEqual(stats.transmitted + stats.dropped, 2_000)
+            self.assertEqual(len(self.sent["Link 1"]), stats.transmitted)
+
+        def test_unroutable_packets_are_dropped(self):
+            packets = make_packets(["223.1.1.1", "223.1.1", "not an address", "223.1.2.1"])
+            pipeline = ForwardingPipeline(self.router, self.transmit)
+            asyncio.run(pipeline.run(packet_stream(packets)))
+            self.assertEqual(pipeline.unroutable, 2)
+            self.assertEqual((self.sent["Link 0"], self.sent["Link 1"]), ([packets[0]], [packets[3]]))
+
+        def test_transmit_failure_stops_blocked_run(self):
+            packets = make_packets([f"223.1.{1 + i % 2}.1" for i in range(1_000)])
+            async def transmit(link_name: str, batch: list[Packet]):
+                if link_name == "Link 0":
+                    raise ConnectionError("link down")
+                await asyncio.sleep(0)
+            pipeline = ForwardingPipeline(self.router, transmit, default_link=Link(queues=lambda: PriorityQueues(maxsize=8)), batch_size=4)
+            async def run():
+                await asyncio.wait_for(pipeline.run(packet_stream(packets, yield_every=len(packets))), timeout=5)
+            with self.assertRaisesRegex(ConnectionError, "link down"):
+                asyncio.run(run())
+            self.assertLess(pipeline.stats()["Link 0"].received, 1_000)
+
+        def test_line_rate(self):
+            packets = make_packets(["223.1.1.1"] * 100 + ["223.1.2.1"] * 100, size=1_000)
+            links = {"Link 0": Link(rate=200_000), "Link 1": Link(rate=400_000)}
+            finished: dict[str, float] = {}
+            async def transmit(link_name: str, batch: list[Packet]):
+                finished[link_name] = asyncio.get_running_loop().time()
+            async def run():
+                pipeline = ForwardingPipeline(self.router, transmit, links=links, tick=0.005)
+                start = asyncio.get_running_loop().time()
+                await pipeline.run(packet_stream(packets, yield_every=len(packets)))
+                return {name: at - start for name, at in finished.items()}, pipeline.stats()
+            elapsed, stats = asyncio.run(run())
+            # 100 kB at 200 kB/s and 400 kB/s, less the initial burst allowance
+            self.assertAlmostEqual(elapsed["Link 0"], (100_000 - 36_000) / 200_000, delta=0.03)
+            self.assertAlmostEqual(elapsed["Link 1"], (100_000 - 36_000) / 400_000, delta=0.03)
+            self.assertEqual(stats["Link 0"].transmitted_bytes, 100_000)
+
+    unittest.main()
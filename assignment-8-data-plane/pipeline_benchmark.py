@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import random
+import time
+from router import Router
+from flow_cache import FlowCache
+from scheduler import Packet, CompactPacket, AnyPacket, Priority, FifoQueue, PriorityQueues, DeficitRoundRobinQueues
+from pipeline import ForwardingPipeline, Link
+from benchmark import synthetic_routes, random_addresses, zipf_sample
+
+# NOTE:
+# Aggregate packets/sec through ForwardingPipeline (lookup, per link queues, drain):
+#   python pipeline_benchmark.py --packets 500000 --links 4 64 256
+# Addresses are Zipf distributed over a pool of destinations, like real traffic;
+# links have no line rate unless --link-rate is given (then the figure is capped by it).
+# --compact sends `CompactPacket`s, routed by their int destination (`Router.route_address`).
+
+QUEUES = {
+    'fifo': FifoQueue,
+    'priority': PriorityQueues,
+    'drr': DeficitRoundRobinQueues,
+}
+
+def synthetic_packets(count: int, seed: int = 0, compact: bool = False) -> list[AnyPacket]:
+    rng = random.Random(seed)
+    destinations = zipf_sample(random_addresses(50_000, seed=seed), count, seed=seed)
+    payloads = ["x" * size for size in (64, 576, 1500)]
+    packets = [
+        Packet(priority=rng.choice(list(Priority)), source_ip="10.0.0.1", dest_ip=dest_ip, payload=rng.choice(payloads))
+        for dest_ip in destinations
+    ]
+    return [CompactPacket.from_packet(pkt) for pkt in packets] if compact else packets
+
+async def measure(pipeline: ForwardingPipeline, packets: list[AnyPacket], arrival_burst: int) -> float:
+    async def packet_stream():
+        for i in range(0, len(packets), arrival_burst):
+            for pkt in packets[i:i + arrival_burst]:
+                yield pkt
+            await asyncio.sleep(0)
+    start = time.perf_counter()
+    await pipeline.run(packet_stream())
+    elapsed = time.perf_counter() - start
+    assert sum(stats.transmitted for stats in pipeline.stats().values()) == len(packets)
+    return len(packets) / elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the forwarding pipeline.")
+    parser.add_argument('--packets', type=int, default=200_000)
+    parser.add_argument('--routes', type=int, default=100_000)
+    parser.add_argument('--links', type=int, nargs='+', default=[4, 64, 256])
+    parser.add_argument('--queues', nargs='+', choices=list(QUEUES), default=list(QUEUES))
+    parser.add_argument('--link-rate', type=float, default=None, help="line rate of every link in bytes/s")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--arrival-burst', type=int, default=32, help="packets the source yields per event loop turn")
+    parser.add_argument('--flow-cache', action='store_true', help="put an LRU flow cache in front of the lookup")
+    parser.add_argument('--compact', action='store_true', help="send CompactPackets instead of Packets")
+    args = parser.parse_args()
+
+    packets = synthetic_packets(args.packets, compact=args.compact)
+    for links_count in args.links:
+        routes = synthetic_routes(args.routes, links_count=links_count)
+        for name in args.queues:
+            router = Router(routes, flow_cache=FlowCache() if args.flow_cache else None)
+            pipeline = ForwardingPipeline(
+                router, default_link=Link(rate=args.link_rate, queues=lambda: QUEUES[name](maxsize=4096)), batch_size=args.batch_size
+            )
+            pps = asyncio.run(measure(pipeline, packets, args.arrival_burst))
+            print(f"{links_count:>5} links  {name:<10} {pps:>12,.0f} packets/s", flush=True)
+
+if __name__ == "__main__":
+    main()
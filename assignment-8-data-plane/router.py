@@ -1,20 +1,129 @@
-from typing import NamedTuple, Literal
-from ip_utils import IpCidrInfo, get_network_prefix, ip_to_binary
+from typing import NamedTuple, Literal, Callable, Sequence, Iterable
+import os
+import threading
+import numpy as np
+from ip_utils import (
+    IpCidrInfo, IpPrefix, get_network_prefix, ip_to_int, int_to_ip, parse_cidr,
+    ipv6_to_int, int_to_ipv6, parse_cidr6
+)
+from lpm import LookupEngine, StrideTrie, SparseStrideTrie
+from fib import CompiledFib, CompiledFibEngine
+from flow_cache import FlowCache
 
 class Route(NamedTuple):
     ip_cidr: str
     link_name: str
 
+class RouteUpdate(NamedTuple):
+    ip_cidr: str
+    link_name: str | None # None withdraws the prefix
+
+def is_ipv6(ip_address: str) -> bool:
+    """Family check used to dispatch addresses and CIDRs; full validation happens on parse."""
+    return ':' in ip_address
+
+_IPV6_KEY = 1 << 128 # flow cache key bit that keeps IPv6 ints apart from IPv4 ones
+
+AddressBatch = Sequence[str | int] | np.ndarray | bytes | bytearray | memoryview
+
+def _address_to_int(address: str | int) -> int:
+    if isinstance(address, str):
+        return ip_to_int(address)
+    if not isinstance(address, (int, np.integer)) or not (0 <= address <= 0xFFFFFFFF):
+        raise ValueError(f"invalid IPV4 address: {address!r}.")
+    return address
+
+def to_address_array(addresses: AddressBatch) -> np.ndarray:
+    """Normalize a batch of IPv4 destinations (see `Router.route_packets`) to a uint32 array.
+
+    Raises ValueError for anything that is not an address: a bad string, an int outside
+    32 bits, or a non-integer array (floats are not truncated).
+    """
+    if isinstance(addresses, (bytes, bytearray, memoryview)):
+        if len(memoryview(addresses).cast('B')) % 4:
+            raise ValueError("packed addresses buffer length must be a multiple of 4.")
+        return np.frombuffer(addresses, dtype='>u4').astype(np.uint32)
+    if isinstance(addresses, np.ndarray):
+        if addresses.dtype.kind not in 'iu':
+            raise ValueError(f"expected an integer array of IPV4 addresses, got {addresses.dtype}.")
+        if addresses.size and (addresses.min() < 0 or addresses.max() > 0xFFFFFFFF):
+            raise ValueError("IPV4 addresses must fit in 32 bits.")
+        return addresses.astype(np.uint32, copy=False)
+    return np.fromiter(map(_address_to_int, addresses), dtype=np.uint32, count=len(addresses))
+
 class Router:
-    def __init__(self, routes: list[Route | tuple[str, str]]) -> None:
-        self.routes: list[Route] = [
+    def __init__(self, routes: list[Route | tuple[str, str]], 
+                 engine: Callable[[], LookupEngine] = StrideTrie,
+                 flow_cache: FlowCache | None = None,
+                 engine6: Callable[[], LookupEngine] = SparseStrideTrie) -> None:
+        routes = [
             Route(
                 ip_cidr=route[0],
                 link_name=route[1]
             ) if not isinstance(route, Route) else route
             for route in routes
         ]
-        self.forwarding_table: list[tuple[IpCidrInfo, str]] = self.build_forwarding_table(self.routes)
+        self.engine: LookupEngine = self.build_engine(
+            [route for route in routes if not is_ipv6(route.ip_cidr)], engine
+        )
+        self.engine6: LookupEngine = self.build_engine(
+            [route for route in routes if is_ipv6(route.ip_cidr)], engine6, ipv6=True
+        )
+        self.engine_factory = engine
+        self.generation = 0 # bumped by every applied batch of route updates
+        self.flow_cache = flow_cache
+        self._update_lock = threading.Lock()
+        self._fib: tuple[int, CompiledFib] | None = None
+        self._forwarding_table: tuple[int, list[tuple[IpCidrInfo, str]]] | None = None
+
+    @classmethod
+    def from_snapshot(cls, path: str | os.PathLike, 
+                      engine: Callable[[], LookupEngine] = StrideTrie,
+                      flow_cache: FlowCache | None = None) -> "Router":
+        """Start a router from a snapshot written by `save_snapshot`.
+
+        The table is mapped read-only and answered in place (see `CompiledFibEngine`), so
+        startup costs no parsing or sorting and processes mapping the same file share its
+        pages. The first route update rebuilds the table into an `engine` trie.
+        """
+        router = cls([], engine=engine, flow_cache=flow_cache)
+        fib = CompiledFib.load(path)
+        router.engine = CompiledFibEngine(fib)
+        router._fib = (router.generation, fib)
+        return router
+    
+    def save_snapshot(self, path: str | os.PathLike) -> None:
+        if len(self.engine6):
+            raise ValueError("forwarding table snapshots hold IPv4 routes only.")
+        self.fib.save(path)
+
+    @property
+    def routes(self) -> list[Route]:
+        """The routes currently installed (one per prefix, host bits cleared), IPv4 first."""
+        with self._update_lock: # items() walks the writers' route dict
+            return [
+                Route(ip_cidr=f"{int_to_ip(network)}/{prefix_length}", link_name=link_name)
+                for network, prefix_length, link_name in self.engine.items()
+            ] + [
+                Route(ip_cidr=f"{int_to_ipv6(network)}/{prefix_length}", link_name=link_name)
+                for network, prefix_length, link_name in self.engine6.items()
+            ]
+
+    @property
+    def forwarding_table(self) -> list[tuple[IpCidrInfo, str]]:
+        """The string-based IPv4 table, sorted longest prefix first (kept for callers that use it).
+
+        Built on first use and cached until the next route update, like `fib`.
+        """
+        table = self._forwarding_table
+        if table is None or table[0] != self.generation:
+            with self._update_lock:
+                table = (self.generation, self.build_forwarding_table([
+                    Route(ip_cidr=f"{int_to_ip(network)}/{prefix_length}", link_name=link_name)
+                    for network, prefix_length, link_name in self.engine.items()
+                ]))
+            self._forwarding_table = table
+        return table[1]
 
     @staticmethod
     def build_forwarding_table(routes: list[Route]) -> list[tuple[IpCidrInfo, str]]:
@@ -30,15 +139,150 @@ class Router:
             reverse=True # Longest prefix first
         )
     
+    @staticmethod
+    def build_engine(routes: list[Route], 
+                     engine: Callable[[], LookupEngine] = StrideTrie, 
+                     ipv6: bool = False) -> LookupEngine:
+        parse = parse_cidr6 if ipv6 else parse_cidr
+        prefixes: dict[IpPrefix, str] = {}
+        for route in routes:
+            # Like the sorted scan, the first listed route wins for a repeated prefix.
+            prefixes.setdefault(parse(route.ip_cidr), route.link_name)
+        lookup_engine = engine()
+        if lookup_engine.width != (128 if ipv6 else 32):
+            raise ValueError(f"{type(lookup_engine).__name__} is {lookup_engine.width}-bit, expected an IPv{6 if ipv6 else 4} engine.")
+        lookup_engine.apply_updates(
+            (prefix.network, prefix.prefix_length, link_name) 
+            for prefix, link_name in prefixes.items()
+        )
+        return lookup_engine
+    
+    def add_route(self, ip_cidr: str, link_name: str) -> None:
+        """Install a route, replacing the link of an existing identical prefix."""
+        self.apply_updates([RouteUpdate(ip_cidr=ip_cidr, link_name=link_name)])
+    
+    def withdraw_route(self, ip_cidr: str) -> bool:
+        """Remove the route for a prefix; returns False if it was not installed."""
+        ipv6 = is_ipv6(ip_cidr)
+        prefix = parse_cidr6(ip_cidr) if ipv6 else parse_cidr(ip_cidr)
+        with self._update_lock:
+            if (prefix.network, prefix.prefix_length) not in (self.engine6 if ipv6 else self.engine):
+                return False
+            withdrawal = [(prefix.network, prefix.prefix_length, None)]
+            if ipv6:
+                self._apply_locked([], withdrawal)
+            else:
+                self._apply_locked(withdrawal, [])
+        return True
+    
+    def apply_updates(self, updates: Iterable[RouteUpdate | tuple[str, str | None]]) -> None:
+        """Apply a batch of announcements and withdrawals as one atomic change.
+
+        Every prefix is parsed before anything is touched, so an invalid entry rejects
+        the whole batch. Lookups running concurrently see the table from before or after
+        the batch, never a mix; later updates to the same prefix win. The IPv4 and IPv6
+        tables are separate engines published one after the other (IPv6 first), so a
+        batch is atomic per address family only: between the two, a reader can see the
+        new IPv6 routes next to the old IPv4 ones. `generation` moves once both are out.
+        """
+        parsed: list[tuple[int, int, str | None]] = []
+        parsed6: list[tuple[int, int, str | None]] = []
+        for ip_cidr, link_name in updates:
+            if is_ipv6(ip_cidr):
+                prefix = parse_cidr6(ip_cidr)
+                parsed6.append((prefix.network, prefix.prefix_length, link_name))
+            else:
+                prefix = parse_cidr(ip_cidr)
+                parsed.append((prefix.network, prefix.prefix_length, link_name))
+        with self._update_lock:
+            self._apply_locked(parsed, parsed6)
+    
+    def _apply_locked(self, updates: list[tuple[int, int, str | None]], 
+                      updates6: list[tuple[int, int, str | None]]) -> None:
+        if updates6:
+            self.engine6.apply_updates(updates6)
+        if updates and isinstance(self.engine, CompiledFibEngine):
+            # read-only snapshot table: build an updatable copy, then swap it in
+            lookup_engine = self.engine_factory()
+            lookup_engine.apply_updates([*self.engine.items(), *updates])
+            self.engine = lookup_engine
+        elif updates:
+            self.engine.apply_updates(updates)
+        self.generation += 1
+    
     def route_packet(self, dest_ip: str) -> str | Literal["Default Gateway"]:
-        binary_dest_ip = ip_to_binary(dest_ip)
-        for ip_cidr_info, link_name in self.forwarding_table:
-            if binary_dest_ip[:ip_cidr_info.prefix_length] == ip_cidr_info.cidr_prefix:
-                return link_name
-        return "Default Gateway"
+        """The link for a dotted-quad IPv4 or an IPv6 destination.
+
+        Addresses are parsed strictly (see `ip_to_int`), so forms the original string
+        parser let through, such as leading zeros ("010.1.1.1"), surrounding whitespace or
+        octets above 255, now raise ValueError.
+        """
+        flow_cache = self.flow_cache
+        if flow_cache is None:
+            return self._lookup(dest_ip)
+        if is_ipv6(dest_ip):
+            # one IPv6 address has many text forms ("::1", "0::1"), so key it by its int;
+            # the strict IPv4 parser accepts only one form per address, so those stay strings
+            return self.route_address(ipv6_to_int(dest_ip), True)
+        # read the generation before the lookup, so a result racing an update is cached
+        # under the older generation and thrown away
+        generation = self.generation
+        link_name = flow_cache.get(dest_ip, generation)
+        if link_name is None:
+            link_name = self._lookup(dest_ip)
+            flow_cache.put(dest_ip, link_name, generation)
+        return link_name
+    
+    def route_address(self, address: int, ipv6: bool = False) -> str | Literal["Default Gateway"]:
+        """`route_packet` for a destination already parsed to an int (see `CompactPacket`)."""
+        flow_cache = self.flow_cache
+        if flow_cache is None:
+            return self._lookup_address(address, ipv6)
+        key = address | _IPV6_KEY if ipv6 else address
+        generation = self.generation
+        link_name = flow_cache.get(key, generation)
+        if link_name is None:
+            link_name = self._lookup_address(address, ipv6)
+            flow_cache.put(key, link_name, generation)
+        return link_name
+
+    def _lookup_address(self, address: int, ipv6: bool) -> str | Literal["Default Gateway"]:
+        link_name = (self.engine6 if ipv6 else self.engine).lookup(address)
+        if link_name is None:
+            return "Default Gateway"
+        return link_name
+
+    def _lookup(self, dest_ip: str) -> str | Literal["Default Gateway"]:
+        if is_ipv6(dest_ip):
+            return self._lookup_address(ipv6_to_int(dest_ip), True)
+        return self._lookup_address(ip_to_int(dest_ip), False)
+    
+    @property
+    def fib(self) -> CompiledFib:
+        """Array-based copy of the routes used by the batch lookup, compiled on first use."""
+        fib = self._fib
+        if fib is None or fib[0] != self.generation:
+            with self._update_lock:
+                fib = (self.generation, CompiledFib.from_routes(self.engine.items()))
+            self._fib = fib
+        return fib[1]
+    
+    def route_packets(self, addresses: AddressBatch) -> tuple[np.ndarray, list[str]]:
+        """Route a batch of IPv4 destinations at once.
+
+        `addresses` may be a list of dotted-quad strings or ints, a NumPy integer array,
+        or a buffer of packed 4-byte addresses in network byte order. Returns a uint32
+        array of link ids and the link-name table they index; `route_packet(addr)` is
+        `link_names[link_ids[i]]` for every element.
+        """
+        fib = self.fib
+        return fib.lookup_batch(to_address_array(addresses)), fib.link_names
     
 if __name__ == "__main__":
+    import random
+    import tempfile
     import unittest
+    from lpm import ENGINES
     class TestRouter(unittest.TestCase):
         def setUp(self):
             # Initialize the router with the specified routes
@@ -54,4 +298,135 @@ if __name__ == "__main__":
             self.assertEqual(self.router.route_packet("223.1.250.1"), "Link 4 (ISP)")
         def test_route_packet_with_no_matching_prefix(self):
             self.assertEqual(self.router.route_packet("198.51.100.1"), "Default Gateway")
+        def test_route_packet_is_strict(self):
+            for invalid in ("223.001.1.100", " 223.1.1.100", "223.1.1.256"):
+                with self.assertRaises(ValueError):
+                    self.router.route_packet(invalid)
+        def test_route_packet_engines(self):
+            for engine in ENGINES.values():
+                router = Router(self.router.routes, engine=engine)
+                self.assertEqual(router.route_packet("223.1.3.7"), "Link 2")
+                self.assertEqual(router.route_packet("223.1.250.1"), "Link 4 (ISP)")
+                self.assertEqual(router.route_packet("198.51.100.1"), "Default Gateway")
+        def test_route_packets_matches_route_packet(self):
+            rng = random.Random(0)
+            routes = [
+                (f"{rng.getrandbits(8)}.{rng.getrandbits(8)}.{rng.getrandbits(8)}.0/{rng.choice([8, 16, 20, 24])}", f"Link {i % 5}")
+                for i in range(500)
+            ] + self.router.routes
+            router = Router(routes)
+            addresses = [".".join(str(rng.getrandbits(8)) for _ in range(4)) for _ in range(2000)]
+            addresses += [route[0].split('/')[0] for route in routes] + ["198.51.100.1"]
+            expected = [router.route_packet(address) for address in addresses]
+            ints = [ip_to_int(address) for address in addresses]
+            for batch in (addresses, ints, np.array(ints, dtype=np.uint32), b"".join(i.to_bytes(4) for i in ints)):
+                link_ids, link_names = router.route_packets(batch)
+                self.assertEqual([link_names[i] for i in link_ids.tolist()], expected)
+        def test_route_packets_invalid(self):
+            with self.assertRaises(ValueError):
+                self.router.route_packets(b"\x01\x02\x03")
+            with self.assertRaises(ValueError):
+                self.router.route_packets(["1.2.3"])
+            for invalid in (np.array([-1]), np.array([1.5]), [1 << 32], [-1], [1.0]):
+                with self.assertRaises(ValueError):
+                    self.router.route_packets(invalid)
+        def test_add_and_withdraw_route(self):
+            self.router.add_route("223.1.250.0/24", "Link 5")
+            self.assertEqual(self.router.route_packet("223.1.250.1"), "Link 5")
+            self.assertEqual(self.router.route_packets(["223.1.250.1"])[1][-1], "Link 5")
+            self.assertTrue(self.router.withdraw_route("223.1.0.0/16"))
+            self.assertFalse(self.router.withdraw_route("223.1.0.0/16"))
+            self.assertEqual(self.router.route_packet("223.1.9.1"), "Default Gateway")
+            link_ids, link_names = self.router.route_packets(["223.1.9.1", "223.1.250.1"])
+            self.assertEqual([link_names[i] for i in link_ids], ["Default Gateway", "Link 5"])
+            self.assertEqual(self.router.generation, 2)
+        def test_apply_updates_is_all_or_nothing(self):
+            with self.assertRaises(ValueError):
+                self.router.apply_updates([("10.0.0.0/8", "Link 9"), ("223.1.1.0/24", None), ("bad", None)])
+            self.assertEqual(self.router.route_packet("10.1.1.1"), "Default Gateway")
+            self.assertEqual(self.router.route_packet("223.1.1.1"), "Link 0")
+            self.router.apply_updates([RouteUpdate("10.0.0.0/8", "Link 9"), RouteUpdate("223.1.1.0/24", None)])
+            self.assertEqual(self.router.route_packet("10.1.1.1"), "Link 9")
+            self.assertEqual(self.router.route_packet("223.1.1.1"), "Link 4 (ISP)")
+            self.assertEqual(len(self.router.routes), 4)
+        def test_flow_cache(self):
+            for policy in ('lru', 'clock'):
+                router = Router(self.router.routes, flow_cache=FlowCache(capacity=2, policy=policy))
+                self.assertEqual(router.route_packet("223.1.1.100"), "Link 0")
+                self.assertEqual(router.route_packet("223.1.1.100"), "Link 0")
+                self.assertEqual(router.route_packet("198.51.100.1"), "Default Gateway")
+                router.add_route("198.51.100.0/24", "Link 7")
+                router.withdraw_route("223.1.1.0/24")
+                self.assertEqual(router.route_packet("198.51.100.1"), "Link 7")
+                self.assertEqual(router.route_packet("223.1.1.100"), "Link 4 (ISP)")
+                stats = router.flow_cache.stats()
+                self.assertEqual((stats.hits, stats.misses, stats.invalidations), (1, 4, 1))
+                with self.assertRaises(ValueError):
+                    router.route_packet("223.1.1")
+        def test_snapshot(self):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "router.fib")
+                self.router.save_snapshot(path)
+                router = Router.from_snapshot(path)
+                self.assertEqual(sorted(router.routes), sorted(self.router.routes))
+                for address in ("223.1.1.100", "223.1.2.5", "223.1.250.1", "198.51.100.1"):
+                    self.assertEqual(router.route_packet(address), self.router.route_packet(address))
+                link_ids, link_names = router.route_packets(["223.1.2.5"])
+                self.assertEqual(link_names[link_ids[0]], "Link 1")
+                self.assertTrue(router.withdraw_route("223.1.2.0/24"))
+                self.assertIsInstance(router.engine, StrideTrie)
+                self.assertEqual(router.route_packet("223.1.2.5"), "Link 4 (ISP)")
+                self.assertEqual(self.router.route_packet("223.1.2.5"), "Link 1")
+        def test_dual_stack(self):
+            router = Router([
+                *self.router.routes,
+                ("2001:db8::/32", "Link 6"),
+                ("2001:db8:abcd::/48", "Link 7"),
+                ("::/0", "Link 8 (v6 upstream)"),
+            ])
+            self.assertEqual(router.route_packet("2001:db8:abcd:12::1"), "Link 7")
+            self.assertEqual(router.route_packet("2001:db8:1::1"), "Link 6")
+            self.assertEqual(router.route_packet("2a00::1"), "Link 8 (v6 upstream)")
+            self.assertEqual(router.route_packet("223.1.1.100"), "Link 0")
+            self.assertEqual(Router([]).route_packet("2001:db8::1"), "Default Gateway")
+            cached = Router(router.routes, flow_cache=FlowCache())
+            for address in ("2001:db8:abcd:12::1", "::df01:164", "223.1.1.100", "2a00::1"):
+                ipv6 = is_ipv6(address)
+                as_int = ipv6_to_int(address) if ipv6 else ip_to_int(address)
+                for _ in range(2): # "::df01:164" is 223.1.1.100 as an int, but must not share its cache entry
+                    self.assertEqual(cached.route_address(as_int, ipv6), router.route_packet(address))
+            self.assertEqual(cached.route_packet("2001:db8:abcd:12:0::1"), "Link 7") # same entry, another text form
+            self.assertEqual(cached.flow_cache.stats().hits, 5)
+            router.apply_updates([("2001:db8:abcd::/48", None), ("2001:db8:abcd::/56", "Link 9"), ("223.1.1.0/24", None)])
+            self.assertEqual(router.route_packet("2001:db8:abcd:12::1"), "Link 9")
+            self.assertEqual(router.route_packet("2001:db8:abcd:100::1"), "Link 6")
+            self.assertEqual(router.route_packet("223.1.1.100"), "Link 4 (ISP)")
+            self.assertTrue(router.withdraw_route("::/0"))
+            self.assertEqual(router.route_packet("2a00::1"), "Default Gateway")
+            self.assertIn(Route("2001:db8:abcd::/56", "Link 9"), router.routes)
+            self.assertEqual(len(router.forwarding_table), 3)
+            self.assertIs(router.forwarding_table, router.forwarding_table)
+            with self.assertRaises(ValueError):
+                router.route_packet("2001:db8::g")
+            with self.assertRaises(ValueError):
+                router.save_snapshot(os.devnull)
+        def test_routes_during_updates(self):
+            import threading
+            stop = threading.Event()
+            def churn():
+                while not stop.is_set():
+                    self.router.apply_updates([(f"10.{i}.0.0/16", f"Link {i}") for i in range(50)])
+                    self.router.apply_updates([(f"10.{i}.0.0/16", None) for i in range(50)])
+            writer = threading.Thread(target=churn)
+            writer.start()
+            try:
+                for _ in range(300):
+                    self.assertIn(len(self.router.routes), (4, 54))
+            finally:
+                stop.set()
+                writer.join()
+        def test_duplicate_prefix_first_route_wins(self):
+            router = Router([("10.0.0.0/8", "Link A"), ("10.1.2.3/8", "Link B"), ("0.0.0.0/0", "Link C")])
+            self.assertEqual(router.route_packet("10.9.9.9"), "Link A")
+            self.assertEqual(router.route_packet("11.0.0.1"), "Link C")
     unittest.main()
\ No newline at end of file
@@ -1,7 +1,10 @@
-from typing import NamedTuple, Literal,  AsyncIterator, Callable, Awaitable
+from typing import NamedTuple, AsyncIterator, Callable, Awaitable, Mapping, Hashable, Protocol
 from enum import IntEnum
+from collections import deque
 import heapq
+import time
 import asyncio
+from ip_utils import ip_to_int, int_to_ip, ipv6_to_int, int_to_ipv6
 
 class Priority(IntEnum):
     HIGH = 0
@@ -13,54 +16,511 @@ class Packet(NamedTuple):
     source_ip: str
     dest_ip: str
     payload: str
-    
-async def fifo_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: Callable[[Packet], Awaitable[None]], maxsize: int = 1024):
-    """This function simulates a First-Come, First-Served (FCFS/FIFO) scheduler."""
-    pkt_queue: asyncio.Queue[Packet | None] = asyncio.Queue(maxsize=maxsize)
+
+    @property
+    def flow(self) -> tuple[str, str]:
+        return (self.source_ip, self.dest_ip)
+
+class CompactPacket:
+    """Packet with integer addresses and a `bytes`/`memoryview` payload, in one `__slots__` object.
+
+    Queues and schedulers take it wherever they take a `Packet`: both have `priority`,
+    `payload` (measured by `packet_size`) and `flow`. `source_ip`/`dest_ip` are
+    formatted on demand; `source`/`dest` are the addresses as ints. Equal packets hash
+    equal, so they can be dict keys and set members like `Packet`s.
+    """
+    __slots__ = ('priority', 'source', 'dest', 'payload', 'ipv6')
+
+    def __init__(self, priority: int, source: int, dest: int, payload: bytes | memoryview, ipv6: bool = False) -> None:
+        self.priority = priority
+        self.source = source
+        self.dest = dest
+        self.payload = payload
+        self.ipv6 = ipv6
+
+    @classmethod
+    def from_packet(cls, pkt: Packet) -> "CompactPacket":
+        if ':' in pkt.dest_ip:
+            return cls(pkt.priority, ipv6_to_int(pkt.source_ip), ipv6_to_int(pkt.dest_ip), pkt.payload.encode(), ipv6=True)
+        return cls(pkt.priority, ip_to_int(pkt.source_ip), ip_to_int(pkt.dest_ip), pkt.payload.encode())
+
+    def to_packet(self) -> Packet:
+        return Packet(priority=Priority(self.priority), source_ip=self.source_ip, dest_ip=self.dest_ip, payload=bytes(self.payload).decode())
+
+    @property
+    def source_ip(self) -> str:
+        return int_to_ipv6(self.source) if self.ipv6 else int_to_ip(self.source)
+
+    @property
+    def dest_ip(self) -> str:
+        return int_to_ipv6(self.dest) if self.ipv6 else int_to_ip(self.dest)
+
+    @property
+    def flow(self) -> tuple[int, int, bool]:
+        # with the family flag, so an IPv4 and an IPv6 flow with equal ints stay apart
+        return (self.source, self.dest, self.ipv6)
+
+    def _key(self) -> tuple[int, int, int, bool, bytes]:
+        return (self.priority, self.source, self.dest, self.ipv6, bytes(self.payload))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CompactPacket):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return f"CompactPacket(priority={self.priority!r}, source_ip={self.source_ip!r}, dest_ip={self.dest_ip!r}, payload={bytes(self.payload)!r})"
+
+AnyPacket = Packet | CompactPacket
+
+def packet_size(pkt: AnyPacket) -> int:
+    return len(pkt.payload)
+
+def by_class(pkt: AnyPacket) -> Hashable:
+    return pkt.priority
+
+def by_flow(pkt: AnyPacket) -> Hashable:
+    return pkt.flow
+
+def single_flow(pkt: AnyPacket) -> Hashable:
+    return None
+
+class PacketQueues(Protocol):
+    flow_key: Callable[[AnyPacket], Hashable] # packets with the same key leave in arrival order
+    def __len__(self) -> int: ...
+    def push(self, pkt: AnyPacket) -> bool: ... # False => the packet was dropped
+    def pop(self) -> AnyPacket: ... # queues that also drop on dequeue call their `on_drop(pkt)` attribute
+
+
+class SchedulerStats(NamedTuple):
+    enqueued: dict[Priority, int]
+    dequeued: dict[Priority, int]
+    dropped: dict[Priority, int]
+    depth: int
+    max_depth: int
+    depth_samples: list[tuple[float, int]] # (clock, packets queued), every `depth_sample_every` enqueues
+    sojourn_histogram: dict[Priority, list[int]] # bucket b counts sojourn times in [2**(b-1), 2**b) us, bucket 0 is < 1us
+
+    def sojourn_percentile(self, fraction: float, priority: Priority | None = None) -> float | None:
+        """Upper bound, in seconds, of the bucket holding the `fraction` quantile of sojourn times."""
+        histograms = [self.sojourn_histogram[priority]] if priority is not None else list(self.sojourn_histogram.values())
+        counts = [sum(bucket) for bucket in zip(*histograms)]
+        total = sum(counts)
+        if not total:
+            return None
+        seen = 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if seen >= fraction * total:
+                break
+        return 2 ** bucket / 1e6
+
+class SchedulerMetrics:
+    """Counters per `Priority` class, a sampled queue depth gauge and log2 sojourn time histograms.
+
+    Pass one to a scheduler's `metrics` argument and call `snapshot` at any time, also while
+    the scheduler runs. Without metrics the scheduler skips all of this, drops are then
+    only reported by a printed warning.
+    """
+    def __init__(self, depth_sample_every: int = 64, depth_samples: int = 1024, histogram_buckets: int = 32) -> None:
+        if depth_sample_every < 1 or depth_samples < 1 or histogram_buckets < 1:
+            raise ValueError("metrics sampling parameters must be positive.")
+        self.depth_sample_every = depth_sample_every
+        self.enqueued = [0] * len(Priority)
+        self.dequeued = [0] * len(Priority)
+        self.dropped = [0] * len(Priority)
+        self.max_depth = 0
+        self.depth_samples: deque[tuple[float, int]] = deque(maxlen=depth_samples)
+        self.sojourn_histogram = [[0] * histogram_buckets for _ in Priority]
+        self._until_sample = depth_sample_every
+
+    def record_enqueue(self, priority: Priority, depth: int, now: float) -> None:
+        self.enqueued[priority] += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._until_sample -= 1
+        if not self._until_sample:
+            self._until_sample = self.depth_sample_every
+            self.depth_samples.append((now, depth))
+
+    def record_drop(self, priority: Priority) -> None:
+        self.dropped[priority] += 1
+
+    def record_dequeue(self, priority: Priority, sojourn: float) -> None:
+        self.dequeued[priority] += 1
+        histogram = self.sojourn_histogram[priority]
+        histogram[min(int(sojourn * 1e6).bit_length(), len(histogram) - 1)] += 1
+
+    def snapshot(self) -> SchedulerStats:
+        return SchedulerStats(
+            enqueued=dict(zip(Priority, self.enqueued)),
+            dequeued=dict(zip(Priority, self.dequeued)),
+            dropped=dict(zip(Priority, self.dropped)),
+            depth=sum(self.enqueued) - sum(self.dequeued),
+            max_depth=self.max_depth,
+            depth_samples=list(self.depth_samples),
+            sojourn_histogram={priority: list(histogram) for priority, histogram in zip(Priority, self.sojourn_histogram)},
+        )
+
+class MeteredQueues:
+    """`PacketQueues` wrapper that reports to a `SchedulerMetrics`.
+
+    Arrival times are kept in one FIFO per `flow_key` of the wrapped queues, which
+    releases each flow in arrival order, so a packet's sojourn time is found without
+    touching the packet itself. Times come from `clock_ns` (`time.monotonic_ns` by default).
+    """
+    def __init__(self, pkt_queues: PacketQueues, metrics: SchedulerMetrics, clock_ns: Callable[[], int] = time.monotonic_ns) -> None:
+        self.pkt_queues = pkt_queues
+        self.metrics = metrics
+        self.clock_ns = clock_ns
+        self.flow_key = pkt_queues.flow_key
+        self._arrivals: dict[Hashable, deque[int]] = {}
+        self._size = len(pkt_queues)
+        if hasattr(pkt_queues, 'on_drop'):
+            pkt_queues.on_drop = self._dropped_queued
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, pkt: Packet) -> bool:
+        if not self.pkt_queues.push(pkt):
+            self.metrics.record_drop(pkt.priority)
+            return False
+        now = self.clock_ns()
+        key = self.flow_key(pkt)
+        arrivals = self._arrivals.get(key)
+        if arrivals is None:
+            arrivals = self._arrivals[key] = deque()
+        arrivals.append(now)
+        self._size += 1
+        self.metrics.record_enqueue(pkt.priority, self._size, now / 1e9)
+        return True
+
+    def pop(self) -> Packet:
+        pkt = self.pkt_queues.pop()
+        self._size -= 1
+        key = self.flow_key(pkt)
+        arrivals = self._arrivals[key]
+        sojourn_ns = self.clock_ns() - arrivals.popleft()
+        if not arrivals:
+            del self._arrivals[key]
+        self.metrics.record_dequeue(pkt.priority, sojourn_ns / 1e9)
+        return pkt
+
+    def _dropped_queued(self, pkt: Packet) -> None:
+        self._size -= 1
+        key = self.flow_key(pkt)
+        arrivals = self._arrivals[key]
+        arrivals.popleft()
+        if not arrivals:
+            del self._arrivals[key]
+        self.metrics.record_drop(pkt.priority)
+
+class Batching(NamedTuple):
+    size: int = 64 # hand over at most this many packets at once
+    max_wait_us: float = 0 # wait up to this long for a batch to fill; 0 => take whatever is queued
+
+PacketCallback = Callable[[Packet], Awaitable[None]] | Callable[[list[Packet]], Awaitable[None]]
+
+AqmFactory = Callable[[PacketQueues], PacketQueues]
+
+async def serve_queues(packets: AsyncIterator[Packet | None], pkt_reader_callback: PacketCallback, pkt_queues: PacketQueues,
+                       batch: Batching | None = None, metrics: SchedulerMetrics | None = None, aqm: AqmFactory | None = None):
+    """Feeds `packets` into `pkt_queues` and hands whatever `pkt_queues.pop` picks to the callback, until the stream ends and the queues are drained.
+
+    With `batch` the callback gets lists of up to `batch.size` packets, in the order `pop`
+    returns them, instead of one packet per await. `aqm` wraps the queues in an active
+    queue management policy, e.g. `partial(aqm.CoDelQueues, target=0.005)`. With `metrics`
+    the queues are wrapped in `MeteredQueues`, timed by `time.monotonic_ns` (not the event loop's clock).
+    """
+    if batch is not None and (batch.size < 1 or batch.max_wait_us < 0):
+        raise ValueError(f"invalid batching: {batch}.")
+    loop = asyncio.get_running_loop()
+    if aqm is not None:
+        pkt_queues = aqm(pkt_queues)
+    if metrics is not None:
+        pkt_queues = MeteredQueues(pkt_queues, metrics)
+    report_overflow = aqm is None and metrics is None
+    pkt_ready = asyncio.Event()
+    wanted = 1 # wake the dequeue task once this many packets are queued
+    stream_ended = False
     async def enque_task_fn():
+        nonlocal stream_ended
         async for pkt in packets:
-            if pkt is None: 
-                return await pkt_queue.put(None)
-            try:
-                pkt_queue.put_nowait(pkt)
-            except asyncio.QueueFull:
+            if pkt is None:
+                break
+            if not pkt_queues.push(pkt) and report_overflow:
                 print("WARNING!: queue overflow.")
-        return await pkt_queue.put(None)
-    async def deque_task_fn():
-        while (pkt := await pkt_queue.get()) is not None:
-            await pkt_reader_callback(pkt)
-        
-    await asyncio.gather(
-        enque_task_fn(),
-        deque_task_fn()
-    )
+            if len(pkt_queues) >= wanted:
+                pkt_ready.set()
+        stream_ended = True
+        pkt_ready.set()
 
-async def priority_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: Callable[[Packet], Awaitable[None]], maxsize: int = 1024):
-    """This function simulates a Priority Scheduler."""
-    pkt_heap: list[Packet] = []
-    pkt_wait: asyncio.Queue[Literal[True] | None] = asyncio.Queue(maxsize=maxsize)
-    async def enque_task_fn():
-        async for pkt in packets:
-            if pkt is None: 
-                return await pkt_wait.put(None)
-            try:
-                pkt_wait.put_nowait(True)
-                heapq.heappush(pkt_heap, pkt) # Insert packet into the heap with priority
-            except asyncio.QueueFull:
-                print("WARNING!: heap overflow.")
-        return await pkt_wait.put(None)
-                
     async def deque_task_fn():
         while True:
-            if await pkt_wait.get() is None: break
-            pkt = heapq.heappop(pkt_heap)
-            await pkt_reader_callback(pkt)
+            if not pkt_queues:
+                if stream_ended:
+                    break
+                pkt_ready.clear()
+                await pkt_ready.wait()
+                continue
+            await pkt_reader_callback(pkt_queues.pop())
+
+    async def deque_batch_task_fn():
+        nonlocal wanted
+        size, max_wait = batch.size, batch.max_wait_us / 1e6
+        while True:
+            if not pkt_queues:
+                if stream_ended:
+                    break
+                pkt_ready.clear()
+                await pkt_ready.wait()
+                continue
+            if len(pkt_queues) < size and max_wait and not stream_ended:
+                wanted = size
+                pkt_ready.clear()
+                timer = loop.call_later(max_wait, pkt_ready.set)
+                await pkt_ready.wait()
+                timer.cancel()
+                wanted = 1
+            pkt_batch: list[Packet] = []
+            while pkt_queues and len(pkt_batch) < size: # an AQM policy may drop more than it returns
+                pkt_batch.append(pkt_queues.pop())
+            await pkt_reader_callback(pkt_batch)
 
     await asyncio.gather(
         enque_task_fn(),
-        deque_task_fn()
+        deque_task_fn() if batch is None else deque_batch_task_fn()
     )
 
+class FifoQueue:
+    """Single FIFO packet buffer; drop policy is tail drop once `maxsize` packets are buffered."""
+    flow_key = staticmethod(single_flow)
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize < 1:
+            raise ValueError(f"queue size must be positive: {maxsize}.")
+        self.maxsize = maxsize
+        self._queue: deque[Packet] = deque()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def push(self, pkt: Packet) -> bool:
+        if len(self._queue) >= self.maxsize:
+            return False
+        self._queue.append(pkt)
+        return True
+
+    def pop(self) -> Packet:
+        return self._queue.popleft()
+
+async def fifo_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: PacketCallback, maxsize: int = 1024,
+                         batch: Batching | None = None, metrics: SchedulerMetrics | None = None, aqm: AqmFactory | None = None):
+    """This function simulates a First-Come, First-Served (FCFS/FIFO) scheduler."""
+    await serve_queues(packets, pkt_reader_callback, FifoQueue(maxsize), batch, metrics, aqm)
+
+class PriorityQueues:
+    """Strict-priority packet buffer: one FIFO deque per `Priority` class and a bitmap of the non-empty classes.
+
+    `push` and `pop` are O(1): the highest non-empty class is the lowest set bit of the
+    bitmap, and packets of one class leave in arrival order.
+    Drop policy is tail drop: an arriving packet is refused (`push` returns False) when its
+    class already holds `class_limits[priority]` packets or the whole buffer holds `maxsize`
+    packets. Queued packets are never pushed out, so a class can only lose its own arrivals.
+    """
+    flow_key = staticmethod(by_class)
+
+    def __init__(self, maxsize: int = 1024, class_limits: Mapping[Priority, int] | None = None) -> None:
+        if maxsize < 1:
+            raise ValueError(f"queue size must be positive: {maxsize}.")
+        class_limits = class_limits or {}
+        self.maxsize = maxsize
+        self.class_limits = [class_limits.get(priority, maxsize) for priority in Priority]
+        self._queues: list[deque[Packet]] = [deque() for _ in Priority]
+        self._nonempty = 0 # bit p set <=> self._queues[p] is not empty
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def class_len(self, priority: Priority) -> int:
+        return len(self._queues[priority])
+
+    def push(self, pkt: Packet) -> bool:
+        priority = pkt.priority
+        queue = self._queues[priority]
+        if self._size >= self.maxsize or len(queue) >= self.class_limits[priority]:
+            return False
+        queue.append(pkt)
+        self._nonempty |= 1 << priority
+        self._size += 1
+        return True
+
+    def pop(self) -> Packet:
+        nonempty = self._nonempty
+        if not nonempty:
+            raise IndexError("pop from empty priority queues.")
+        priority = (nonempty & -nonempty).bit_length() - 1
+        queue = self._queues[priority]
+        pkt = queue.popleft()
+        if not queue:
+            self._nonempty = nonempty & ~(1 << priority)
+        self._size -= 1
+        return pkt
+
+async def priority_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: PacketCallback, maxsize: int = 1024,
+                             class_limits: Mapping[Priority, int] | None = None, batch: Batching | None = None,
+                             metrics: SchedulerMetrics | None = None, aqm: AqmFactory | None = None):
+    """This function simulates a strict Priority Scheduler (drop policy: see `PriorityQueues`)."""
+    await serve_queues(packets, pkt_reader_callback, PriorityQueues(maxsize, class_limits), batch, metrics, aqm)
+
+
+class DeficitRoundRobinQueues:
+    """Deficit Round Robin: one FIFO per flow, served in turn, each turn sending up to `quantum` bytes.
+
+    Flows are whatever `flow_key` returns (`by_class` or `by_flow`); a flow's quantum is
+    `quanta[key]`, or `default_quantum`. Over a backlogged interval every flow gets a share of
+    the bytes proportional to its quantum, and no flow is starved. `pop` is O(1) amortized
+    as long as quanta are at least the largest packet size. Only flows with queued packets
+    are kept. Drop policy is tail drop once `maxsize` packets are buffered.
+    """
+    def __init__(self, maxsize: int = 1024, quanta: Mapping[Hashable, int] | None = None,
+                 flow_key: Callable[[Packet], Hashable] = by_class, default_quantum: int = 1500) -> None:
+        if maxsize < 1:
+            raise ValueError(f"queue size must be positive: {maxsize}.")
+        quanta = dict(quanta or {})
+        if min([default_quantum, *quanta.values()]) < 1:
+            raise ValueError(f"quanta must be positive: {quanta or default_quantum}.")
+        self.maxsize = maxsize
+        self.quanta = quanta
+        self.flow_key = flow_key
+        self.default_quantum = default_quantum
+        self._queues: dict[Hashable, deque[Packet]] = {}
+        self._deficits: dict[Hashable, int] = {}
+        self._active: deque[Hashable] = deque() # round robin order, head is being served
+        self._head_credited = False # the head flow already got its quantum for this turn
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, pkt: Packet) -> bool:
+        if self._size >= self.maxsize:
+            return False
+        key = self.flow_key(pkt)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._deficits[key] = 0
+            self._active.append(key)
+        queue.append(pkt)
+        self._size += 1
+        return True
+
+    def pop(self) -> Packet:
+        if not self._size:
+            raise IndexError("pop from empty deficit round robin queues.")
+        active, deficits = self._active, self._deficits
+        while True:
+            key = active[0]
+            if not self._head_credited:
+                deficits[key] += self.quanta.get(key, self.default_quantum)
+                self._head_credited = True
+            queue = self._queues[key]
+            size = packet_size(queue[0])
+            if size <= deficits[key]:
+                break
+            active.rotate(-1) # turn over, the remaining deficit carries to the next round
+            self._head_credited = False
+        deficits[key] -= size
+        pkt = queue.popleft()
+        if not queue: # an idle flow keeps no credit
+            active.popleft()
+            del self._queues[key], deficits[key]
+            self._head_credited = False
+        self._size -= 1
+        return pkt
+
+async def drr_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: PacketCallback, maxsize: int = 1024,
+                        quanta: Mapping[Hashable, int] | None = None, flow_key: Callable[[Packet], Hashable] = by_class,
+                        batch: Batching | None = None, metrics: SchedulerMetrics | None = None, aqm: AqmFactory | None = None):
+    """This function simulates a Deficit Round Robin scheduler (see `DeficitRoundRobinQueues`)."""
+    await serve_queues(packets, pkt_reader_callback, DeficitRoundRobinQueues(maxsize, quanta, flow_key), batch, metrics, aqm)
+
+
+class FairQueues:
+    """Weighted fair queueing with self-clocked virtual time (SCFQ).
+
+    Each packet gets the finish tag `max(V, last tag of its flow) + size / weight`, where
+    the virtual time V is the tag of the packet last sent, and the smallest tag goes
+    next. Unlike DRR this also interleaves flows within a round, so a light flow waits
+    for at most one packet of every other flow. Only flow heads are kept in the heap:
+    O(log active flows) per packet, constant for a fixed set of classes. Drop policy is
+    tail drop once `maxsize` packets are buffered.
+    """
+    def __init__(self, maxsize: int = 1024, weights: Mapping[Hashable, float] | None = None,
+                 flow_key: Callable[[Packet], Hashable] = by_class, default_weight: float = 1.0) -> None:
+        if maxsize < 1:
+            raise ValueError(f"queue size must be positive: {maxsize}.")
+        weights = dict(weights or {})
+        if min([default_weight, *weights.values()]) <= 0:
+            raise ValueError(f"weights must be positive: {weights or default_weight}.")
+        self.maxsize = maxsize
+        self.weights = weights
+        self.flow_key = flow_key
+        self.default_weight = default_weight
+        self.virtual_time = 0.0
+        self._queues: dict[Hashable, deque[tuple[float, Packet]]] = {}
+        self._last_finish: dict[Hashable, float] = {}
+        self._heads: list[tuple[float, int, Hashable]] = [] # (finish tag, arrival number, flow) of each flow head
+        self._arrivals = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, pkt: Packet) -> bool:
+        if self._size >= self.maxsize:
+            return False
+        key = self.flow_key(pkt)
+        finish = max(self.virtual_time, self._last_finish.get(key, 0.0)) + packet_size(pkt) / self.weights.get(key, self.default_weight)
+        self._last_finish[key] = finish
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            heapq.heappush(self._heads, (finish, self._arrivals, key))
+        queue.append((finish, pkt))
+        self._arrivals += 1
+        self._size += 1
+        return True
+
+    def pop(self) -> Packet:
+        if not self._size:
+            raise IndexError("pop from empty fair queues.")
+        finish, _, key = heapq.heappop(self._heads)
+        queue = self._queues[key]
+        _, pkt = queue.popleft()
+        self.virtual_time = finish
+        if queue:
+            heapq.heappush(self._heads, (queue[0][0], self._arrivals, key))
+            self._arrivals += 1
+        else:
+            del self._queues[key]
+            if self._last_finish[key] <= finish:
+                del self._last_finish[key] # idle flow, its next tag starts from V
+        self._size -= 1
+        return pkt
+
+async def wfq_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: PacketCallback, maxsize: int = 1024,
+                        weights: Mapping[Hashable, float] | None = None, flow_key: Callable[[Packet], Hashable] = by_class,
+                        batch: Batching | None = None, metrics: SchedulerMetrics | None = None, aqm: AqmFactory | None = None):
+    """This function simulates a Weighted Fair Queueing scheduler (see `FairQueues`)."""
+    await serve_queues(packets, pkt_reader_callback, FairQueues(maxsize, weights, flow_key), batch, metrics, aqm)
+
 
 async def scheduler_fill_first(packets: list[Packet], 
                                scheduler: Callable[[AsyncIterator[Packet | None], Callable[[Packet], Awaitable[None]]], Awaitable[None]]) -> list[Packet]:
@@ -99,6 +559,7 @@ if __name__ == "__main__":
     # asyncio.run(main())
     # quit()
 
+    import random
     import unittest
 
     class TestScheduler(unittest.TestCase):
@@ -134,4 +595,153 @@ if __name__ == "__main__":
             ]
             self.assertEqual(results, expected_order)
 
+        def test_priority_scheduler_fifo_within_class(self):
+            packets = [
+                Packet(source_ip=f"10.0.0.{i}", dest_ip=f"10.0.1.{9 - i}", payload=f"{priority.name} {i}", priority=priority)
+                for i, priority in enumerate([Priority.LOW, Priority.HIGH, Priority.LOW, Priority.MEDIUM, Priority.HIGH, Priority.LOW])
+            ]
+            results = [
+                result.payload
+                for result in asyncio.run(scheduler_fill_first(packets, priority_scheduler))
+            ]
+            self.assertEqual(results, ["HIGH 1", "HIGH 4", "MEDIUM 3", "LOW 0", "LOW 2", "LOW 5"])
+
+        def test_priority_scheduler_limits(self):
+            packets = [
+                Packet(source_ip="10.0.0.1", dest_ip="10.0.0.2", payload=f"{priority.name} {i}", priority=priority)
+                for i, priority in enumerate([Priority.LOW] * 3 + [Priority.HIGH] * 3 + [Priority.MEDIUM])
+            ]
+            scheduler = lambda packets, callback: priority_scheduler(packets, callback, maxsize=4, class_limits={Priority.LOW: 2})
+            results = [
+                result.payload
+                for result in asyncio.run(scheduler_fill_first(packets, scheduler))
+            ]
+            self.assertEqual(results, ["HIGH 3", "HIGH 4", "LOW 0", "LOW 1"]) # LOW 2 over its class limit, the rest over maxsize
+
+        def test_priority_queues(self):
+            pkt_queues = PriorityQueues(maxsize=8)
+            with self.assertRaises(IndexError):
+                pkt_queues.pop()
+            for pkt in self.packets:
+                self.assertTrue(pkt_queues.push(pkt))
+            self.assertEqual((len(pkt_queues), pkt_queues.class_len(Priority.HIGH)), (5, 2))
+            self.assertEqual([pkt_queues.pop().payload for _ in range(5)], [pkt.payload for pkt in sorted(self.packets, key=lambda pkt: pkt.priority)])
+            self.assertEqual(len(pkt_queues), 0)
+            with self.assertRaises(ValueError):
+                PriorityQueues(maxsize=0)
+
+        def backlog(self, count: int = 6000) -> list[Packet]:
+            rng = random.Random(0)
+            return [
+                Packet(source_ip=f"10.0.{priority}.1", dest_ip="10.1.0.1", payload="x" * rng.randint(64, 1500), priority=priority)
+                for _ in range(count // len(Priority)) for priority in Priority
+            ]
+
+        def assert_shares(self, pkt_queues: PacketQueues, packets: list[Packet], weights: Mapping[Hashable, float], sent_bytes: int):
+            for pkt in packets:
+                self.assertTrue(pkt_queues.push(pkt))
+            sent: dict[Hashable, int] = {key: 0 for key in weights}
+            while sum(sent.values()) < sent_bytes:
+                pkt = pkt_queues.pop()
+                sent[by_class(pkt)] += packet_size(pkt)
+            total = sum(sent.values())
+            for key, weight in weights.items():
+                self.assertAlmostEqual(sent[key] / total, weight / sum(weights.values()), delta=0.01)
+
+        def test_drr_shares(self):
+            quanta = {Priority.HIGH: 4500, Priority.MEDIUM: 3000, Priority.LOW: 1500}
+            self.assert_shares(DeficitRoundRobinQueues(maxsize=6000, quanta=quanta), self.backlog(), quanta, 1_000_000)
+
+        def test_wfq_shares(self):
+            weights = {Priority.HIGH: 0.5, Priority.MEDIUM: 0.3, Priority.LOW: 0.2}
+            self.assert_shares(FairQueues(maxsize=6000, weights=weights), self.backlog(), weights, 1_000_000)
+
+        def test_fair_schedulers_drain_in_flow_order(self):
+            packets = self.backlog(300)
+            for scheduler in (drr_scheduler, wfq_scheduler):
+                fair = lambda packets, callback: scheduler(packets, callback, flow_key=by_flow)
+                results = asyncio.run(scheduler_fill_first(packets, fair))
+                self.assertEqual(sorted(results, key=packet_size), sorted(packets, key=packet_size))
+                for priority in Priority: # FIFO within a flow
+                    self.assertEqual([pkt for pkt in results if pkt.priority == priority], [pkt for pkt in packets if pkt.priority == priority])
+                self.assertEqual({by_class(pkt) for pkt in results[:10]}, set(Priority)) # flows interleave from the start
+
+        def test_batching_keeps_order(self):
+            packets = self.backlog(300)
+            async def packet_stream():
+                for i, pkt in enumerate(packets):
+                    if i % 50 == 0:
+                        await asyncio.sleep(0) # let the dequeue side run
+                    yield pkt
+            for scheduler in (fifo_scheduler, priority_scheduler):
+                batches: list[list[Packet]] = []
+                async def batch_callback(batch: list[Packet]):
+                    batches.append(batch)
+                asyncio.run(scheduler(packet_stream(), batch_callback, batch=Batching(size=16)))
+                self.assertLessEqual(max(map(len, batches)), 16)
+                results = [pkt for batch in batches for pkt in batch]
+                if scheduler is fifo_scheduler:
+                    self.assertEqual(results, packets)
+                    continue
+                for batch in batches:
+                    self.assertEqual(batch, sorted(batch, key=by_class))
+                for priority in Priority:
+                    self.assertEqual([pkt for pkt in results if pkt.priority == priority], [pkt for pkt in packets if pkt.priority == priority])
+            with self.assertRaises(ValueError):
+                asyncio.run(fifo_scheduler(packet_stream(), batch_callback, batch=Batching(size=0)))
+
+        def test_batching_waits_for_a_full_batch(self):
+            batches: list[list[Packet]] = []
+            async def batch_callback(batch: list[Packet]):
+                batches.append(batch)
+            async def packet_stream():
+                for pkt in self.packets * 4:
+                    await asyncio.sleep(0.001)
+                    yield pkt
+            asyncio.run(fifo_scheduler(packet_stream(), batch_callback, batch=Batching(size=8, max_wait_us=100_000)))
+            self.assertEqual([len(batch) for batch in batches], [8, 8, 4])
+            batches.clear()
+            asyncio.run(fifo_scheduler(packet_stream(), batch_callback, batch=Batching(size=8, max_wait_us=100)))
+            self.assertEqual(sum(map(len, batches)), 20)
+            self.assertGreater(len(batches), 10) # short wait, batches stay small on a slow source
+
+        def test_metrics(self):
+            for scheduler in (fifo_scheduler, priority_scheduler, drr_scheduler, wfq_scheduler):
+                metrics = SchedulerMetrics(depth_sample_every=2)
+                fill_first = lambda packets, callback: scheduler(packets, callback, maxsize=4, metrics=metrics)
+                results = asyncio.run(scheduler_fill_first(self.packets, fill_first))
+                stats = metrics.snapshot()
+                self.assertEqual(len(results), 4)
+                self.assertEqual(stats.enqueued, {Priority.HIGH: 1, Priority.MEDIUM: 1, Priority.LOW: 2})
+                self.assertEqual(stats.dequeued, stats.enqueued)
+                self.assertEqual(stats.dropped, {Priority.HIGH: 1, Priority.MEDIUM: 0, Priority.LOW: 0})
+                self.assertEqual((stats.depth, stats.max_depth), (0, 4))
+                self.assertEqual([depth for _, depth in stats.depth_samples], [2, 4])
+                self.assertEqual(sum(map(sum, stats.sojourn_histogram.values())), 4)
+
+        def test_sojourn_histogram(self):
+            metrics = SchedulerMetrics(histogram_buckets=8)
+            for sojourn in (0.0, 0.5e-6, 3e-6, 3e-6, 100e-6, 1.0):
+                metrics.record_dequeue(Priority.LOW, sojourn)
+            metrics.record_dequeue(Priority.HIGH, 0.0)
+            stats = metrics.snapshot()
+            self.assertEqual(stats.sojourn_histogram[Priority.LOW], [2, 0, 2, 0, 0, 0, 0, 2]) # 100us and 1s land in the last bucket
+            self.assertEqual(stats.sojourn_percentile(0.5, Priority.LOW), 4e-6)
+            self.assertEqual(stats.sojourn_percentile(0.1), 1e-6)
+            self.assertIsNone(SchedulerMetrics().snapshot().sojourn_percentile(0.5))
+
+        def test_drr_small_quantum_and_limits(self):
+            pkt_queues = DeficitRoundRobinQueues(maxsize=2, default_quantum=100)
+            self.assertTrue(pkt_queues.push(self.packets[0]))
+            self.assertTrue(pkt_queues.push(self.packets[2]))
+            self.assertFalse(pkt_queues.push(self.packets[3]))
+            self.assertEqual([pkt_queues.pop().payload, pkt_queues.pop().payload], ["Data Packet 1", "VOIP Packet 1"])
+            self.assertEqual((len(pkt_queues), pkt_queues._queues, pkt_queues._deficits), (0, {}, {}))
+            with self.assertRaises(IndexError):
+                pkt_queues.pop()
+            with self.assertRaises(ValueError):
+                DeficitRoundRobinQueues(quanta={Priority.LOW: 0})
+            with self.assertRaises(ValueError):
+                FairQueues(weights={Priority.LOW: 0})
+
     unittest.main()
@@ -0,0 +1,130 @@
+from typing import Callable, Awaitable, Any
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+from collections import deque
+from scheduler import (
+    Packet, CompactPacket, AnyPacket, Priority, Batching, SchedulerMetrics,
+    serve_queues, fifo_scheduler, priority_scheduler, drr_scheduler, wfq_scheduler
+)
+from packet_ring import PacketRing
+
+# NOTE:
+# Packets/sec through each scheduler with and without batched dequeue:
+#   python scheduler_benchmark.py --packets 500000 --batch-sizes 16 64 256
+# The source hands the scheduler `--arrival-burst` packets per event loop turn, like a
+# socket read returning several datagrams. With --consumer-yields every callback call
+# also gives up one event loop turn, like a consumer that awaits a write.
+# --compact feeds `CompactPacket`s instead of `Packet`s ('ring' is a FIFO on a `PacketRing`, which
+# hands consumers `CompactPacket`s, so it only runs with --compact),
+# --memory prints the bytes each buffered packet costs in a deque or a `PacketRing`.
+
+SCHEDULERS: dict[str, Callable[..., Awaitable[None]]] = {
+    'fifo': fifo_scheduler,
+    'priority': priority_scheduler,
+    'drr': drr_scheduler,
+    'wfq': wfq_scheduler,
+    'ring': lambda packets, callback, maxsize, batch=None, metrics=None: serve_queues(packets, callback, PacketRing(maxsize), batch, metrics),
+}
+
+def synthetic_packets(count: int, seed: int = 0, compact: bool = False) -> list[AnyPacket]:
+    rng = random.Random(seed)
+    payloads = ["x" * size for size in (64, 576, 1500)]
+    packets = [
+        Packet(priority=rng.choice(list(Priority)), source_ip=f"10.0.{i % 256}.1", dest_ip="10.1.0.1", payload=rng.choice(payloads))
+        for i in range(count)
+    ]
+    return [CompactPacket.from_packet(pkt) for pkt in packets] if compact else packets
+
+def buffered_bytes_per_packet(count: int, payload_size: int = 64) -> dict[str, float]:
+    """Bytes allocated per packet to hold `count` distinct packets, by representation and buffer."""
+    def measure_allocation(build: Callable[[], Any]) -> float:
+        tracemalloc.start()
+        kept = build()
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return allocated / count
+    # every packet owns its strings and payload, as packets read off a socket would
+    packet = lambda i: Packet(
+        priority=Priority(i % 3), source_ip=f"10.0.{i >> 8 & 255}.{i & 255}", dest_ip=f"10.1.{i >> 8 & 255}.{i & 255}",
+        payload=f"{i:0{payload_size}}"
+    )
+    compact = lambda i: CompactPacket(i % 3, 0x0A000000 | i & 0xFFFF, 0x0A010000 | i & 0xFFFF, b"%0*d" % (payload_size, i))
+    def ring() -> PacketRing:
+        ring = PacketRing(maxsize=count, payload_capacity=count * payload_size)
+        for i in range(count):
+            ring.push(compact(i)) # the pushed object is garbage right away
+        return ring
+    return {
+        'deque[Packet]': measure_allocation(lambda: deque(packet(i) for i in range(count))),
+        'deque[CompactPacket]': measure_allocation(lambda: deque(compact(i) for i in range(count))),
+        'PacketRing': measure_allocation(ring),
+    }
+
+async def measure(scheduler: Callable[..., Awaitable[None]], packets: list[AnyPacket], batch: Batching | None, arrival_burst: int,
+                  consumer_yields: bool, metrics: SchedulerMetrics | None = None) -> float:
+    received = 0
+    async def pkt_reader_callback(pkt: AnyPacket):
+        nonlocal received
+        received += 1
+        if consumer_yields:
+            await asyncio.sleep(0)
+    async def batch_callback(batch: list[AnyPacket]):
+        nonlocal received
+        received += len(batch)
+        if consumer_yields:
+            await asyncio.sleep(0)
+    async def packet_stream():
+        for i in range(0, len(packets), arrival_burst):
+            for pkt in packets[i:i + arrival_burst]:
+                yield pkt
+            await asyncio.sleep(0)
+    start = time.perf_counter()
+    await scheduler(packet_stream(), pkt_reader_callback if batch is None else batch_callback, maxsize=len(packets), batch=batch, metrics=metrics)
+    elapsed = time.perf_counter() - start
+    assert received == len(packets)
+    return len(packets) / elapsed
+
+def run(packets_count: int, scheduler_names: list[str], batch_sizes: list[int], arrival_burst: int,
+        consumer_yields: bool, metrics: bool, compact: bool = False) -> list[dict[str, Any]]:
+    packets = synthetic_packets(packets_count, compact=compact)
+    results: list[dict[str, Any]] = []
+    for name in scheduler_names:
+        for batch_size in [None, *batch_sizes]:
+            batch = Batching(size=batch_size) if batch_size else None
+            scheduler_metrics = SchedulerMetrics() if metrics else None
+            pps = asyncio.run(measure(SCHEDULERS[name], packets, batch, arrival_burst, consumer_yields, scheduler_metrics))
+            results.append({'scheduler': name, 'batch_size': batch_size, 'packets_per_sec': pps})
+            line = f"{name:<10} {'per packet' if batch is None else f'batch {batch_size}':<12} {pps:>12,.0f} packets/s"
+            if scheduler_metrics is not None:
+                stats = scheduler_metrics.snapshot()
+                line += f"  max depth {stats.max_depth:>7}  p99 sojourn <= {stats.sojourn_percentile(0.99) * 1e3:.3f}ms"
+            print(line, flush=True)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the packet schedulers.")
+    parser.add_argument('--packets', type=int, default=200_000)
+    parser.add_argument('--schedulers', nargs='+', choices=list(SCHEDULERS), default=None, help="default: all ('ring' only with --compact)")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--arrival-burst', type=int, default=32, help="packets the source yields per event loop turn")
+    parser.add_argument('--consumer-yields', action='store_true', help="the callback awaits one event loop turn per call")
+    parser.add_argument('--metrics', action='store_true', help="run every scheduler with SchedulerMetrics")
+    parser.add_argument('--compact', action='store_true', help="schedule CompactPackets instead of Packets")
+    parser.add_argument('--memory', action='store_true', help="only print the memory each buffered packet costs")
+    args = parser.parse_args()
+    if args.memory:
+        for payload_size in (64, 1500):
+            for name, size in buffered_bytes_per_packet(args.packets, payload_size).items():
+                print(f"{payload_size:>5}B payload  {name:<22} {size:>8,.0f} bytes/packet", flush=True)
+        return
+    schedulers = args.schedulers or [name for name in SCHEDULERS if args.compact or name != 'ring']
+    if 'ring' in schedulers and not args.compact:
+        parser.error("the 'ring' scheduler returns CompactPackets, run it with --compact.")
+    run(args.packets, schedulers, args.batch_sizes, args.arrival_burst, args.consumer_yields, args.metrics, args.compact)
+
+if __name__ == "__main__":
+    main()
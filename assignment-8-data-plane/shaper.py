@@ -0,0 +1,303 @@
+from typing import AsyncIterator, Callable, Awaitable, Hashable
+from enum import IntEnum
+from collections import deque
+import heapq
+import asyncio
+from scheduler import Packet, CompactPacket, AnyPacket, Priority, packet_size
+
+# NOTE:
+# Shaping and policing stages sit between a scheduler and its `pkt_reader_callback`:
+#   await fifo_scheduler(packets, TokenBucketShaper(send, rate=125_000, burst=3_000))
+# Token buckets are refilled lazily from the event loop clock when a packet touches
+# them, so idle flows cost nothing and there is no timer per packet or per flow.
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        self.rate = rate # bytes per second
+        self.burst = burst # bytes
+        self.tokens = float(burst)
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def conforms(self, size: int, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= min(size, self.burst) # packets larger than the burst pass on a full bucket
+
+    def take(self, size: int, now: float) -> bool:
+        if not self.conforms(size, now):
+            return False
+        self.tokens -= size
+        return True
+
+    def delay(self, size: int) -> float:
+        """Seconds until `size` bytes conform, as of the last refill."""
+        return max(0.0, (min(size, self.burst) - self.tokens) / self.rate)
+
+def _check_rate(rate: float, burst: int) -> None:
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"token bucket rate and burst must be positive: {rate} B/s, {burst} B.")
+
+
+class TokenBucketShaper:
+    """Delays packets so each flow leaves at no more than `rate` bytes/s, with bursts of up to `burst` bytes.
+
+    Flows are `flow_key(pkt)`; without a key the whole output is one flow. A conforming
+    packet of a flow with nothing held back is passed straight through. Other packets
+    are held back per flow and released, in flow order, by one task that sleeps until
+    the earliest flow conforms. Once `maxsize` packets are held back the stage
+    stops returning, which pushes back into the wrapped scheduler: the default of 1 keeps
+    the scheduler in charge of the order; raise it when shaping many independent flows
+    so a slow flow does not hold up the others. The callback may then run concurrently
+    for different flows. Call `drain` after the scheduler returns.
+    """
+    def __init__(self, pkt_reader_callback: Callable[[Packet], Awaitable[None]], rate: float, burst: int,
+                 flow_key: Callable[[Packet], Hashable] | None = None, maxsize: int = 1) -> None:
+        _check_rate(rate, burst)
+        if maxsize < 1:
+            raise ValueError(f"queue size must be positive: {maxsize}.")
+        self.pkt_reader_callback = pkt_reader_callback
+        self.rate = rate
+        self.burst = burst
+        self.flow_key = flow_key
+        self.maxsize = maxsize
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        self._backlogs: dict[Hashable, deque[Packet]] = {}
+        self._eligible: list[tuple[float, int, Hashable]] = [] # (loop time the head conforms, tie breaker, flow)
+        self._scheduled = 0
+        self._size = 0
+        self._space = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._release_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def __call__(self, pkt: Packet) -> None:
+        loop = asyncio.get_running_loop()
+        key = self.flow_key(pkt) if self.flow_key is not None else None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, loop.time())
+        if key not in self._backlogs and bucket.take(packet_size(pkt), loop.time()):
+            return await self.pkt_reader_callback(pkt)
+        while self._size >= self.maxsize:
+            self._space.clear()
+            await self._space.wait()
+        backlog = self._backlogs.get(key)
+        if backlog is None:
+            backlog = self._backlogs[key] = deque()
+            bucket.refill(loop.time())
+            self._schedule(loop.time() + bucket.delay(packet_size(pkt)), key)
+        backlog.append(pkt)
+        self._size += 1
+        if self._release_task is None:
+            self._release_task = asyncio.create_task(self._release())
+
+    async def drain(self) -> None:
+        """Waits until every held back packet has been passed on."""
+        while self._release_task is not None:
+            await asyncio.shield(self._release_task)
+
+    def _schedule(self, at: float, key: Hashable) -> None:
+        if not self._eligible or at < self._eligible[0][0]:
+            self._wakeup.set() # the release task is sleeping for a later flow
+        heapq.heappush(self._eligible, (at, self._scheduled, key))
+        self._scheduled += 1
+
+    async def _release(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._eligible:
+                at, _, key = self._eligible[0]
+                if at > loop.time():
+                    self._wakeup.clear()
+                    timer = loop.call_at(at, self._wakeup.set)
+                    await self._wakeup.wait()
+                    timer.cancel()
+                    continue
+                heapq.heappop(self._eligible)
+                backlog, bucket = self._backlogs[key], self._buckets[key]
+                pkt = backlog[0]
+                if not bucket.take(packet_size(pkt), loop.time()): # woke up a little early
+                    self._schedule(loop.time() + bucket.delay(packet_size(pkt)), key)
+                    continue
+                backlog.popleft()
+                if backlog:
+                    self._schedule(loop.time() + bucket.delay(packet_size(backlog[0])), key)
+                else:
+                    del self._backlogs[key]
+                self._size -= 1
+                self._space.set()
+                await self.pkt_reader_callback(pkt)
+        finally:
+            self._release_task = None
+
+def shaped(scheduler: Callable[..., Awaitable[None]], rate: float, burst: int,
+           flow_key: Callable[[Packet], Hashable] | None = None, shaper_maxsize: int = 1):
+    """Wraps a scheduler so that its output is shaped by a `TokenBucketShaper`."""
+    async def shaped_scheduler(packets: AsyncIterator[Packet | None], pkt_reader_callback: Callable[[Packet], Awaitable[None]], maxsize: int = 1024):
+        shaper = TokenBucketShaper(pkt_reader_callback, rate, burst, flow_key, shaper_maxsize)
+        await scheduler(packets, shaper, maxsize)
+        await shaper.drain()
+    return shaped_scheduler
+
+
+class Color(IntEnum):
+    GREEN = 0
+    YELLOW = 1
+    RED = 2
+
+class TwoRateMarker:
+    """Two rate three color marker (RFC 2698, color-blind mode).
+
+    A packet is RED when it exceeds the peak bucket (`pir`/`pbs`), YELLOW when it only
+    exceeds the committed bucket (`cir`/`cbs`), GREEN otherwise. Rates are bytes/s and
+    bursts bytes; buckets are kept per `flow_key` flow and refilled from `now`.
+    """
+    def __init__(self, cir: float, cbs: int, pir: float, pbs: int, flow_key: Callable[[Packet], Hashable] | None = None) -> None:
+        _check_rate(cir, cbs)
+        _check_rate(pir, pbs)
+        if pir < cir:
+            raise ValueError(f"peak rate is below the committed rate: {pir} < {cir} B/s.")
+        self.cir, self.cbs, self.pir, self.pbs = cir, cbs, pir, pbs
+        self.flow_key = flow_key
+        self._buckets: dict[Hashable, tuple[TokenBucket, TokenBucket]] = {} # (committed, peak)
+
+    def mark(self, pkt: Packet, now: float) -> Color:
+        key = self.flow_key(pkt) if self.flow_key is not None else None
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            buckets = self._buckets[key] = (TokenBucket(self.cir, self.cbs, now), TokenBucket(self.pir, self.pbs, now))
+        committed, peak = buckets
+        size = packet_size(pkt)
+        if not peak.conforms(size, now):
+            return Color.RED
+        peak.tokens -= size
+        if not committed.take(size, now):
+            return Color.YELLOW
+        return Color.GREEN
+
+def _demoted(pkt: AnyPacket) -> AnyPacket:
+    if type(pkt) is CompactPacket:
+        return CompactPacket(Priority.LOW, pkt.source, pkt.dest, pkt.payload, pkt.ipv6)
+    return pkt._replace(priority=Priority.LOW)
+
+class TwoRatePolicer:
+    """Policing stage around a `TwoRateMarker`: GREEN packets pass unchanged, YELLOW packets
+    pass demoted to `Priority.LOW`, RED packets are dropped. Never delays a packet."""
+    def __init__(self, pkt_reader_callback: Callable[[AnyPacket], Awaitable[None]], cir: float, cbs: int, pir: float, pbs: int,
+                 flow_key: Callable[[AnyPacket], Hashable] | None = None) -> None:
+        self.pkt_reader_callback = pkt_reader_callback
+        self.marker = TwoRateMarker(cir, cbs, pir, pbs, flow_key)
+        self.colors = [0] * len(Color) # packets seen per color
+
+    async def __call__(self, pkt: AnyPacket) -> None:
+        color = self.marker.mark(pkt, asyncio.get_running_loop().time())
+        self.colors[color] += 1
+        if color == Color.GREEN:
+            await self.pkt_reader_callback(pkt)
+        elif color == Color.YELLOW:
+            await self.pkt_reader_callback(_demoted(pkt))
+
+if __name__ == "__main__":
+    import unittest
+    from scheduler import fifo_scheduler, priority_scheduler, by_flow
+
+    def make_packets(count: int, size: int, flows: int = 1) -> list[Packet]:
+        return [
+            Packet(source_ip=f"10.0.0.{i % flows}", dest_ip="10.1.0.1", payload="x" * size, priority=Priority(i % len(Priority)))
+            for i in range(count)
+        ]
+
+    async def run_timed(scheduler, packets: list[Packet]) -> list[tuple[float, Packet]]:
+        loop = asyncio.get_running_loop()
+        async def packet_stream():
+            for pkt in packets:
+                yield pkt
+        sent: list[tuple[float, Packet]] = []
+        async def pkt_reader_callback(pkt: Packet):
+            sent.append((loop.time(), pkt))
+        start = loop.time()
+        await scheduler(packet_stream(), pkt_reader_callback)
+        return [(at - start, pkt) for at, pkt in sent]
+
+    class TestShaper(unittest.TestCase):
+        def test_token_bucket(self):
+            bucket = TokenBucket(rate=1000, burst=500, now=0.0)
+            self.assertTrue(bucket.take(400, now=0.0))
+            self.assertFalse(bucket.take(400, now=0.0))
+            self.assertAlmostEqual(bucket.delay(400), 0.3)
+            self.assertTrue(bucket.take(400, now=0.3))
+            self.assertTrue(bucket.take(2000, now=10.0)) # larger than the burst, passes on a full bucket
+            self.assertEqual(bucket.tokens, -1500)
+            with self.assertRaises(ValueError):
+                TokenBucketShaper(lambda pkt: asyncio.sleep(0), rate=0, burst=1)
+
+        def test_shaper_rate(self):
+            rate, burst, size = 200_000, 2_000, 1_000
+            sent = asyncio.run(run_timed(shaped(fifo_scheduler, rate, burst), make_packets(40, size)))
+            self.assertEqual(len(sent), 40)
+            for at, _ in sent[2:]: # first burst goes out at once, then one packet per size / rate
+                self.assertLessEqual(size * sum(1 for t, _ in sent if t <= at), burst + rate * at + 1)
+            self.assertAlmostEqual(sent[-1][0], (40 * size - burst) / rate, delta=0.05)
+
+        def test_shaper_keeps_scheduler_order(self):
+            packets = make_packets(12, 1_000)
+            sent = asyncio.run(run_timed(shaped(priority_scheduler, 500_000, 1_000), packets))
+            self.assertEqual([pkt for _, pkt in sent], sorted(packets, key=lambda pkt: pkt.priority))
+
+        def test_shaper_flows_are_independent(self):
+            # flow 10.0.0.0 sends a long burst, 10.0.0.1 a single packet at the end
+            packets = make_packets(20, 1_000, flows=1) + [make_packets(2, 1_000, flows=2)[1]]
+            scheduler = shaped(fifo_scheduler, 100_000, 1_000, flow_key=by_flow, shaper_maxsize=64)
+            sent = asyncio.run(run_timed(scheduler, packets))
+            self.assertEqual(len(sent), 21)
+            late = next(at for at, pkt in sent if pkt.source_ip == "10.0.0.1")
+            self.assertLess(late, 0.05)
+            self.assertGreater(sent[-1][0], 0.15)
+
+        def test_two_rate_marker(self):
+            marker = TwoRateMarker(cir=1000, cbs=1000, pir=2000, pbs=2000)
+            pkt = make_packets(1, 500)[0]
+            colors = [marker.mark(pkt, now=0.0) for _ in range(5)]
+            self.assertEqual(colors, [Color.GREEN, Color.GREEN, Color.YELLOW, Color.YELLOW, Color.RED])
+            self.assertEqual(marker.mark(pkt, now=0.25), Color.YELLOW) # peak refilled 500, committed 250
+            self.assertEqual(marker.mark(pkt, now=0.5), Color.GREEN)
+            with self.assertRaises(ValueError):
+                TwoRateMarker(cir=2000, cbs=1000, pir=1000, pbs=1000)
+
+        def test_two_rate_policer(self):
+            received: list[Packet] = []
+            async def pkt_reader_callback(pkt: Packet):
+                received.append(pkt)
+            policer = TwoRatePolicer(pkt_reader_callback, cir=1, cbs=1000, pir=1, pbs=2000, flow_key=by_flow)
+            packets = make_packets(10, 500, flows=2)
+            async def run():
+                for pkt in packets:
+                    await policer(pkt)
+            asyncio.run(run())
+            self.assertEqual(policer.colors, [4, 4, 2])
+            self.assertEqual([pkt.priority for pkt in received], [pkt.priority for pkt in packets[:4]] + [Priority.LOW] * 4)
+
+        def test_two_rate_policer_compact_packets(self):
+            received: list[CompactPacket] = []
+            async def pkt_reader_callback(pkt: CompactPacket):
+                received.append(pkt)
+            policer = TwoRatePolicer(pkt_reader_callback, cir=1, cbs=1000, pir=1, pbs=2000, flow_key=by_flow)
+            packets = [CompactPacket.from_packet(pkt) for pkt in make_packets(10, 500, flows=2)]
+            async def run():
+                for pkt in packets:
+                    await policer(pkt)
+            asyncio.run(run())
+            self.assertEqual(policer.colors, [4, 4, 2])
+            self.assertEqual(received[:4], packets[:4])
+            for pkt, original in zip(received[4:], packets[4:8]):
+                self.assertIs(type(pkt), CompactPacket)
+                self.assertEqual((pkt.priority, pkt.flow, pkt.payload), (Priority.LOW, original.flow, original.payload))
+
+    unittest.main()